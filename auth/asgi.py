@@ -2,6 +2,7 @@
 ASGI config for auth project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Blacklisted clients are rejected by BlacklistASGIGate before Django is entered.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +14,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auth.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the apps are loaded, the gate reads the blacklist models.
+from users.gate import BlacklistASGIGate  # noqa: E402 pylint: disable=wrong-import-position
+
+application = BlacklistASGIGate(django_application)
@@ -0,0 +1,272 @@
+import fcntl
+import hmac
+import json
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_http_methods
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS = ('requests', 'latency', 'queries', 'db_seconds')
+# Totals of workers that have exited, folded together by collect().
+RETIRED_FILE = 'metrics-retired.json'
+_WORKER_FILE = re.compile(r'metrics-(\d+)(?:-[0-9a-f]+)?\.json')
+
+
+class MetricsRegistry:
+    """
+    Per-route request counters, latency histograms and DB usage of this worker.
+
+    With METRICS_DIR set, each worker writes its totals to its own file there
+    (at most every METRICS_FLUSH_INTERVAL seconds) and /metrics sums the files
+    of every worker, so all gunicorn workers are reported together. The
+    directory must be local to the host: a scrape folds the files of workers
+    that have exited into one retired file, checking their pids.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.instance = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.latency = {}
+            self.queries = {}
+            self.db_seconds = {}
+            self.flushed_at = time.monotonic()
+
+    def observe(self, route, method, status, seconds, queries, db_seconds):
+        key = f'{route}|{method}|{status}'
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            # Non-cumulative bucket counts, then sum and count.
+            histogram = self.latency.setdefault(route, [0] * (len(LATENCY_BUCKETS) + 3))
+            histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            self.queries[route] = self.queries.get(route, 0) + queries
+            self.db_seconds[route] = self.db_seconds.get(route, 0.0) + db_seconds
+
+        if self.directory() and time.monotonic() - self.flushed_at >= self.flush_interval():
+            self.flush()
+
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def flush_interval(self):
+        return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'latency': {route: list(values) for route, values in self.latency.items()},
+                'queries': dict(self.queries),
+                'db_seconds': dict(self.db_seconds),
+            }
+
+    def file_name(self):
+        """
+        metrics-<pid>-<random id>.json. The id is drawn again in a forked
+        worker, so a reused pid never overwrites a dead worker's totals.
+        """
+        pid = os.getpid()
+        if self.pid != pid:
+            self.pid, self.instance = pid, secrets.token_hex(4)
+        return f'metrics-{pid}-{self.instance}.json'
+
+    def flush(self):
+        """Atomically writes this worker's totals to its file in METRICS_DIR."""
+        directory = self.directory()
+        self.flushed_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        _write_totals(directory, self.file_name(), self.snapshot())
+
+    def collect(self):
+        """Totals of every worker (or only this one without METRICS_DIR)."""
+        directory = self.directory()
+        if not directory:
+            return self.snapshot()
+
+        self.flush()
+        retire_dead_workers(directory)
+        totals = _empty_totals()
+        for name in os.listdir(directory):
+            if name.startswith('metrics-') and name.endswith('.json'):
+                _add_totals(totals, _read_totals(os.path.join(directory, name)))
+        return totals
+
+
+def _empty_totals():
+    return {metric: {} for metric in METRICS}
+
+
+def _read_totals(path):
+    try:
+        with open(path, encoding='utf-8') as metrics_file:
+            return json.load(metrics_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_totals(directory, name, totals):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+    with os.fdopen(fd, 'w') as metrics_file:
+        json.dump(totals, metrics_file)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+def _add_totals(totals, worker):
+    for metric in ('requests', 'queries', 'db_seconds'):
+        for key, value in worker.get(metric, {}).items():
+            totals[metric][key] = totals[metric].get(key, 0) + value
+    for route, values in worker.get('latency', {}).items():
+        merged = totals['latency'].setdefault(route, [0] * len(values))
+        for i, value in enumerate(values):
+            merged[i] += value
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def retire_dead_workers(directory):
+    """
+    Adds the totals of workers that are no longer running to RETIRED_FILE and
+    removes their files, so the directory does not grow with every restart
+    and the summed counters never go down.
+    """
+    lock_fd = os.open(os.path.join(directory, '.metrics.lock'), os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        dead = []
+        for name in os.listdir(directory):
+            match = _WORKER_FILE.fullmatch(name)
+            if match and not _is_running(int(match.group(1))):
+                dead.append(os.path.join(directory, name))
+        if not dead:
+            return
+        retired = _read_totals(os.path.join(directory, RETIRED_FILE)) or _empty_totals()
+        for path in dead:
+            _add_totals(retired, _read_totals(path))
+        _write_totals(directory, RETIRED_FILE, retired)
+        for path in dead:
+            os.remove(path)
+    finally:
+        os.close(lock_fd)
+
+
+registry = MetricsRegistry()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(totals):
+    """Renders collected totals in the Prometheus text exposition format."""
+    lines = [
+        '# HELP http_requests_total Total HTTP requests by route, method and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for key, count in sorted(totals['requests'].items()):
+        route, method, status = key.split('|')
+        lines.append(f'http_requests_total{{route="{_label(route)}",method="{method}",status="{status}"}} {count}')
+
+    lines += [
+        '# HELP http_request_duration_seconds Request latency by route.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for route, values in sorted(totals['latency'].items()):
+        route = _label(route)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{route="{route}"}} {values[-2]}')
+        lines.append(f'http_request_duration_seconds_count{{route="{route}"}} {values[-1]}')
+
+    lines += [
+        '# HELP db_queries_total SQL queries executed by route.',
+        '# TYPE db_queries_total counter',
+    ]
+    for route, count in sorted(totals['queries'].items()):
+        lines.append(f'db_queries_total{{route="{_label(route)}"}} {count}')
+
+    lines += [
+        '# HELP db_query_duration_seconds_total Time spent in SQL queries by route.',
+        '# TYPE db_query_duration_seconds_total counter',
+    ]
+    for route, seconds in sorted(totals['db_seconds'].items()):
+        lines.append(f'db_query_duration_seconds_total{{route="{_label(route)}"}} {seconds}')
+    return '\n'.join(lines) + '\n'
+
+
+class _QueryTimer:
+    """Database execute wrapper counting the queries of one request and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Records count, latency, SQL query count and DB time per resolved route name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        registry.observe(route, request.method, response.status_code, seconds, timer.count, timer.seconds)
+        return response
+
+
+def is_allowed_scraper(request):
+    """Staff users, or a scraper sending `Authorization: Bearer <METRICS_TOKEN>`."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Prometheus scrape endpoint."""
+    if not is_allowed_scraper(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(registry.collect()), content_type=CONTENT_TYPE)
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auth.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'users.middleware.IPBlacklistMiddleware',
@@ -161,5 +162,55 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 BLACKLIST_REDIRECT_URL = 'https://www.birdwatching.com'
 
+# How often each worker checks the shared blacklist generation for new bans.
+BLACKLIST_REFRESH_INTERVAL_MS = 1000
+
+# Optional host-wide blacklist file mmapped by every worker instead of a per-process copy.
+BLACKLIST_SNAPSHOT_PATH = config('BLACKLIST_SNAPSHOT_PATH', default=None)
+
+# Reverse proxies (addresses or CIDR networks) whose X-Forwarded-For header is trusted.
+BLACKLIST_TRUSTED_PROXIES = []
+
+# Directory where every worker writes its request metrics, summed by /metrics.
+# Without it /metrics only reports the worker that answers the scrape.
+METRICS_DIR = config('METRICS_DIR', default=None)
+METRICS_FLUSH_INTERVAL = 5
+# Bearer token the Prometheus scraper sends to /metrics; otherwise only staff users may read it.
+METRICS_TOKEN = config('METRICS_TOKEN', default=None)
+
+# How often each worker checks whether its nearest-marker index is stale.
+MARKER_INDEX_REFRESH_INTERVAL_MS = 1000
+
+# Deleted markers stay as tombstones for /markers/changes/ this long before
+# purge_marker_tombstones removes them; older sync cursors expire.
+MARKER_TOMBSTONE_RETENTION_DAYS = 30
+# Changes younger than this are held back until concurrent writes have committed.
+MARKER_CHANGES_SETTLE_SECONDS = 2
+
+# Uploads of background restores wait here for run_backup_jobs. They hold the
+# whole map, so this must not be under MEDIA_ROOT.
+BACKUP_JOB_ROOT = config('BACKUP_JOB_ROOT', default=str(BASE_DIR / 'backup_jobs'))
+# A running restore whose worker has not reported progress for this long is resumed by another worker.
+BACKUP_JOB_STALE_SECONDS = 600
+
+# Marker image uploads are rejected while streaming once they exceed these.
+MAX_MARKER_IMAGE_SIZE = config('MAX_MARKER_IMAGE_SIZE', default=10 * 1024 * 1024, cast=int)
+MAX_MARKER_IMAGE_PIXELS = 40_000_000
+
+# Threads per worker rendering Marker.image variants (0 renders them inline
+# after the request's transaction commits), and their encoding.
+THUMBNAIL_WORKERS = config('THUMBNAIL_WORKERS', default=2, cast=int)
+THUMBNAIL_FORMAT = 'WEBP'
+
+# Marker clusters and map tiles are cached here. Their keys carry generation
+# counters from the database, so a per-process cache stays correct with
+# several workers; a shared one (e.g. RedisCache) renders each tile once.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
@@ -19,12 +19,14 @@ from django.urls import path , include
 from django.conf import settings
 from django.conf.urls.static import static
 from .health import health
+from .metrics import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('users.urls')),
     path('api-auth/', include('knox.urls')),
-    path('health/', health)
+    path('health/', health),
+    path('metrics/', metrics)
 ]
 
 if settings.DEBUG:
@@ -2,6 +2,7 @@
 WSGI config for auth project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+Blacklisted clients are rejected by BlacklistWSGIGate before Django is entered.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
@@ -13,4 +14,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auth.settings')
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+# Imported once the apps are loaded, the gate reads the blacklist models.
+from users.gate import BlacklistWSGIGate  # noqa: E402 pylint: disable=wrong-import-position
+
+application = BlacklistWSGIGate(django_application)
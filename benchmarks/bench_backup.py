@@ -0,0 +1,103 @@
+"""
+Marker backups in time and peak Python memory (tracemalloc): the export
+with serializers.serialize() into one string versus the streamed
+users.backups export, and the restore with deserialize() plus one save()
+per row versus users.backups.restore_markers. Then the size and time of
+the gzip and xz exports.
+
+Usage: python benchmarks/bench_backup.py [rows]
+Uses DJANGO_SETTINGS_MODULE (auth.settings by default) and creates, then
+destroys, a test database on the configured backend with `rows` markers
+(100k by default).
+"""
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auth.settings')
+
+import django  # noqa: E402 pylint: disable=wrong-import-position
+
+django.setup()
+
+from django.db import connection  # noqa: E402 pylint: disable=wrong-import-position
+from django.test.utils import setup_test_environment  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def measure(function):
+    """(milliseconds, peak MiB, result) of one call."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 2 ** 20, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    setup_test_environment()
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        # pylint: disable=import-outside-toplevel
+        import io
+        from django.core import serializers
+        from django.db import transaction
+        from users.backups import backup_queryset, iter_backup_json, iter_compressed, restore_markers
+        from users.geo import point_geohash
+        from users.models import Marker
+
+        Marker.objects.bulk_create(
+            Marker(name=f'Marker {i}', lat=(i % 180) - 89.5, lng=(i % 360) - 179.5,
+                   geohash=point_geohash((i % 180) - 89.5, (i % 360) - 179.5),
+                   image=f'marker_photos/{i}.jpg' if i % 2 else '') for i in range(rows))
+
+        def streamed():
+            # Like a client reading the response: chunks are dropped once sent.
+            size = 0
+            for chunk in iter_backup_json(backup_queryset()):
+                size += len(chunk.encode())
+            return size
+
+        def whole():
+            return len(serializers.serialize('json', backup_queryset()).encode())
+
+        print(f'rows: {rows:,}')
+        for label, function in (('serialize()', whole), ('streamed', streamed)):
+            elapsed, peak, size = measure(function)
+            print(f'{label:12} {elapsed:8.0f} ms   peak {peak:8.1f} MiB   {size / 2 ** 20:8.1f} MiB of JSON')
+
+        content = ''.join(iter_backup_json(backup_queryset())).encode()
+
+        def per_row():
+            for obj in serializers.deserialize('json', content.decode()):
+                Marker(name=obj.object.name, lat=obj.object.lat, lng=obj.object.lng, image=obj.object.image).save()
+            return rows
+
+        def batched():
+            restored, _ = restore_markers(io.BytesIO(content), None)
+            return restored
+
+        print('restore')
+        for label, function in (('save()', per_row), ('batched', batched)):
+            with transaction.atomic():
+                elapsed, peak, restored = measure(function)
+                transaction.set_rollback(True)
+            print(f'{label:12} {elapsed:8.0f} ms   peak {peak:8.1f} MiB   {restored:,} rows')
+
+        print('compression')
+        for compression in ('gzip', 'xz'):
+            started = time.perf_counter()
+            size = sum(len(chunk) for chunk in iter_compressed(iter_backup_json(backup_queryset()), compression))
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f'{compression:12} {elapsed:8.0f} ms   {size / 2 ** 20:8.1f} MiB ({len(content) / size:.1f}x)')
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Cost of rejecting a blacklisted client: BlacklistWSGIGate versus the
+IPBlacklistMiddleware path through Django's WSGI handler.
+
+Usage: python benchmarks/bench_blacklist_gate.py [requests]
+Uses DJANGO_SETTINGS_MODULE (auth.settings by default) and creates, then
+destroys, a test database on the configured backend.
+"""
+import io
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auth.settings')
+
+import django  # noqa: E402 pylint: disable=wrong-import-position
+
+django.setup()
+
+from django.conf import settings  # noqa: E402 pylint: disable=wrong-import-position
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402 pylint: disable=wrong-import-position
+from django.db import connection  # noqa: E402 pylint: disable=wrong-import-position
+from django.test.utils import setup_test_environment  # noqa: E402 pylint: disable=wrong-import-position
+
+BANNED_IP = '198.51.100.23'
+
+
+def environ_for(ip, accept):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': '/markers/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'HTTP_ACCEPT': accept,
+        'REMOTE_ADDR': ip,
+        'wsgi.input': io.BytesIO(),
+        'wsgi.url_scheme': 'http',
+    }
+
+
+def time_app(app, count, accept):
+    statuses = set()
+
+    def start_response(status, headers):
+        statuses.add(status)
+
+    started = time.perf_counter()
+    for _ in range(count):
+        response = app(environ_for(BANNED_IP, accept), start_response)
+        b''.join(response)
+        if hasattr(response, 'close'):
+            response.close()
+    return (time.perf_counter() - started) / count * 1e6, statuses
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    setup_test_environment()
+    # Django logs every 403 as a warning.
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        from users.gate import BlacklistWSGIGate  # pylint: disable=import-outside-toplevel
+        from users.models import BlacklistedIP  # pylint: disable=import-outside-toplevel
+
+        BlacklistedIP.objects.create(ip_address=BANNED_IP, reason='benchmark')
+        django_app = WSGIHandler()
+        gate = BlacklistWSGIGate(django_app)
+
+        print(f'requests per case: {count:,} (redirect url {settings.BLACKLIST_REDIRECT_URL})')
+        for label, accept in (('api 403', 'application/json'), ('browser 302', 'text/html')):
+            middleware_us, middleware_status = time_app(django_app, count, accept)
+            gate_us, gate_status = time_app(gate, count, accept)
+            print(f'{label:12} middleware: {middleware_us:8.1f} us {sorted(middleware_status)}')
+            print(f'{label:12} gate:       {gate_us:8.1f} us {sorted(gate_status)} '
+                  f'({middleware_us / gate_us:.0f}x faster)')
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
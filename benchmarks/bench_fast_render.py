@@ -0,0 +1,80 @@
+"""
+Rendering time of the marker, user and invite lists: serializer plus
+JSONRenderer versus users.fast_render, and whether the bytes match.
+
+Usage: python benchmarks/bench_fast_render.py [rows]
+Uses DJANGO_SETTINGS_MODULE (auth.settings by default) and creates, then
+destroys, a test database on the configured backend with `rows` markers
+and users (50k by default).
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auth.settings')
+
+import django  # noqa: E402 pylint: disable=wrong-import-position
+
+django.setup()
+
+from django.db import connection  # noqa: E402 pylint: disable=wrong-import-position
+from django.test.utils import setup_test_environment  # noqa: E402 pylint: disable=wrong-import-position
+from rest_framework.renderers import JSONRenderer  # noqa: E402 pylint: disable=wrong-import-position
+
+ROUNDS = 3
+
+
+def best_of(function):
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    setup_test_environment()
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        # pylint: disable=import-outside-toplevel
+        from django.contrib.auth import get_user_model
+        from users.fast_render import compile_fields, list_rows, render_list
+        from users.geo import point_geohash
+        from users.models import Marker, Role
+        from users.serializers import MarkerSerializer, BasicUserSerializer, InviteSerializer
+
+        User = get_user_model()
+        User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com', role=Role.MASON) for i in range(rows))
+        Marker.objects.bulk_create(
+            Marker(name=f'Marker {i}', lat=(i % 180) - 89.5, lng=(i % 360) - 179.5,
+                   geohash=point_geohash((i % 180) - 89.5, (i % 360) - 179.5),
+                   image=f'marker_photos/{i}.jpg' if i % 2 else '') for i in range(rows))
+
+        cases = [
+            ('markers', MarkerSerializer, Marker.objects.all()),
+            ('users', BasicUserSerializer, User.objects.order_by('username')),
+            ('invites', InviteSerializer, User.objects.filter(role=Role.MASON)),
+        ]
+        renderer = JSONRenderer()
+        print(f'rows: {rows:,}, best of {ROUNDS}')
+        for label, serializer_class, queryset in cases:
+            compiled = compile_fields(serializer_class, queryset.model)
+            serializer_ms, expected = best_of(
+                lambda s=serializer_class, q=queryset: renderer.render(s(q, many=True).data))
+            rows_ms, from_rows = best_of(lambda q=queryset, c=compiled: renderer.render(list_rows(q, c)))
+            bytes_ms, fast = best_of(lambda q=queryset, c=compiled: render_list(q, c))
+            identical = expected == fast == from_rows
+            print(f'{label:8} serializer: {serializer_ms:7.0f} ms   rows+renderer: {rows_ms:6.0f} ms '
+                  f'({serializer_ms / rows_ms:.1f}x)   bytes: {bytes_ms:6.0f} ms '
+                  f'({serializer_ms / bytes_ms:.1f}x)   identical: {identical}')
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Lookup latency and memory of users.ip_matcher.IPRangeMatcher and of the
+mmapped users.ip_snapshot.IPSnapshot built from the same networks.
+
+Usage: python benchmarks/bench_ip_matcher.py [entries]
+Builds a matcher from random IPv4 /24-/32 and IPv6 /48-/128 networks
+(1M by default) and times lookups of random addresses.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from users.ip_matcher import IPRangeMatcher, ip_to_int  # noqa: E402 pylint: disable=wrong-import-position
+from users.ip_snapshot import IPSnapshot, write_snapshot  # noqa: E402 pylint: disable=wrong-import-position
+
+LOOKUPS = 200_000
+
+
+def random_ranges(count, rng):
+    for i in range(count):
+        if i % 2:
+            prefix = rng.randint(24, 32)
+            start = ip_to_int(f'{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.0')
+            size = 1 << (32 - prefix)
+        else:
+            prefix = rng.randint(48, 128)
+            start = rng.getrandbits(128) | (1 << 125)
+            size = 1 << (128 - prefix)
+        start -= start % size
+        yield start, start + size - 1
+
+
+def time_lookups(table, probes):
+    hits = 0
+    started = time.perf_counter()
+    for probe in probes:
+        if probe in table:
+            hits += 1
+    return (time.perf_counter() - started) / len(probes) * 1e9, hits
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(42)
+    ranges = list(random_ranges(entries, rng))
+
+    started = time.perf_counter()
+    matcher = IPRangeMatcher(ranges)
+    build_seconds = time.perf_counter() - started
+
+    # Retained size of the lists and of the integers they own.
+    del ranges, matcher
+    tracemalloc.start()
+    matcher = IPRangeMatcher(random_ranges(entries, random.Random(42)))
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    probes = [f'{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}'
+               for _ in range(LOOKUPS // 2)]
+    keys = [rng.getrandbits(128) | (1 << 125) for _ in range(LOOKUPS // 2)]
+
+    string_ns, hits = time_lookups(matcher, probes)
+    key_ns, key_hits = time_lookups(matcher, keys)
+    hits += key_hits
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'blacklist.bin')
+        write_snapshot(path, zip(matcher.starts, matcher.ends))
+        snapshot = IPSnapshot(path)
+        snapshot_size = os.path.getsize(path)
+        snapshot_ns, snapshot_hits = time_lookups(snapshot, probes)
+        del snapshot
+
+    print(f'entries:            {entries:,} ({len(matcher):,} merged intervals)')
+    print(f'build:              {build_seconds:.2f} s')
+    print(f'matcher memory:     {memory / 2**20:.1f} MiB')
+    print(f'lookup (str):       {string_ns:,.0f} ns')
+    print(f'lookup (int key):   {key_ns:,.0f} ns')
+    print(f'hits:               {hits:,}')
+    print(f'snapshot file:      {snapshot_size / 2**20:.1f} MiB (shared by all workers)')
+    print(f'snapshot (str):     {snapshot_ns:,.0f} ns')
+    print(f'snapshot hits:      {snapshot_hits:,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Build time, memory and query latency of users.spatial_index.KDTree, next
+to a vectorized brute-force scan of the same points.
+
+Usage: python benchmarks/bench_spatial_index.py [markers]
+Builds a tree over random positions (1M by default) and times k=10
+nearest-neighbour and 5 km radius queries at random points. Needs
+DJANGO_SETTINGS_MODULE (auth.settings by default) only to import the module.
+"""
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auth.settings')
+
+import django  # noqa: E402 pylint: disable=wrong-import-position
+
+django.setup()
+
+from users.spatial_index import KDTree, to_unit_vectors, chord_for  # noqa: E402 pylint: disable=wrong-import-position
+
+QUERIES = 2_000
+
+
+def random_positions(count, rng):
+    return np.degrees(np.arcsin(rng.uniform(-1, 1, count))), rng.uniform(-180, 180, count)
+
+
+def time_queries(query, probes):
+    started = time.perf_counter()
+    for probe in probes:
+        query(probe)
+    return (time.perf_counter() - started) / len(probes) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(42)
+    points = to_unit_vectors(*random_positions(count, rng))
+    ids = np.arange(count)
+
+    started = time.perf_counter()
+    tree = KDTree(ids, points)
+    build_seconds = time.perf_counter() - started
+
+    del tree
+    tracemalloc.start()
+    tree = KDTree(ids, points)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    probes = list(to_unit_vectors(*random_positions(QUERIES, rng)))
+    radius = chord_for(5000)
+    knn_us = time_queries(lambda probe: tree.nearest(probe, 10), probes)
+    radius_us = time_queries(lambda probe: tree.within(probe, radius), probes)
+    brute_us = time_queries(lambda probe: np.argpartition(((points - probe) ** 2).sum(axis=1), 9)[:10],
+                            probes[:100])
+
+    print(f'markers:            {count:,}')
+    print(f'build:              {build_seconds:.2f} s')
+    print(f'tree memory:        {memory / 2**20:.1f} MiB')
+    print(f'k=10 nearest:       {knn_us:,.0f} us')
+    print(f'5 km radius:        {radius_us:,.0f} us')
+    print(f'brute force k=10:   {brute_us:,.0f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import EntryPassword, CustomUser, Marker, VoteType, Vote, UserVote, BlacklistedIP
+from .models import EntryPassword, CustomUser, Marker, VoteType, Vote, UserVote, BlacklistedIP, BlacklistedNetwork
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
 @admin.register(EntryPassword)
@@ -18,7 +18,12 @@ class CustomUserAdmin(BaseUserAdmin):
 
 admin.site.register(CustomUser, CustomUserAdmin)
 
-admin.site.register(Marker)
+@admin.register(Marker)
+class MarkerAdmin(admin.ModelAdmin):
+    """Deletes go through Marker.delete() and MarkerQuerySet.delete(), so they leave tombstones."""
+    list_display = ('id', 'name', 'lat', 'lng', 'user', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('created_at', 'updated_at')
 
 @admin.register(VoteType)
 class VoteTypeAdmin(admin.ModelAdmin):
@@ -55,3 +60,8 @@ class BlacklistedIPAdmin(admin.ModelAdmin):
     search_fields = ('ip_address', 'reason')
     readonly_fields = ('created_at',)
 
+@admin.register(BlacklistedNetwork)
+class BlacklistedNetworkAdmin(admin.ModelAdmin):
+    list_display = ('network', 'reason', 'created_at')
+    search_fields = ('network', 'reason')
+    readonly_fields = ('created_at',)
@@ -1,68 +1,185 @@
 import io
 import os
-from django.http import HttpResponse
-from django.core import serializers
+from contextlib import ExitStack
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.core.files import File
+from django.urls import reverse
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
 from rest_framework import status
-from .models import Marker
 from rest_framework import viewsets, permissions
 from .permissions import IsArchitectUser
+from .generations import bump_generation, MARKERS, MARKER_TILES
+from .backups import (export_queryset, iter_backup_json, iter_backup_zip, iter_compressed, open_backup_chain,
+                      restore_markers, COMPRESSIONS)
+from .marker_changes import CursorExpired
+from .backup_jobs import create_restore_job
+from .models import BackupJob
+from .serializers import BackupJobSerializer
+
+BACKUP_EXTENSIONS = ('.json', '.zip', '.gz', '.xz')
+
+
+def accepts_gzip(request):
+    """True if Accept-Encoding lists gzip without q=0."""
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() == 'gzip':
+            params = params.replace(' ', '').lower()
+            try:
+                return not params.startswith('q=') or float(params[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
 
 class BackupViewSet(viewsets.ViewSet):
 
     def get_permissions(self):
-        if self.action in ['create', 'list']:
+        if self.action in ['create', 'list', 'restore_job', 'job_status']:
             permission_classes = [permissions.IsAuthenticated, IsArchitectUser]
         return [permission() for permission in permission_classes]
 
     parser_classes = [MultiPartParser]
 
     def list(self, request):
-        """Download Marker data and images as a zip"""
-        markers = Marker.objects.all()
-        data = serializers.serialize('json', markers)
+        """
+        Download Marker data as JSON, streamed in batches so memory stays flat.
+        With ?archive=zip, a zip of that JSON and the marker images.
+        With ?since=<checkpoint>, only markers created, changed or deleted
+        since that export. The X-Backup-Checkpoint header carries the
+        checkpoint for the next incremental export.
+        JSON is compressed into a .gz or .xz file with ?compression=gzip|xz,
+        or sent with Content-Encoding: gzip if Accept-Encoding allows it.
+        """
+        archive = request.query_params.get('archive')
+        if archive not in (None, 'zip'):
+            return Response({"error": "archive must be zip."}, status=status.HTTP_400_BAD_REQUEST)
+        compression = request.query_params.get('compression')
+        if compression is not None and compression not in COMPRESSIONS:
+            return Response(
+                {"error": f"compression must be one of {', '.join(COMPRESSIONS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if compression and archive:
+            return Response({"error": "zip backups are compressed already."}, status=status.HTTP_400_BAD_REQUEST)
+        since = request.query_params.get('since')
+        try:
+            markers, checkpoint = export_queryset(since)
+        except ValueError:
+            return Response({"error": "since is not a valid checkpoint."}, status=status.HTTP_400_BAD_REQUEST)
+        except CursorExpired:
+            return Response(
+                {"error": "since has expired; take a full backup."},
+                status=status.HTTP_410_GONE
+            )
 
-        response = HttpResponse(data, content_type='application/json')
-        response['Content-Disposition'] = 'attachment; filename="marker_backup.json"'
+        filename = 'marker_backup_incremental' if since else 'marker_backup'
+        if archive == 'zip':
+            response = StreamingHttpResponse(iter_backup_zip(markers), content_type='application/zip')
+            response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+        elif compression:
+            content_type, extension = COMPRESSIONS[compression]
+            response = StreamingHttpResponse(
+                iter_compressed(iter_backup_json(markers), compression), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{filename}.json{extension}"'
+        else:
+            if accepts_gzip(request):
+                response = StreamingHttpResponse(
+                    iter_compressed(iter_backup_json(markers), 'gzip'), content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = StreamingHttpResponse(iter_backup_json(markers), content_type='application/json')
+            patch_vary_headers(response, ['Accept-Encoding'])
+            response['Content-Disposition'] = f'attachment; filename="{filename}.json"'
+        response['X-Backup-Checkpoint'] = checkpoint
         return response
 
     def create(self, request):
-        """Upload the  backup.zip file for restores"""
+        """
+        Upload the backup.json file (plain, .gz or .xz, told apart by content),
+        or the backup.zip with images, for restores.
+        Incremental backups taken after it go in incremental_file, oldest first.
+        The restore runs in the request as one transaction holding the restore
+        lock, so queued restore jobs wait until it ends; large backups belong
+        in POST /backup/jobs/.
+        """
 
-        backup_file = request.FILES.get('backup_file')
-        if not backup_file or not backup_file.name.endswith('.json'):
+        uploads = self.get_uploads(request)
+        if not uploads:
             return Response(
-                {"error": "No .json file provided."},
+                {"error": "No .json, .zip, .gz or .xz file provided."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
+        with ExitStack() as stack:
+            try:
+                json_files = open_backup_chain(stack, [(upload, upload.name) for upload in uploads])
+            except ValueError as e:
+                return Response(
+                    {"error": str(e)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            except (IOError, OSError) as e:
+                return Response(
+                    {"error": f"An error occurred: {str(e)}"},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            return self.restore_json(request, json_files[0], json_files[1:])
 
-            json_data = backup_file.read().decode('utf-8')
-            deserialized_objects = serializers.deserialize('json', json_data)
+    def get_uploads(self, request):
+        """backup_file and the incremental_file uploads after it, or None unless all are backups."""
+        uploads = [request.FILES.get('backup_file'), *request.FILES.getlist('incremental_file')]
+        if not uploads[0] or not all(upload.name.endswith(BACKUP_EXTENSIONS) for upload in uploads):
+            return None
+        return uploads
 
-            for obj in deserialized_objects:
-                old_marker_data = obj.object
-                new_marker = Marker(
-                    name=old_marker_data.name,
-                    lat=old_marker_data.lat,
-                    lng=old_marker_data.lng,
-                    user=request.user
-                )
-                if old_marker_data.image.name:
-                    new_marker.image.name = old_marker_data.image.name
+    @action(detail=False, methods=['post'], url_path='jobs', url_name='jobs')
+    def restore_job(self, request):
+        """
+        Queues the restore of the same uploads as create for the
+        run_backup_jobs worker and answers 202 with the job to poll.
+        """
+        uploads = self.get_uploads(request)
+        if not uploads:
+            return Response(
+                {"error": "No .json, .zip, .gz or .xz file provided."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        job = create_restore_job(request.user, uploads)
+        response = Response(BackupJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('backup-job', args=[job.pk])
+        return response
 
-                new_marker.save()
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>\d+)', url_name='job')
+    def job_status(self, request, job_id):
+        """Status of a background restore: rows so far, throughput and ETA while it runs."""
+        try:
+            job = BackupJob.objects.get(pk=job_id)
+        except BackupJob.DoesNotExist:
+            return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(BackupJobSerializer(job).data, status=status.HTTP_200_OK)
 
+    def restore_json(self, request, json_file, incrementals=()):
+        """Restores the markers of a JSON backup chain in batches and reports how many were new"""
+        try:
+            restored, skipped = restore_markers(json_file, request.user, incrementals)
+        except ValueError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except (IOError, OSError) as e:
             return Response(
                 {"error": f"An error occurred: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        finally:
+            bump_generation(MARKERS, MARKER_TILES)
 
         return Response(
-            {"status": "Restore successful"},
+            {"status": "Restore successful", "restored": restored, "skipped": skipped},
             status=status.HTTP_201_CREATED
         )
@@ -0,0 +1,113 @@
+"""
+Marker restores in the background.
+
+A restore job keeps its uploads in BACKUP_JOB_ROOT until the
+run_backup_jobs worker picks it up. The worker restores batch by batch and
+commits each batch together with the job's progress, so the status
+endpoint can report rows, throughput and an ETA while it runs, and a job
+whose worker died is resumed where it stopped. Restores run one at a time:
+claiming a job locks every open one, so a second worker waits its turn.
+"""
+import logging
+import os
+import zipfile
+from contextlib import ExitStack
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from .backups import open_backup_chain, restore_markers, ZIP_JSON_NAME
+from .generations import bump_generation, MARKERS, MARKER_TILES
+from .models import BackupJob
+
+logger = logging.getLogger(__name__)
+
+
+def job_storage():
+    location = getattr(settings, 'BACKUP_JOB_ROOT', os.path.join(settings.BASE_DIR, 'backup_jobs'))
+    return FileSystemStorage(location=location)
+
+
+def stale_after():
+    return timedelta(seconds=getattr(settings, 'BACKUP_JOB_STALE_SECONDS', 600))
+
+
+def create_restore_job(user, uploads):
+    """Stores the uploaded backup and its incrementals and queues their restore."""
+    storage = job_storage()
+    names = [storage.save(get_valid_filename(os.path.basename(upload.name)), upload) for upload in uploads]
+    return BackupJob.objects.create(user=user, files=names)
+
+
+def claim_job():
+    """
+    The next job to run, marked running: the oldest pending one, or a
+    running one whose worker stopped reporting. None while a restore runs.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Locks every open job, so concurrent workers decide one at a time.
+        jobs = list(BackupJob.objects.select_for_update()
+                    .filter(status__in=[BackupJob.Status.PENDING, BackupJob.Status.RUNNING]).order_by('pk'))
+        running = [job for job in jobs if job.status == BackupJob.Status.RUNNING]
+        if running:
+            job = running[0]
+            if job.heartbeat_at and job.heartbeat_at > now - stale_after():
+                return None
+            logger.warning('Resuming backup job %s after %s markers', job.pk, job.rows_processed)
+        elif jobs:
+            job = jobs[0]
+            job.status = BackupJob.Status.RUNNING
+            job.started_at = now
+        else:
+            return None
+        job.heartbeat_at = now
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+    return job
+
+
+def run_job(job):
+    """
+    Restores a claimed job and records how it ended. Returns True if it
+    succeeded. Batches committed before a failure stay; rows_processed
+    tells how many. The uploads are removed either way.
+    """
+    storage = job_storage()
+    try:
+        with ExitStack() as stack:
+            files = [(stack.enter_context(storage.open(name, 'rb')), name) for name in job.files]
+            fileobj = files[0][0]
+            # Plain and compressed JSON is read front to back, so the upload's position is the progress.
+            position, total = fileobj.tell, storage.size(job.files[0])
+            json_files = open_backup_chain(stack, files)
+            if isinstance(json_files[0], zipfile.ZipExtFile):
+                # In a zip, only the JSON entry counts; the images are restored already.
+                with zipfile.ZipFile(fileobj) as archive:
+                    position, total = json_files[0].tell, archive.getinfo(ZIP_JSON_NAME).file_size
+
+            def on_batch(restored):
+                BackupJob.objects.filter(pk=job.pk).update(
+                    rows_processed=restored, bytes_processed=position(), bytes_total=total,
+                    heartbeat_at=timezone.now())
+
+            restored, skipped = restore_markers(
+                json_files[0], job.user, json_files[1:], resume_from=job.rows_processed, on_batch=on_batch)
+            job.rows_processed += restored + skipped
+    except Exception as e:  # pylint: disable=broad-except
+        logger.exception('Backup job %s failed', job.pk)
+        job.refresh_from_db(fields=['rows_processed', 'bytes_processed', 'bytes_total'])
+        job.status = BackupJob.Status.FAILED
+        job.error = str(e)
+    else:
+        job.status = BackupJob.Status.SUCCEEDED
+        job.bytes_processed = job.bytes_total = total
+    finally:
+        bump_generation(MARKERS, MARKER_TILES)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'rows_processed', 'bytes_processed', 'bytes_total', 'finished_at'])
+    for name in job.files:
+        storage.delete(name)
+    return job.status == BackupJob.Status.SUCCEEDED
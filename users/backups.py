@@ -0,0 +1,422 @@
+"""
+Marker backup export and the image half of restores.
+
+iter_backup_json() writes the same JSON as serializers.serialize('json', ...)
+but one batch of rows at a time, so the backup of a large map never sits in
+memory as a whole: rows are fetched with iterator(chunk_size=...) and
+serialized batch by batch into the response as it is sent.
+
+iter_backup_zip() wraps that JSON and the image files the markers point to
+in a zip archive, written to an unseekable sink (sizes and CRCs go in data
+descriptors after each entry) and handed out as it grows, so neither memory
+nor temporary disk holds the archive. restore_images() reads the images of
+such an archive back into storage.
+
+restore_markers() goes the other way for the JSON: the array is decoded one
+item at a time and inserted RESTORE_BATCH_SIZE rows per INSERT, inside one
+transaction, so a failed restore leaves nothing behind.
+
+Every export comes with a checkpoint (a marker_changes cursor). An export
+since a checkpoint is incremental: the markers created, changed or deleted
+after it, in the same format, deleted ones as tombstones with deleted_at
+set. A restore replays a full backup plus such a chain by keeping only the
+latest version of each marker from the incrementals (they are small) and
+applying it while the full backup streams past.
+
+JSON backups can be sent and restored compressed with gzip or xz:
+iter_compressed() compresses the export as it is generated, and
+open_backup_json() recognizes a compressed upload by its magic bytes and
+decompresses it while it is parsed.
+"""
+import gzip
+import logging
+import lzma
+import posixpath
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+from django.core import serializers
+from django.core.files import File
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.python import Deserializer as PythonDeserializer
+from django.db import connection, transaction
+from django.utils import timezone
+from .generations import get_generations, MARKERS_RESET
+from .geo import point_geohash
+from .marker_changes import changed_after, encode_cursor, settle_delay
+from .models import Marker, RestoreLock
+from .streaming import chunked, iter_json_array
+from .thumbnails import schedule_thumbnails
+from .uploads import has_image_magic, max_image_size, IMAGE_WRITE_THREADS
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 2000
+RESTORE_BATCH_SIZE = 1000
+# RestoreLock row locked while a restore checks and inserts a batch.
+RESTORE_LOCK_ID = 1
+COPY_CHUNK_SIZE = 64 * 1024
+# Entry names inside a zip backup.
+ZIP_JSON_NAME = 'markers.json'
+ZIP_MEDIA_DIR = 'media/'
+IMAGE_FIELDS = ('image', 'thumbnail', 'medium')
+GZIP_LEVEL = 6
+XZ_PRESET = 6
+# Compression -> (content type, file extension).
+COMPRESSIONS = {
+    'gzip': ('application/gzip', '.gz'),
+    'xz': ('application/x-xz', '.xz'),
+}
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')
+
+
+def backup_queryset():
+    """Live markers in primary key order, so repeated exports are identical."""
+    return Marker.objects.order_by('pk')
+
+
+def export_queryset(checkpoint=None):
+    """
+    Returns (markers to export, checkpoint for the next export): every live
+    marker, or with `checkpoint` the markers created, changed or deleted
+    since. Raises CursorExpired and ValueError.
+    """
+    reset = get_generations(MARKERS_RESET)[MARKERS_RESET]
+    now = timezone.now()
+    next_checkpoint = encode_cursor(reset, now - settle_delay(), 0)
+    if not checkpoint:
+        return backup_queryset(), next_checkpoint
+    # Rows at the next checkpoint itself belong to the next export.
+    rows = changed_after(checkpoint, reset, now).filter(updated_at__lt=now - settle_delay())
+    return rows.order_by('pk'), next_checkpoint
+
+
+def iter_backup_json(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields the JSON array of `queryset` in Django's serialization format, batch by batch."""
+    yield '['
+    first = True
+    for batch in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        # serialize() wraps each batch in [...]; only the items are kept.
+        items = serializers.serialize('json', batch)[1:-1]
+        if not first:
+            # The separator serialize() puts between items.
+            yield ', '
+        first = False
+        yield items
+    yield ']'
+
+
+def _compressor(compression):
+    if compression == 'gzip':
+        # wbits 31: deflate with a gzip header and trailer.
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    if compression == 'xz':
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=XZ_PRESET)
+    raise ValueError(f'Unknown compression {compression!r}.')
+
+
+def iter_compressed(chunks, compression):
+    """Yields `chunks` (str or bytes) compressed as a gzip or xz stream, as they come."""
+    compressor = _compressor(compression)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def backup_kind(upload):
+    """'zip', 'gzip', 'xz' or 'json', from the first bytes of an uploaded backup."""
+    head = upload.read(6)
+    upload.seek(0)
+    if head.startswith(ZIP_MAGIC):
+        return 'zip'
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(XZ_MAGIC):
+        return 'xz'
+    return 'json'
+
+
+class _Decompressed:
+    """Readable decompressing file that reports corrupt or truncated data as ValueError."""
+
+    def __init__(self, fileobj, kind):
+        self.fileobj = fileobj
+        self.kind = kind
+
+    def read(self, size=-1):
+        try:
+            return self.fileobj.read(size)
+        except (gzip.BadGzipFile, zlib.error, lzma.LZMAError, EOFError) as e:
+            raise ValueError(f'Backup is not a valid {self.kind} stream: {e}') from e
+
+
+def open_backup_json(upload):
+    """The JSON of a plain, gzip or xz backup, decompressed while it is read."""
+    kind = backup_kind(upload)
+    if kind == 'gzip':
+        return _Decompressed(gzip.GzipFile(fileobj=upload, mode='rb'), kind)
+    if kind == 'xz':
+        return _Decompressed(lzma.LZMAFile(upload, mode='rb'), kind)
+    return upload
+
+
+class _Sink:
+    """Write-only file whose contents are taken back out with drain()."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _image_storage():
+    return Marker._meta.get_field('image').storage
+
+
+def iter_image_names(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields each image, thumbnail and medium file name referenced by `queryset` once."""
+    for field in IMAGE_FIELDS:
+        names = (queryset.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                 .order_by(field).values_list(field, flat=True).distinct())
+        yield from names.iterator(chunk_size=chunk_size)
+
+
+def iter_backup_zip(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields a zip archive of `queryset`: ZIP_JSON_NAME as written by
+    iter_backup_json() (deflated), then every referenced file under
+    ZIP_MEDIA_DIR (stored, images are compressed already). Files missing
+    from storage are left out.
+    """
+    # The deflater holds data back between writes; don't send empty chunks.
+    return (chunk for chunk in _iter_zip(queryset, chunk_size) if chunk)
+
+
+def _iter_zip(queryset, chunk_size):
+    sink = _Sink()
+    storage = _image_storage()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(ZIP_JSON_NAME, 'w', force_zip64=True) as entry:
+            for chunk in iter_backup_json(queryset, chunk_size):
+                entry.write(chunk.encode())
+                yield sink.drain()
+
+        for name in iter_image_names(queryset, chunk_size):
+            try:
+                source = storage.open(name, 'rb')
+            except FileNotFoundError:
+                logger.warning('Backup leaves out %s, which is missing from storage', name)
+                continue
+            info = zipfile.ZipInfo(ZIP_MEDIA_DIR + name, time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with source, archive.open(info, 'w') as entry:
+                for chunk in source.chunks(COPY_CHUNK_SIZE):
+                    entry.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()
+
+
+def _media_prefixes():
+    return tuple(Marker._meta.get_field(field).upload_to for field in IMAGE_FIELDS)
+
+
+def restorable_media_name(entry_name):
+    """The storage name for a zip entry, or None if it is not a marker image this archive may write."""
+    if not entry_name.startswith(ZIP_MEDIA_DIR):
+        return None
+    name = entry_name[len(ZIP_MEDIA_DIR):]
+    if name != posixpath.normpath(name) or not name.startswith(_media_prefixes()):
+        return None
+    return name
+
+
+def restore_images(archive):
+    """
+    Writes the images of a zip backup to storage, a few at a time; names
+    that already exist are kept as they are. Entries outside the marker
+    image directories, too large or not images are skipped. Returns how
+    many files were written.
+    """
+    storage = _image_storage()
+
+    def restore(info):
+        name = restorable_media_name(info.filename)
+        if name is None or info.is_dir() or info.file_size > max_image_size() or storage.exists(name):
+            return False
+        with archive.open(info) as entry:
+            if not has_image_magic(entry.read(12)):
+                logger.warning('Restore skips %s, which is not an image', info.filename)
+                return False
+            entry.seek(0)
+            stored = storage.save(name, File(entry, name=name))
+        if stored != name:
+            logger.warning('Restored %s as %s', name, stored)
+        return True
+
+    entries = [info for info in archive.infolist() if info.filename.startswith(ZIP_MEDIA_DIR)]
+    with ThreadPoolExecutor(max_workers=IMAGE_WRITE_THREADS) as executor:
+        return sum(executor.map(restore, entries))
+
+
+def _is_marker_item(item):
+    return isinstance(item, dict) and item.get('model') == Marker._meta.label_lower
+
+
+def _deserialize(items):
+    """Marker instances for a batch of backup items. Raises ValueError for anything else."""
+    if not all(_is_marker_item(item) for item in items):
+        raise ValueError(f'Backup entries must be {Marker._meta.label_lower} objects.')
+    try:
+        return [obj.object for obj in PythonDeserializer(items, ignorenonexistent=True)]
+    except DeserializationError as e:
+        raise ValueError(f'Invalid marker in backup: {e}') from e
+
+
+def _restored_marker(old, user):
+    marker = Marker(name=old.name, lat=old.lat, lng=old.lng, user=user)
+    if old.image.name:
+        marker.image.name = old.image.name
+        marker.thumbnail.name = old.thumbnail.name
+        marker.medium.name = old.medium.name
+    # bulk_create does not call Marker.save.
+    marker.geohash = point_geohash(marker.lat, marker.lng)
+    marker.content_hash = marker.compute_content_hash()
+    return marker
+
+
+def _lock_restores():
+    """
+    Locks the RestoreLock row until the current transaction ends, so
+    concurrent restores (requests and background jobs alike) check and
+    insert their batches one at a time and never both add the same marker.
+    """
+    RestoreLock.objects.select_for_update().get_or_create(pk=RESTORE_LOCK_ID)
+
+
+def _new_markers(markers):
+    """`markers` without the ones that exist already or repeat an earlier one, by content hash."""
+    existing = set(Marker.objects.filter(content_hash__in=[marker.content_hash for marker in markers])
+                   .values_list('content_hash', flat=True))
+    new = []
+    for marker in markers:
+        if marker.content_hash not in existing:
+            existing.add(marker.content_hash)
+            new.append(marker)
+    return new
+
+
+def load_incrementals(json_files):
+    """
+    {pk: latest backup item} over a chain of incremental backups, oldest
+    first; None for markers deleted by the end of the chain. Raises ValueError.
+    """
+    latest = {}
+    for json_file in json_files:
+        for item in iter_json_array(json_file):
+            if not _is_marker_item(item) or not isinstance(item.get('fields'), dict):
+                raise ValueError(f'Backup entries must be {Marker._meta.label_lower} objects.')
+            latest[item.get('pk')] = None if item['fields'].get('deleted_at') else item
+    return latest
+
+
+def apply_incrementals(items, latest):
+    """
+    Yields the items of a full backup with the changes in `latest` (from
+    load_incrementals) applied, then the markers created after it.
+    """
+    for item in items:
+        pk = item.get('pk') if isinstance(item, dict) else None
+        if pk in latest:
+            item = latest.pop(pk)
+            if item is None:
+                continue
+        yield item
+    yield from (item for item in latest.values() if item is not None)
+
+
+def restore_markers(json_file, user, incrementals=(), batch_size=RESTORE_BATCH_SIZE, resume_from=0, on_batch=None):
+    """
+    Recreates the markers of a JSON backup, after replaying the chain of
+    `incrementals` on it, as new markers of `user`. Markers whose name,
+    position and image match a live marker are skipped, so restoring twice
+    is harmless. Returns (restored, skipped). Raises ValueError for
+    malformed backups, after rolling back whatever was inserted.
+
+    With `on_batch`, each batch commits on its own, together with
+    on_batch(backup markers processed so far), so a background job can
+    report its progress and resume after `resume_from` markers once interrupted.
+    Without it, everything is one transaction that holds the restore lock
+    until the end, so every other restore, queued jobs included, waits.
+    """
+    items = iter_json_array(json_file)
+    if incrementals:
+        items = apply_incrementals(items, load_incrementals(incrementals))
+    items = islice(items, resume_from, None)
+    restored = skipped = 0
+    with nullcontext() if on_batch else transaction.atomic():
+        for batch in chunked(items, batch_size):
+            with transaction.atomic():
+                _lock_restores()
+                markers = _new_markers([_restored_marker(old, user) for old in _deserialize(batch)])
+                if connection.features.can_return_rows_from_bulk_insert:
+                    Marker.objects.bulk_create(markers)
+                else:
+                    # MySQL cannot return the new ids from a multi-row INSERT.
+                    for marker in markers:
+                        marker.save()
+                for marker in markers:
+                    if marker.image and not marker.thumbnail:
+                        schedule_thumbnails(marker.id)
+                restored += len(markers)
+                skipped += len(batch) - len(markers)
+                if on_batch:
+                    on_batch(resume_from + restored + skipped)
+    return restored, skipped
+
+
+def open_backup(stack, fileobj, name):
+    """
+    The (decompressed) JSON of a JSON backup, or the opened ZipFile of a zip
+    backup, closed with `stack`. Raises ValueError for zips without markers.
+    """
+    if backup_kind(fileobj) != 'zip':
+        return open_backup_json(fileobj)
+    try:
+        archive = stack.enter_context(zipfile.ZipFile(fileobj))
+        archive.getinfo(ZIP_JSON_NAME)
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f"{name} is not a marker backup zip; it needs {ZIP_JSON_NAME}.") from e
+    return archive
+
+
+def open_backup_chain(stack, files):
+    """
+    The marker JSON of each (file object, name) in `files`: a backup and
+    its incrementals. Images of zip backups are restored first, so
+    thumbnails scheduled for restored markers find them. Raises ValueError.
+    """
+    backups = [open_backup(stack, fileobj, name) for fileobj, name in files]
+    for backup in backups:
+        if isinstance(backup, zipfile.ZipFile):
+            restore_images(backup)
+    return [
+        stack.enter_context(backup.open(ZIP_JSON_NAME)) if isinstance(backup, zipfile.ZipFile) else backup
+        for backup in backups
+    ]
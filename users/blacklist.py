@@ -0,0 +1,222 @@
+import fcntl
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .generations import get_generations, BLACKLIST, BLACKLIST_RESET, BLACKLIST_NETWORKS
+from .ip_matcher import IPRangeMatcher, ip_to_int, parse_ip_range
+from .ip_snapshot import IPSnapshot, write_snapshot
+from .models import BlacklistedIP, BlacklistedNetwork
+
+logger = logging.getLogger(__name__)
+
+GENERATIONS = (BLACKLIST, BLACKLIST_RESET, BLACKLIST_NETWORKS)
+# Rows committed slightly out of created_at order are still picked up.
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+def trusted_proxies_from_settings():
+    return IPRangeMatcher.from_networks(getattr(settings, 'BLACKLIST_TRUSTED_PROXIES', ()))
+
+
+def get_client_ip(remote_addr, forwarded_for, trusted_proxies):
+    """
+    Returns REMOTE_ADDR, unless it is a trusted proxy: then the right-most
+    X-Forwarded-For address that was not added by a trusted proxy.
+    """
+    if not forwarded_for or not remote_addr or remote_addr not in trusted_proxies:
+        return remote_addr
+    for ip in reversed(forwarded_for.split(',')):
+        ip = ip.strip()
+        if ip and ip not in trusted_proxies:
+            return ip
+    return remote_addr
+
+
+def iter_network_ranges():
+    """
+    Yields (start, end) keys for every banned network. Rows saved without
+    validation that do not parse are logged and skipped.
+    """
+    for network in BlacklistedNetwork.objects.values_list('network', flat=True).iterator(chunk_size=10000):
+        try:
+            yield parse_ip_range(network)
+        except ValueError:
+            logger.warning('Skipping invalid blacklisted network %r', network)
+
+
+def iter_blacklist_ranges():
+    """Yields (start, end) keys for every banned address and network, skipping invalid rows."""
+    for ip in BlacklistedIP.objects.values_list('ip_address', flat=True).iterator(chunk_size=10000):
+        try:
+            key = ip_to_int(ip)
+        except ValueError:
+            logger.warning('Skipping invalid blacklisted address %r', ip)
+            continue
+        yield key, key
+    yield from iter_network_ranges()
+
+
+def build_snapshot(path, generations):
+    """Writes the whole blacklist to the snapshot file, stamped with `generations`."""
+    return write_snapshot(path, iter_blacklist_ranges(), [generations[name] for name in GENERATIONS])
+
+
+class Blacklist:
+    """
+    A worker's view of BlacklistedIP and BlacklistedNetwork.
+
+    Writers bump the shared blacklist generations (see users.signals).
+    refresh_if_due() compares them at most once per refresh interval and
+    then only pulls the bans added since the last sync.
+
+    By default single addresses are kept in a set and networks in an
+    IPRangeMatcher. With a snapshot path, the whole table instead lives in
+    one mmapped file per host (see users.ip_snapshot); the first worker that
+    notices a newer generation rebuilds it and the others remap it. A worker
+    that cannot map any snapshot keeps the blacklist in memory until it can.
+    """
+
+    def __init__(self, refresh_interval=1.0, snapshot_path=None):
+        self.refresh_interval = refresh_interval
+        self.snapshot_path = snapshot_path
+        self.snapshot = None
+        self.generations = None
+        self.reload()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            refresh_interval=getattr(settings, 'BLACKLIST_REFRESH_INTERVAL_MS', 1000) / 1000,
+            snapshot_path=getattr(settings, 'BLACKLIST_SNAPSHOT_PATH', None),
+        )
+
+    def __contains__(self, ip):
+        if self.snapshot is not None:
+            return ip in self.snapshot
+        return ip in self.addresses or ip in self.networks
+
+    def is_due(self):
+        return time.monotonic() - self.checked_at >= self.refresh_interval
+
+    def refresh_if_due(self):
+        if self.is_due():
+            self.sync()
+
+    def reload(self):
+        """Reloads the whole blacklist."""
+        self.checked_at = time.monotonic()
+        generations = get_generations(*GENERATIONS)
+        if self.snapshot_path:
+            self._sync_snapshot(generations, blocking=True)
+            if self.snapshot is not None:
+                return
+
+        self.generations = generations
+        self.synced_at = timezone.now()
+        self.addresses = set(BlacklistedIP.objects.values_list('ip_address', flat=True))
+        self.networks = IPRangeMatcher(iter_network_ranges())
+
+    def sync(self):
+        """
+        Pulls the bans added since the last sync if the generation moved.
+        Removed or edited entries need a full reload.
+        """
+        self.checked_at = time.monotonic()
+        generations = get_generations(*GENERATIONS)
+        if self.snapshot_path and (generations != self.generations
+                                   or self.snapshot is not None and not self.snapshot.is_current()):
+            self._sync_snapshot(generations, blocking=False)
+        if self.snapshot is not None:
+            return
+
+        if generations == self.generations:
+            return
+        if generations[BLACKLIST_RESET] != self.generations[BLACKLIST_RESET]:
+            self.reload()
+            return
+        if generations[BLACKLIST_NETWORKS] != self.generations[BLACKLIST_NETWORKS]:
+            self.networks = IPRangeMatcher(iter_network_ranges())
+
+        synced_at = timezone.now()
+        self.addresses.update(
+            BlacklistedIP.objects.filter(created_at__gte=self.synced_at - SYNC_OVERLAP)
+            .values_list('ip_address', flat=True)
+        )
+        self.generations = generations
+        self.synced_at = synced_at
+
+    def _open_snapshot(self):
+        if self.snapshot is not None and self.snapshot.is_current():
+            return self.snapshot
+        try:
+            return IPSnapshot(self.snapshot_path)
+        except (OSError, ValueError):
+            return None
+
+    def _is_fresh(self, snapshot, generations):
+        return snapshot is not None and snapshot.generations == tuple(generations[name] for name in GENERATIONS)
+
+    def _sync_snapshot(self, generations, blocking):
+        """
+        Maps the snapshot file, rebuilding it first if it is older than `generations`.
+        Without `blocking`, a worker that finds another one rebuilding keeps the
+        current mapping and retries on its next sync. So does one that cannot
+        write the file.
+        """
+        snapshot = self._open_snapshot()
+        if not self._is_fresh(snapshot, generations):
+            try:
+                rebuilt = self._rebuild_snapshot(generations, blocking)
+            except OSError:
+                logger.exception('Could not rebuild the blacklist snapshot at %s', self.snapshot_path)
+            else:
+                if rebuilt is not None:
+                    snapshot = rebuilt
+
+        if snapshot is not None:
+            self.snapshot = snapshot
+        if self._is_fresh(snapshot, generations):
+            self.generations = generations
+
+    def _rebuild_snapshot(self, generations, blocking):
+        """Rebuilds the snapshot under the host-wide lock. Returns None if another worker holds it."""
+        lock_fd = os.open(f'{self.snapshot_path}.lock', os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            snapshot = self._open_snapshot()
+            if not self._is_fresh(snapshot, generations):
+                build_snapshot(self.snapshot_path, generations)
+                snapshot = self._open_snapshot()
+            return snapshot
+        finally:
+            os.close(lock_fd)
+
+
+_blacklist = None
+_blacklist_lock = threading.Lock()
+
+
+def get_blacklist():
+    """
+    This process's Blacklist, loaded on first use. BlacklistGate and
+    IPBlacklistMiddleware share it, so a worker holds and polls one copy.
+    """
+    global _blacklist  # pylint: disable=global-statement
+    if _blacklist is None:
+        with _blacklist_lock:
+            if _blacklist is None:
+                _blacklist = Blacklist.from_settings()
+    return _blacklist
+
+
+def reset_blacklist():
+    """Drops the shared Blacklist, so the next get_blacklist() loads it with the current settings."""
+    global _blacklist  # pylint: disable=global-statement
+    _blacklist = None
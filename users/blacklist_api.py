@@ -0,0 +1,120 @@
+import csv
+import json
+import ipaddress
+from itertools import chain
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.ipv6 import clean_ipv6_address
+from rest_framework import viewsets, permissions, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from .generations import bump_generation, BLACKLIST
+from .models import BlacklistedIP
+from .permissions import IsArchitectUser
+from .streaming import chunked, iter_csv_rows, iter_ndjson, until_error
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 50
+EXPORT_FIELDS = ('ip_address', 'reason', 'created_at')
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def normalize_ip(value):
+    """Returns the address as GenericIPAddressField stores it. Raises ValueError if invalid."""
+    address = ipaddress.ip_address(value.strip())
+    if address.version == 6:
+        return clean_ipv6_address(str(address))
+    return str(address)
+
+
+class BlacklistViewSet(viewsets.ViewSet):
+    """
+    Architect-only bulk transfer of BlacklistedIP, e.g. to sync threat feeds.
+    list: streams every entry as NDJSON (default) or CSV (?type=csv).
+    create: imports an uploaded .csv (ip_address, reason) or .ndjson file.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsArchitectUser]
+    parser_classes = [MultiPartParser]
+
+    def list(self, request):
+        rows = (
+            BlacklistedIP.objects.order_by('id')
+            .values_list(*EXPORT_FIELDS)
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        if request.query_params.get('type') == 'csv':
+            writer = csv.writer(_Echo())
+            lines = (writer.writerow(row) for row in rows)
+            content = chain([writer.writerow(EXPORT_FIELDS)], lines)
+            response = StreamingHttpResponse(content, content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="blacklist.csv"'
+            return response
+
+        lines = (
+            json.dumps({'ip_address': ip, 'reason': reason, 'created_at': created_at.isoformat()}) + '\n'
+            for ip, reason, created_at in rows
+        )
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="blacklist.ndjson"'
+        return response
+
+    def create(self, request):
+        blacklist_file = request.FILES.get('blacklist_file')
+        if not blacklist_file or not blacklist_file.name.endswith(('.csv', '.ndjson', '.jsonl')):
+            return Response(
+                {"error": "No .csv or .ndjson file provided."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if blacklist_file.name.endswith('.csv'):
+            rows = iter_csv_rows(blacklist_file)
+        else:
+            rows = iter_ndjson(blacklist_file)
+
+        summary = {'created': 0, 'existing': 0, 'invalid': 0, 'errors': []}
+        stopped = []
+        for chunk in chunked(enumerate(until_error(rows, stopped), start=1), IMPORT_CHUNK_SIZE):
+            self._import_chunk(chunk, summary)
+        # One refresh for the whole import; bulk_create sends no signals.
+        if summary['created']:
+            bump_generation(BLACKLIST)
+
+        if stopped:
+            summary['errors'].append({'error': f'Import stopped: {stopped[0]}'})
+            return Response(summary, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary, status=status.HTTP_201_CREATED)
+
+    def _import_chunk(self, chunk, summary):
+        """Validates one chunk, skips known addresses with one IN query and bulk-creates the rest."""
+        entries = {}
+        for row, data in chunk:
+            try:
+                ip = normalize_ip(str(data.get('ip_address') or ''))
+            except (AttributeError, ValueError):
+                summary['invalid'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'row': row, 'error': 'Invalid IP address.'})
+                continue
+            if ip in entries:
+                summary['existing'] += 1
+            else:
+                entries[ip] = str(data.get('reason') or '')[:255]
+
+        existing = set(
+            BlacklistedIP.objects.filter(ip_address__in=entries).values_list('ip_address', flat=True)
+        )
+        new_entries = [
+            BlacklistedIP(ip_address=ip, reason=reason)
+            for ip, reason in entries.items() if ip not in existing
+        ]
+        with transaction.atomic():
+            BlacklistedIP.objects.bulk_create(new_entries, ignore_conflicts=True)
+        summary['created'] += len(new_entries)
+        summary['existing'] += len(existing)
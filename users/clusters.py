@@ -0,0 +1,151 @@
+import math
+from django.core.cache import cache
+from django.db.models import Avg, Count, F
+from django.db.models.functions import Floor
+from .generations import get_generations, MARKERS, MARKER_TILES
+from .geo import box_in_bbox
+from .models import Marker
+from .regions import REGION_ZOOMS, point_tile, region_generation, tile_markers
+
+# From this zoom level on, the map gets raw markers instead of clusters.
+CLUSTER_MAX_ZOOM = 14
+# Grid cells per tile side; 256px tiles give roughly 64px cells.
+CELLS_PER_TILE = 4
+CACHE_TIMEOUT = 60 * 60
+# A bbox is clustered per region block when it covers at most this many.
+MAX_BLOCKS = 64
+
+
+def cell_size(zoom):
+    """Side of a grid cell in degrees at the given zoom level."""
+    return 360 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def cell_bounds(zoom, cell):
+    """(minLng, minLat, maxLng, maxLat) of a grid cell."""
+    size = cell_size(zoom)
+    cell_x, cell_y = cell
+    return cell_x * size - 180, cell_y * size - 90, (cell_x + 1) * size - 180, (cell_y + 1) * size - 90
+
+
+def compute_clusters(zoom, markers=None):
+    """Groups markers into grid cells in SQL and returns each cell's centroid and count."""
+    size = cell_size(zoom)
+    markers = Marker.objects.all() if markers is None else markers
+    cells = (
+        markers.filter(lat__isnull=False, lng__isnull=False)
+        .annotate(cell_x=Floor((F('lng') + 180) / size), cell_y=Floor((F('lat') + 90) / size))
+        .values('cell_x', 'cell_y')
+        .annotate(count=Count('id'), centroid_lat=Avg('lat'), centroid_lng=Avg('lng'))
+        .order_by('cell_y', 'cell_x')
+    )
+    return [
+        {
+            'cell': [int(cell['cell_x']), int(cell['cell_y'])],
+            'lat': cell['centroid_lat'],
+            'lng': cell['centroid_lng'],
+            'count': cell['count'],
+        }
+        for cell in cells
+    ]
+
+
+def _cell_aligned(zoom, bbox):
+    """The bbox grown past the grid cells it touches, so each of them lies wholly inside."""
+    size = cell_size(zoom)
+    min_lng, min_lat, max_lng, max_lat = bbox
+    min_lng = max((math.floor((min_lng + 180) / size) - 1) * size - 180, -180.0)
+    max_lng = min((math.ceil((max_lng + 180) / size) + 1) * size - 180, 180.0)
+    if bbox[0] > bbox[2] and min_lng <= max_lng:
+        min_lng, max_lng = -180.0, 180.0
+    min_lat = max((math.floor((min_lat + 90) / size) - 1) * size - 90, -90.0)
+    max_lat = min((math.ceil((max_lat + 90) / size) + 1) * size - 90, 90.0)
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def _blocks(block_zoom, bbox):
+    """(x, y) of the region blocks at block_zoom that hold the markers of a bbox."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    # Step past the edges: points on a block edge belong to one of its neighbours.
+    first_x, first_y = point_tile(max_lat + 1e-9, min_lng - 1e-9, block_zoom)
+    last_x, last_y = point_tile(min_lat - 1e-9, max_lng + 1e-9, block_zoom)
+    if min_lng <= max_lng:
+        xs = range(first_x, last_x + 1)
+    else:
+        xs = [*range(first_x, 2 ** block_zoom), *range(0, last_x + 1)]
+    return [(x, y) for y in range(first_y, last_y + 1) for x in xs]
+
+
+def _merge(partials):
+    """Joins the parts of cells split across blocks and orders them like compute_clusters."""
+    cells = {}
+    for cluster in partials:
+        cell = tuple(cluster['cell'])
+        count, lat_sum, lng_sum = cells.get(cell, (0, 0.0, 0.0))
+        cells[cell] = (count + cluster['count'],
+                       lat_sum + cluster['lat'] * cluster['count'],
+                       lng_sum + cluster['lng'] * cluster['count'])
+    return [
+        {'cell': [cell_x, cell_y], 'lat': lat_sum / count, 'lng': lng_sum / count, 'count': count}
+        for (cell_x, cell_y), (count, lat_sum, lng_sum) in sorted(cells.items(), key=lambda item: item[0][::-1])
+    ]
+
+
+def _world_clusters(zoom):
+    generation = get_generations(MARKERS)[MARKERS]
+    key = f'marker-clusters:{generation}:{zoom}'
+    clusters = cache.get(key)
+    if clusters is None:
+        clusters = compute_clusters(zoom)
+        cache.set(key, clusters, CACHE_TIMEOUT)
+    return clusters
+
+
+def _block_clusters(zoom, block_zoom, blocks):
+    """
+    Clusters of the given blocks, each cached under its region generation,
+    so a write only recomputes the blocks around it.
+    """
+    regions = {block: region_generation(block_zoom, *block) for block in blocks}
+    # Read before the rows, so clusters computed during a write are cached under the old generation.
+    generations = get_generations(MARKER_TILES, *regions.values())
+    keys = {
+        block: f'marker-clusters:{generations[MARKER_TILES]}:{generations[region]}:{zoom}:{region}'
+        for block, region in regions.items()
+    }
+    cached = cache.get_many(keys.values())
+    computed = {}
+    partials = []
+    for block, key in keys.items():
+        clusters = cached.get(key)
+        if clusters is None:
+            clusters = computed[key] = compute_clusters(zoom, tile_markers(block_zoom, *block))
+        partials.extend(clusters)
+    if computed:
+        cache.set_many(computed, CACHE_TIMEOUT)
+    return _merge(partials)
+
+
+def get_clusters(zoom, bbox=None):
+    """
+    Clusters for one zoom level, optionally limited to the cells that
+    overlap a parsed bbox. A cell is kept even when its centroid lies
+    outside the bbox, since some of its markers may be inside.
+
+    Without a bbox, or at low zoom levels, the whole world is clustered and
+    cached until the markers generation moves (bumped by every marker
+    write). Otherwise only the region blocks (see regions.py) under the bbox
+    are clustered, each cached until a write bumps its region.
+    """
+    if bbox is None:
+        return _world_clusters(zoom)
+    aligned = _cell_aligned(zoom, bbox)
+    # Blocks at least four tiles wide, so a cell rarely straddles two of them.
+    for block_zoom in reversed([block_zoom for block_zoom in REGION_ZOOMS if block_zoom <= zoom - 2]):
+        blocks = _blocks(block_zoom, aligned)
+        if len(blocks) <= MAX_BLOCKS:
+            clusters = _block_clusters(zoom, block_zoom, blocks)
+            break
+    else:
+        clusters = _world_clusters(zoom)
+    return [cluster for cluster in clusters if box_in_bbox(cell_bounds(zoom, cluster['cell']), bbox)]
@@ -5,6 +5,7 @@ from rest_framework import viewsets, permissions
 from rest_framework.permissions import IsAuthenticated
 from .permissions import IsArchitectUser, IsGoldenUser
 from django.db import transaction, DatabaseError
+from .generations import bump_generation, MARKERS, MARKERS_RESET, MARKER_TILES
 
 
 class CompromisedViewSet(viewsets.ViewSet):
@@ -17,7 +18,9 @@ class CompromisedViewSet(viewsets.ViewSet):
 
         try:
 
-            marker_count, _ = Marker.objects.all().delete()
+            # Tombstones go too; syncing clients are told to start over.
+            marker_count, _ = Marker.all_objects.all().delete()
+            bump_generation(MARKERS, MARKERS_RESET, MARKER_TILES)
 
             entry_pw_count, _ = EntryPassword.objects.filter(is_active=True).delete()
 
@@ -0,0 +1,155 @@
+"""
+Serializer-free rendering of large read-only lists.
+
+compile_fields() turns the readable fields of a serializer into
+(key, values() lookup, converter factory) triples; views get them through
+fast_fields(), which compiles once, on first use. list_rows() then reads
+plain tuples with values_list() and converts only the columns whose
+representation differs from the database value. The rows equal the
+serializer's data, so views can hand them to Response unchanged.
+render_list() encodes them with the same options as JSONRenderer, for
+callers that cache the bytes.
+"""
+import functools
+import json
+import logging
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models import FileField as ModelFileField
+from django.utils.encoding import filepath_to_uri
+from django.utils import timezone
+from rest_framework import fields as drf_fields
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+# Fields whose representation is the database value itself.
+_PLAIN_FIELDS = (drf_fields.IntegerField, drf_fields.CharField, drf_fields.BooleanField, drf_fields.ChoiceField)
+
+_ENCODER = json.JSONEncoder(
+    ensure_ascii=JSONRenderer.ensure_ascii,
+    allow_nan=not JSONRenderer.strict,
+    separators=(',', ':') if JSONRenderer.compact else (', ', ': '),
+)
+
+
+def _file_name():
+    return lambda name: name or None
+
+
+def _float():
+    return float
+
+
+def _file_url(storage):
+    """
+    Converter factory for FileField URLs. For FileSystemStorage it joins
+    base_url and the quoted name directly; that is what urljoin() returns
+    unless the name has '.' or '..' segments, which go through storage.url().
+    """
+    def prepare():
+        base_url = storage.base_url if isinstance(storage, FileSystemStorage) else None
+        if not base_url or not base_url.endswith('/') or '?' in base_url or '#' in base_url:
+            return lambda name: storage.url(name) if name else None
+
+        def convert(name):
+            if not name:
+                return None
+            url = filepath_to_uri(name).lstrip('/')
+            if '.' in url and any(segment in ('.', '..') for segment in url.split('/')):
+                return storage.url(name)
+            return base_url + url
+        return convert
+    return prepare
+
+
+def _datetime():
+    """Converter factory for DateTimeField in the ISO 8601 format, in the current timezone."""
+    current = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def convert(value):
+        if not value:
+            return None
+        if current is not None and value.tzinfo is not None:
+            value = value.astimezone(current)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def compile_fields(serializer_class, model):
+    """
+    [(key, lookup, converter factory or None)] for the fields of
+    `serializer_class` that appear in its output. Factories run once per
+    render, so MEDIA_URL and the active timezone are read per request.
+    Raises ValueError for field types the fast path cannot reproduce
+    exactly.
+    """
+    compiled = []
+    for name, field in serializer_class().fields.items():
+        if field.write_only:
+            continue
+        lookup = field.source.replace('.', '__')
+        if isinstance(field, drf_fields.FileField):
+            if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+                compiled.append((name, lookup, _file_name))
+                continue
+            model_field = model._meta.get_field(field.source)
+            if not isinstance(model_field, ModelFileField):
+                raise ValueError(f'{name} is not backed by a model FileField.')
+            compiled.append((name, lookup, _file_url(model_field.storage)))
+        elif isinstance(field, drf_fields.DateTimeField):
+            if getattr(field, 'format', api_settings.DATETIME_FORMAT) != drf_fields.ISO_8601:
+                raise ValueError(f'{name} uses a custom datetime format.')
+            compiled.append((name, lookup, _datetime))
+        elif isinstance(field, drf_fields.FloatField):
+            compiled.append((name, lookup, _float))
+        elif isinstance(field, _PLAIN_FIELDS):
+            compiled.append((name, lookup, None))
+        else:
+            raise ValueError(f'{name} ({type(field).__name__}) has no fast representation.')
+    return compiled
+
+
+@functools.lru_cache(maxsize=None)
+def fast_fields(serializer_class, model):
+    """
+    compile_fields() of a serializer, compiled once on first use. None when
+    it has a field the fast path cannot reproduce; callers then serialize
+    as usual, so a new field never breaks the import or the view.
+    """
+    try:
+        return compile_fields(serializer_class, model)
+    except ValueError as e:
+        logger.warning('%s is rendered by the serializer: %s', serializer_class.__name__, e)
+        return None
+
+
+def list_rows(queryset, compiled):
+    """The queryset as the list of dicts the serializer would have returned."""
+    keys = [key for key, _, _ in compiled]
+    converters = [(index, prepare()) for index, (_, _, prepare) in enumerate(compiled) if prepare is not None]
+    items = []
+    for row in queryset.values_list(*(lookup for _, lookup, _ in compiled)):
+        if converters:
+            row = list(row)
+            for index, convert in converters:
+                if row[index] is not None:
+                    row[index] = convert(row[index])
+        items.append(dict(zip(keys, row)))
+    return items
+
+
+def render_list(queryset, compiled):
+    """JSON bytes of the queryset, equal to JSONRenderer's output for the serializer data."""
+    content = _ENCODER.encode(list_rows(queryset, compiled))
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def accepts_fast_json(request):
+    """True when the response would be rendered by JSONRenderer without indentation."""
+    return (isinstance(request.accepted_renderer, JSONRenderer)
+            and request.accepted_media_type == JSONRenderer.media_type)
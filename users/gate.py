@@ -0,0 +1,105 @@
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from .blacklist import get_blacklist, get_client_ip, trusted_proxies_from_settings
+
+logger = logging.getLogger(__name__)
+
+
+class BlacklistGate:
+    """
+    Rejects blacklisted clients before Django builds a request or runs any
+    middleware, answering exactly like IPBlacklistMiddleware: a 403 JSON
+    response for API requests and a 302 redirect for browser navigation.
+    Wrapped around the application in auth/wsgi.py and auth/asgi.py.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.blacklist = None
+        self.trusted_proxies = trusted_proxies_from_settings()
+        self.redirect_url = getattr(settings, 'BLACKLIST_REDIRECT_URL', None)
+        self.cors_origins = set(getattr(settings, 'CORS_ALLOWED_ORIGINS', ()))
+        self.json_body = json.dumps(
+            {'error': 'Access denied from this IP.', 'redirect_url': self.redirect_url}
+        ).encode()
+
+    def needs_refresh(self):
+        return self.blacklist is None or self.blacklist.is_due()
+
+    def refresh(self):
+        """
+        Loads the blacklist or syncs it when due. Runs outside Django's request
+        cycle, so it manages its own connection. If the database fails, the
+        gate keeps the list it has, or lets requests through until one loads.
+        """
+        close_old_connections()
+        try:
+            if self.blacklist is None:
+                self.blacklist = get_blacklist()
+            else:
+                self.blacklist.refresh_if_due()
+        except DatabaseError:
+            logger.exception('Could not refresh the IP blacklist')
+        finally:
+            close_old_connections()
+
+    def rejection(self, ip, path, accept, origin):
+        """Returns (status, headers, body) for a blacklisted client, None to let it through."""
+        if not ip or self.blacklist is None or ip not in self.blacklist:
+            return None
+
+        if 'application/json' in accept:
+            headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(self.json_body)))]
+            # The frontend must still be able to read the redirect_url.
+            if origin in self.cors_origins:
+                headers += [('Access-Control-Allow-Origin', origin), ('Access-Control-Allow-Credentials', 'true'),
+                            ('Vary', 'Origin')]
+            return 403, headers, self.json_body
+        if path.startswith(self.redirect_url):
+            return None
+        return 302, [('Location', self.redirect_url), ('Content-Length', '0')], b''
+
+
+class BlacklistWSGIGate(BlacklistGate):
+    STATUS_LINES = {302: '302 Found', 403: '403 Forbidden'}
+
+    def __call__(self, environ, start_response):
+        if self.redirect_url:
+            if self.needs_refresh():
+                self.refresh()
+            ip = get_client_ip(environ.get('REMOTE_ADDR'), environ.get('HTTP_X_FORWARDED_FOR'),
+                               self.trusted_proxies)
+            rejection = self.rejection(ip, environ.get('PATH_INFO', ''), environ.get('HTTP_ACCEPT', ''),
+                                       environ.get('HTTP_ORIGIN'))
+            if rejection:
+                status, headers, body = rejection
+                start_response(self.STATUS_LINES[status], headers)
+                return [body]
+        return self.application(environ, start_response)
+
+
+class BlacklistASGIGate(BlacklistGate):
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and self.redirect_url:
+            if self.needs_refresh():
+                await sync_to_async(self.refresh)()
+            headers = dict(scope.get('headers', ()))
+            client = scope.get('client')
+            forwarded_for = headers.get(b'x-forwarded-for', b'').decode('latin-1')
+            ip = get_client_ip(client[0] if client else None, forwarded_for, self.trusted_proxies)
+            rejection = self.rejection(ip, scope.get('path', ''), headers.get(b'accept', b'').decode('latin-1'),
+                                       headers.get(b'origin', b'').decode('latin-1'))
+            if rejection:
+                status, headers, body = rejection
+                await send({
+                    'type': 'http.response.start',
+                    'status': status,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+                })
+                await send({'type': 'http.response.body', 'body': body})
+                return
+        await self.application(scope, receive, send)
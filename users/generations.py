@@ -0,0 +1,38 @@
+from django.db.models import F
+from .models import Generation
+
+BLACKLIST = 'blacklist'
+BLACKLIST_RESET = 'blacklist-reset'
+BLACKLIST_NETWORKS = 'blacklist-networks'
+MARKERS = 'markers'
+MARKERS_RESET = 'markers-reset'
+MARKER_TILES = 'marker-tiles'
+MARKER_IMAGES = 'marker-images'
+
+
+def get_generations(*names):
+    """Returns {name: value} for the given counters in one query. Missing counters are 0."""
+    values = dict.fromkeys(names, 0)
+    values.update(Generation.objects.filter(name__in=names).values_list('name', 'value'))
+    return values
+
+
+def bump_generation(*names):
+    """Increments the given counters, creating them on first use."""
+    for name in names:
+        counter = Generation.objects.filter(name=name)
+        if counter.update(value=F('value') + 1):
+            continue
+        _, created = Generation.objects.get_or_create(name=name, defaults={'value': 1})
+        if not created:
+            counter.update(value=F('value') + 1)
+
+
+def bump_generations(names, batch_size=500):
+    """bump_generation for many counters: two queries per batch instead of one or more per name."""
+    names = sorted(set(names))
+    for start in range(0, len(names), batch_size):
+        batch = names[start:start + batch_size]
+        # Missing counters start at 0, so the UPDATE increments every one of them exactly once.
+        Generation.objects.bulk_create([Generation(name=name) for name in batch], ignore_conflicts=True)
+        Generation.objects.filter(name__in=batch).update(value=F('value') + 1)
@@ -0,0 +1,129 @@
+from functools import reduce
+from operator import or_
+from django.db.models import Q
+from . import geohash
+
+
+def normalize_lng(lng):
+    """Wraps a longitude into [-180, 180]."""
+    if -180 <= lng <= 180:
+        return lng
+    return (lng + 180) % 360 - 180
+
+
+def parse_bbox(value):
+    """
+    Parses "minLng,minLat,maxLng,maxLat" into a tuple of floats.
+    Longitudes are wrapped into [-180, 180], so minLng > maxLng means the box
+    crosses the antimeridian; a box 360 degrees wide or more covers every
+    longitude. Latitudes are clamped to [-90, 90].
+    Raises ValueError if the value is malformed.
+    """
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    except ValueError as e:
+        raise ValueError('bbox must be "minLng,minLat,maxLng,maxLat".') from e
+    if any(part != part or part in (float('inf'), float('-inf')) for part in (min_lng, min_lat, max_lng, max_lat)):
+        raise ValueError('bbox values must be finite numbers.')
+    if min_lat > max_lat:
+        raise ValueError('bbox minLat must not be greater than maxLat.')
+
+    if max_lng - min_lng >= 360:
+        min_lng, max_lng = -180.0, 180.0
+    else:
+        min_lng, max_lng = normalize_lng(min_lng), normalize_lng(max_lng)
+    return min_lng, max(min_lat, -90.0), max_lng, min(max_lat, 90.0)
+
+
+def bbox_q(bbox):
+    """Filter for markers inside a parsed bbox; a range scan on the (lat, lng) index."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    q = Q(lat__gte=min_lat, lat__lte=max_lat)
+    if min_lng <= max_lng:
+        return q & Q(lng__gte=min_lng, lng__lte=max_lng)
+    # Crosses the antimeridian: from minLng east to 180 and from -180 to maxLng.
+    return q & (Q(lng__gte=min_lng) | Q(lng__lte=max_lng))
+
+
+def in_bbox(lat, lng, bbox):
+    """Same test as bbox_q, for points already in memory."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    if not min_lat <= lat <= max_lat:
+        return False
+    if min_lng <= max_lng:
+        return min_lng <= lng <= max_lng
+    return lng >= min_lng or lng <= max_lng
+
+
+def box_in_bbox(box, bbox):
+    """True if a (minLng, minLat, maxLng, maxLat) box that does not cross the antimeridian overlaps a parsed bbox."""
+    box_min_lng, box_min_lat, box_max_lng, box_max_lat = box
+    min_lng, min_lat, max_lng, max_lat = bbox
+    if box_min_lat > max_lat or box_max_lat < min_lat:
+        return False
+    if min_lng <= max_lng:
+        return box_min_lng <= max_lng and box_max_lng >= min_lng
+    return box_max_lng >= min_lng or box_min_lng <= max_lng
+
+
+def point_geohash(lat, lng):
+    """Full-precision geohash of a marker position, '' when it has none or it is invalid."""
+    if lat is None or lng is None:
+        return ''
+    try:
+        return geohash.encode(lat, lng)
+    except ValueError:
+        return ''
+
+
+def geohash_prefix_q(prefixes):
+    """Markers inside any of the cells; each prefix is a range scan on the geohash index."""
+    return reduce(or_, (Q(geohash__startswith=prefix) for prefix in prefixes))
+
+
+def parse_point(value):
+    """Parses "lat,lng". Raises ValueError if malformed or out of range."""
+    try:
+        lat, lng = (float(part) for part in value.split(','))
+    except ValueError as e:
+        raise ValueError('near must be "lat,lng".') from e
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('near is out of range.')
+    return lat, lng
+
+
+def nearby(queryset, lat, lng, radius_m):
+    """
+    Markers within radius_m of a point, closest first. The covering geohash
+    cells narrow the query with index range scans; distances are exact.
+    """
+    candidates = queryset.filter(geohash_prefix_q(geohash.covering_cells(lat, lng, radius_m)))
+    in_range = []
+    for marker in candidates:
+        distance = geohash.haversine_m(lat, lng, marker.lat, marker.lng)
+        if distance <= radius_m:
+            in_range.append((distance, marker))
+    in_range.sort(key=lambda item: item[0])
+    return [marker for _, marker in in_range]
+
+
+def backfill_geohashes(model, batch_size=1000, only_missing=True):
+    """Computes the geohash of existing markers in primary key batches. Returns the rows updated."""
+    queryset = model.objects.order_by('pk')
+    if only_missing:
+        queryset = queryset.filter(geohash='')
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).only('pk', 'lat', 'lng', 'geohash')[:batch_size])
+        if not batch:
+            return updated
+        changed = []
+        for marker in batch:
+            value = point_geohash(marker.lat, marker.lng)
+            if value != marker.geohash:
+                marker.geohash = value
+                changed.append(marker)
+        model.objects.bulk_update(changed, ['geohash'])
+        updated += len(changed)
+        last_pk = batch[-1].pk
@@ -0,0 +1,111 @@
+"""
+Geohash encoding. A geohash names a lat/lng cell, and every prefix names
+the enclosing larger cell, so "markers in a cell" becomes a prefix (range)
+scan on an ordinary B-tree index, without spatial extensions.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {char: index for index, char in enumerate(BASE32)}
+MAX_PRECISION = 12
+EARTH_RADIUS_M = 6371008.8
+
+
+def encode(lat, lng, precision=MAX_PRECISION):
+    """Returns the geohash of a point. Raises ValueError for out-of-range coordinates."""
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f'({lat}, {lng}) is not a valid coordinate.')
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        current, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (current[0] + current[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            current[0] = middle
+        else:
+            current[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def decode_bbox(geohash):
+    """Returns (min_lat, min_lng, max_lat, max_lng) of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        try:
+            value = _DECODE[char]
+        except KeyError as e:
+            raise ValueError(f'{geohash!r} is not a valid geohash.') from e
+        for shift in range(4, -1, -1):
+            current = lng_range if even else lat_range
+            middle = (current[0] + current[1]) / 2
+            if value >> shift & 1:
+                current[0] = middle
+            else:
+                current[1] = middle
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a cell at the given precision."""
+    bits = precision * 5
+    lng_bits = (bits + 1) // 2
+    return 180 / 2 ** (bits - lng_bits), 360 / 2 ** lng_bits
+
+
+def is_valid(geohash):
+    return 0 < len(geohash) <= MAX_PRECISION and all(char in _DECODE for char in geohash)
+
+
+def covering_cells(lat, lng, radius_m):
+    """
+    Geohash prefixes whose cells together cover the circle around a point:
+    the cell containing it and its neighbours, at the finest precision
+    where a cell is still larger than the radius.
+    """
+    radius_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    radius_lng = min(radius_lat / cos_lat, 180)
+
+    precision = MAX_PRECISION
+    while precision > 1:
+        height, width = cell_size(precision)
+        if height >= radius_lat and width >= radius_lng:
+            break
+        precision -= 1
+    height, width = cell_size(precision)
+    if precision == 1 and (height < radius_lat or width < radius_lng):
+        return ['']
+
+    cells = set()
+    for d_lat in (-height, 0, height):
+        for d_lng in (-width, 0, width):
+            neighbour_lat = lat + d_lat
+            if not -90 <= neighbour_lat <= 90:
+                continue
+            neighbour_lng = (lng + d_lng + 180) % 360 - 180
+            cells.add(encode(neighbour_lat, neighbour_lng, precision))
+    return sorted(cells)
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
@@ -1,11 +1,24 @@
-from rest_framework import viewsets, permissions
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from .models import Invite
-from .serializers import InviteSerializer 
+from .models import Invite, Role
+from .serializers import InviteSerializer
+from .streaming import chunked, iter_csv_rows, iter_json_array, until_error
+from .fast_render import fast_fields, list_rows
 
 User = get_user_model()
 
+BULK_INVITE_CHUNK_SIZE = 500
+
+
 class InviteViewSet(viewsets.ModelViewSet):
     serializer_class = InviteSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -13,8 +26,121 @@ class InviteViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return User.objects.filter(role="MASON")
 
-    def perform_create(self, serializer):
-        user = self.request.user
+    def list(self, request, *args, **kwargs):
+        fields = fast_fields(InviteSerializer, User)
+        if self.paginator is not None or fields is None:
+            return super().list(request, *args, **kwargs)
+        # Same data as the serializer, without per-field serializer calls.
+        return Response(list_rows(self.filter_queryset(self.get_queryset()), fields))
+
+    def check_can_invite(self, user):
         if user.role not in ["GOLDEN", "ARCHITECT"]:
             raise PermissionDenied("You do not have permission to invite users.")
-        serializer.save(invited_by=user)
\ No newline at end of file
+
+    def perform_create(self, serializer):
+        user = self.request.user
+        self.check_can_invite(user)
+        serializer.save(invited_by=user)
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[MultiPartParser])
+    def bulk(self, request):
+        """
+        Invites every email of an uploaded .csv (with an "email" column) or .json list.
+        The file is read row by row and the results are streamed back as NDJSON,
+        one line per row followed by a summary line.
+        """
+        self.check_can_invite(request.user)
+
+        invites_file = request.FILES.get('invites_file')
+        if not invites_file or not invites_file.name.endswith(('.csv', '.json')):
+            return Response(
+                {"error": "No .csv or .json file provided."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if invites_file.name.endswith('.csv'):
+            emails = (row.get('email') for row in iter_csv_rows(invites_file))
+        else:
+            emails = (
+                item.get('email') if isinstance(item, dict) else item
+                for item in iter_json_array(invites_file)
+            )
+
+        return StreamingHttpResponse(
+            self._stream_bulk_invites(emails, request.user),
+            content_type='application/x-ndjson'
+        )
+
+    def _stream_bulk_invites(self, emails, inviter):
+        summary = {'invited': 0, 'exists': 0, 'invalid': 0}
+        errors = []
+        # Rows parsed before a malformed part of the file are still invited.
+        for chunk in chunked(enumerate(until_error(emails, errors), start=1), BULK_INVITE_CHUNK_SIZE):
+            for result in self._invite_chunk(chunk, inviter):
+                summary[result['status']] += 1
+                yield json.dumps(result) + '\n'
+        for error in errors:
+            yield json.dumps({'error': error}) + '\n'
+        yield json.dumps({'summary': summary}) + '\n'
+
+    def _invite_chunk(self, chunk, inviter):
+        """Validates one chunk with a single IN query and bulk-creates the new users."""
+        results = []
+        valid_emails = []
+        for row, email in chunk:
+            email = email.strip() if isinstance(email, str) else ''
+            try:
+                validate_email(email)
+            except DjangoValidationError:
+                results.append({'row': row, 'email': email, 'status': 'invalid',
+                                'error': 'Enter a valid email address.'})
+                continue
+            results.append({'row': row, 'email': email, 'status': 'invited'})
+            valid_emails.append(email)
+
+        # Emails are unique regardless of case (MariaDB's collation ignores it).
+        taken = self._taken_emails(valid_emails)
+        new_results = []
+        for result in results:
+            if result['status'] != 'invited':
+                continue
+            email = result['email'].lower()
+            if email in taken:
+                _mark_exists(result)
+            else:
+                taken.add(email)
+                new_results.append(result)
+
+        try:
+            with transaction.atomic():
+                self._create_invites([result['email'] for result in new_results], inviter)
+        except IntegrityError:
+            # Taken after the check, e.g. by a concurrent invite: retry row by row.
+            for result in new_results:
+                try:
+                    with transaction.atomic():
+                        self._create_invites([result['email']], inviter)
+                except IntegrityError:
+                    _mark_exists(result)
+        return results
+
+    def _taken_emails(self, emails):
+        """
+        The lowercased emails of `emails` that already belong to a user. The
+        lowercased variants catch stored lowercase emails on backends whose
+        collation is case-sensitive, while the IN query keeps using the index.
+        """
+        candidates = set(emails) | {email.lower() for email in emails}
+        return {email.lower() for email in User.objects.filter(email__in=candidates).values_list('email', flat=True)}
+
+    def _create_invites(self, emails, inviter):
+        User.objects.bulk_create([User(email=email, role=Role.MASON) for email in emails])
+        Invite.objects.bulk_create(
+            [Invite(email=email, invited_by=inviter) for email in emails],
+            ignore_conflicts=True
+        )
+
+
+def _mark_exists(result):
+    result['status'] = 'exists'
+    result['error'] = 'email already exists'
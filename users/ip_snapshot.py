@@ -0,0 +1,131 @@
+"""
+Compact on-disk blacklist table shared by every worker on a host.
+
+The file holds a header and sorted, disjoint, inclusive intervals of
+128-bit keys (see users.ip_matcher), each stored as two 16-byte big-endian
+integers so that bytes comparison equals numeric comparison. Workers mmap
+it read-only and binary-search the buffer, so the table is paid for once
+per host. Writers build a new file and atomically rename it over the old one.
+"""
+import mmap
+import os
+import struct
+import tempfile
+from bisect import bisect_right
+from .ip_matcher import ip_to_int, merge_ranges
+
+MAGIC = b'IPBL'
+FORMAT_VERSION = 1
+KEY_SIZE = 16
+RECORD_SIZE = 2 * KEY_SIZE
+# magic, format version, generation count, record count, then the generations.
+_HEADER = struct.Struct('>4sIIQ')
+MAX_GENERATIONS = 8
+# Every n-th start key is copied into a small in-memory index so that most
+# of the binary search runs in C over a list instead of over the mapping.
+INDEX_STRIDE = 64
+
+
+def _header_size(generation_count):
+    return _HEADER.size + 8 * generation_count
+
+
+def write_snapshot(path, ranges, generations=()):
+    """
+    Merges (start, end) key pairs and atomically replaces the snapshot at `path`.
+    `generations` is stored in the header to tell how fresh the table is.
+    """
+    starts, ends = merge_ranges(ranges)
+    generations = tuple(generations)
+    if len(generations) > MAX_GENERATIONS:
+        raise ValueError(f'At most {MAX_GENERATIONS} generations fit in the header.')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.blacklist-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as snapshot_file:
+            snapshot_file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(generations), len(starts)))
+            snapshot_file.write(struct.pack(f'>{len(generations)}Q', *generations))
+            for start, end in zip(starts, ends):
+                snapshot_file.write(start.to_bytes(KEY_SIZE, 'big') + end.to_bytes(KEY_SIZE, 'big'))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return len(starts)
+
+
+class _Keys:
+    """Sequence view of one key column of the mmapped records, for bisect."""
+
+    def __init__(self, buffer, offset, count, column):
+        self.buffer = buffer
+        self.offset = offset + column * KEY_SIZE
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start = self.offset + index * RECORD_SIZE
+        return self.buffer[start:start + KEY_SIZE]
+
+
+class IPSnapshot:
+    """
+    Read-only mmapped snapshot. `ip in snapshot` accepts an address string
+    or a 128-bit key. Raises ValueError if the file is not a valid snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as snapshot_file:
+            stat = os.fstat(snapshot_file.fileno())
+            self.file_id = (stat.st_ino, stat.st_mtime_ns)
+            # Closing the file keeps the mapping; the mapping is released with this object.
+            self.buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.buffer) < _HEADER.size:
+            raise ValueError(f'{path} is not a blacklist snapshot.')
+        magic, version, generation_count, count = _HEADER.unpack_from(self.buffer)
+        header_size = _header_size(generation_count)
+        if (magic != MAGIC or version != FORMAT_VERSION
+                or len(self.buffer) != header_size + count * RECORD_SIZE):
+            raise ValueError(f'{path} is not a blacklist snapshot.')
+
+        self.generations = struct.unpack_from(f'>{generation_count}Q', self.buffer, _HEADER.size)
+        self.starts = _Keys(self.buffer, header_size, count, 0)
+        self.ends = _Keys(self.buffer, header_size, count, 1)
+        self.index = [self.starts[i] for i in range(0, count, INDEX_STRIDE)]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, ip):
+        if not self.starts.count:
+            return False
+        if not isinstance(ip, int):
+            try:
+                ip = ip_to_int(ip)
+            except ValueError:
+                return False
+        key = ip.to_bytes(KEY_SIZE, 'big')
+        low = max(bisect_right(self.index, key) - 1, 0) * INDEX_STRIDE
+        high = min(low + INDEX_STRIDE, self.starts.count)
+        index = bisect_right(self.starts, key, low, high) - 1
+        return index >= 0 and key <= self.ends[index]
+
+    def is_current(self):
+        """False once the file at `path` was replaced by a newer snapshot."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns) == self.file_id
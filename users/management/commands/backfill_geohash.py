@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from users.geo import backfill_geohashes
+from users.models import Marker
+
+
+class Command(BaseCommand):
+    help = "Computes Marker.geohash for rows written without Marker.save (bulk imports, raw SQL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help="Recompute every marker, not only missing ones.")
+
+    def handle(self, *args, **options):
+        updated = backfill_geohashes(Marker, batch_size=options['batch_size'], only_missing=not options['all'])
+        self.stdout.write(self.style.SUCCESS(f"Updated the geohash of {updated} markers."))
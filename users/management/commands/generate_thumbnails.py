@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from users.models import Marker
+from users.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Renders the thumbnail and medium variants of Marker.image for markers that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-render every marker with an image.")
+
+    def handle(self, *args, **options):
+        markers = Marker.objects.exclude(Q(image='') | Q(image__isnull=True))
+        if not options['all']:
+            markers = markers.filter(Q(thumbnail='') | Q(thumbnail__isnull=True))
+        generated = 0
+        for marker_id in markers.order_by('pk').values_list('pk', flat=True).iterator():
+            try:
+                generated += generate_thumbnails(marker_id)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"Marker {marker_id}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {generated} markers."))
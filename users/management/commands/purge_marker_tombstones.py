@@ -0,0 +1,15 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from users.marker_changes import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = "Removes marker tombstones older than MARKER_TOMBSTONE_RETENTION_DAYS (or --days)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None)
+
+    def handle(self, *args, **options):
+        older_than = timedelta(days=options['days']) if options['days'] is not None else None
+        purged = purge_tombstones(older_than)
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} marker tombstones."))
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from users.backup_jobs import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Runs queued marker restore jobs one at a time; with --once, exits when there is nothing to run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true')
+        parser.add_argument('--poll', type=float, default=5.0, help="Seconds between checks for new jobs.")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job()
+            if job is None:
+                if options['once']:
+                    return
+                # Don't hold a connection the database may drop while idle.
+                close_old_connections()
+                time.sleep(options['poll'])
+                continue
+            if run_job(job):
+                self.stdout.write(self.style.SUCCESS(f"Restore job {job.pk}: {job.rows_processed} markers restored."))
+            else:
+                self.stdout.write(self.style.ERROR(f"Restore job {job.pk} failed: {job.error}"))
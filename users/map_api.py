@@ -1,37 +1,302 @@
+import json
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import viewsets, permissions
 from .models import Marker
 from .serializers import MarkerSerializer
 from .permissions import IsSilverUser, IsGoldenUser, IsArchitectUser
+from .geo import parse_bbox, bbox_q, parse_point, nearby, geohash_prefix_q, point_geohash
+from . import geohash
+from .clusters import get_clusters, CLUSTER_MAX_ZOOM
+from .generations import get_generations, bump_generation, MARKERS, MARKER_IMAGES
+from . import tiles
+from .spatial_index import marker_index
+from .thumbnails import schedule_thumbnails
+from .uploads import MarkerImageUploadHandler, store_images
+from .marker_changes import changes_since, CursorExpired
+from .fast_render import fast_fields, list_rows, render_list, accepts_fast_json
+
+MAX_NEAR_RADIUS_M = 500_000
+MAX_NEARBY_K = 100
+LIST_CACHE_TIMEOUT = 60 * 60
+MAX_BULK_MARKERS = 200
+
+
+def marker_list_content():
+    """
+    Rendered JSON of the unfiltered marker list. Cached under the markers
+    generation (bumped by every marker write) and the images generation
+    (bumped when thumbnails are added), so a write is never followed by
+    a stale read.
+    """
+    generations = get_generations(MARKERS, MARKER_IMAGES)
+    key = f'marker-list:{generations[MARKERS]}:{generations[MARKER_IMAGES]}'
+    content = cache.get(key)
+    if content is None:
+        fields = fast_fields(MarkerSerializer, Marker)
+        if fields is None:
+            content = JSONRenderer().render(MarkerSerializer(Marker.objects.all(), many=True).data)
+        else:
+            content = render_list(Marker.objects.all(), fields)
+        cache.set(key, content, LIST_CACHE_TIMEOUT)
+    return content
+
 
 class MarkerView (viewsets.ViewSet):
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Multipart bodies are checked and spooled to disk while they stream in.
+        if request.method == 'POST':
+            max_files = MAX_BULK_MARKERS if self.action_map.get('post') == 'bulk' else 1
+            request.upload_handlers = [MarkerImageUploadHandler(request, max_files=max_files)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action in ('create', 'bulk'):
             permission_classes = [permissions.IsAuthenticated, IsSilverUser |
                                   IsGoldenUser | IsArchitectUser]
-        elif self.action == 'destroy':
+        elif self.action in ('destroy', 'bulk_destroy'):
             permission_classes = [permissions.IsAuthenticated, IsGoldenUser | IsArchitectUser]
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
     def list (self, request):
+        """
+        All markers, or only those inside ?bbox=minLng,minLat,maxLng,maxLat,
+        inside the geohash cell ?cell=<prefix>, or within ?radius= meters
+        of ?near=lat,lng (closest first).
+        Below CLUSTER_MAX_ZOOM, ?zoom= returns grid clusters instead.
+        """
+        if not request.query_params and accepts_fast_json(request):
+            return HttpResponse(marker_list_content(), content_type='application/json', status=200)
+
         markers = Marker.objects.all()
-        serializer = MarkerSerializer(markers, many=True)
-        return Response(serializer.data, status=200)
+        bbox = request.query_params.get('bbox')
+        zoom = request.query_params.get('zoom')
+        try:
+            bbox = parse_bbox(bbox) if bbox else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        if zoom is not None:
+            if not zoom.isdigit():
+                return Response({'error': 'zoom must be a non-negative integer.'}, status=400)
+            zoom = int(zoom)
+
+        if zoom is not None and zoom < CLUSTER_MAX_ZOOM:
+            return Response({'zoom': zoom, 'clusters': get_clusters(zoom, bbox)}, status=200)
+
+        if bbox:
+            markers = markers.filter(bbox_q(bbox))
+
+        cell = request.query_params.get('cell')
+        if cell:
+            if not geohash.is_valid(cell):
+                return Response({'error': 'cell must be a geohash of at most 12 characters.'}, status=400)
+            markers = markers.filter(geohash_prefix_q([cell]))
+
+        near = request.query_params.get('near')
+        if near:
+            try:
+                lat, lng = parse_point(near)
+                radius = float(request.query_params.get('radius', 1000))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=400)
+            if not 0 < radius <= MAX_NEAR_RADIUS_M:
+                return Response({'error': f'radius must be between 0 and {MAX_NEAR_RADIUS_M} meters.'}, status=400)
+            return Response(MarkerSerializer(nearby(markers, lat, lng, radius), many=True).data, status=200)
+
+        fields = fast_fields(MarkerSerializer, Marker)
+        if fields is None:
+            return Response(MarkerSerializer(markers, many=True).data, status=200)
+        return Response(list_rows(markers, fields), status=200)
+
+    @action(detail=False, methods=['get'], url_path=r'tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)')
+    def tile(self, request, z, x, y):
+        """
+        GeoJSON FeatureCollection of one z/x/y map tile: cluster points with a
+        count below CLUSTER_MAX_ZOOM, markers from there on. Answers 304 when
+        If-None-Match carries the current ETag.
+        """
+        z, x, y = int(z), int(x), int(y)
+        if not tiles.is_valid_tile(z, x, y):
+            return Response({'error': f'No such tile; zoom goes up to {tiles.MAX_TILE_ZOOM}.'}, status=404)
+        etag, body = tiles.get_tile(z, x, y)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(body, content_type='application/geo+json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        The ?k= (default 10) markers closest to ?lat=&lng=, closest first, each
+        with its distance in meters; ?radius= also drops markers farther away.
+        """
+        try:
+            lat, lng = parse_point(f"{request.query_params.get('lat')},{request.query_params.get('lng')}")
+            k = int(request.query_params.get('k', 10))
+            radius = request.query_params.get('radius')
+            radius = float(radius) if radius is not None else None
+        except ValueError:
+            return Response({'error': 'lat and lng must be valid coordinates, k an integer and radius a number.'},
+                            status=400)
+        if not 0 < k <= MAX_NEARBY_K:
+            return Response({'error': f'k must be between 1 and {MAX_NEARBY_K}.'}, status=400)
+        if radius is not None and not 0 < radius <= MAX_NEAR_RADIUS_M:
+            return Response({'error': f'radius must be between 0 and {MAX_NEAR_RADIUS_M} meters.'}, status=400)
+
+        if radius is None:
+            found = marker_index.nearest(lat, lng, k)
+        else:
+            found = marker_index.within(lat, lng, radius)[:k]
+        markers = Marker.objects.in_bulk([marker_id for marker_id, _ in found])
+        data = []
+        for marker_id, distance in found:
+            if marker_id in markers:
+                item = MarkerSerializer(markers[marker_id]).data
+                item['distance'] = round(distance, 1)
+                data.append(item)
+        return Response(data, status=200)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Markers created, updated or deleted after ?since=<cursor>, oldest
+        first, up to one page; without since, every live marker. Pass the
+        returned cursor back while has_more is true. 410 means the cursor
+        expired and the client has to reload the full list.
+        """
+        try:
+            upserts, deletions, cursor, has_more = changes_since(request.query_params.get('since'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        except CursorExpired:
+            return Response({'error': 'since has expired; reload all markers.'}, status=410)
+        return Response({
+            'upserts': MarkerSerializer(upserts, many=True).data,
+            'deletions': deletions,
+            'cursor': cursor,
+            'has_more': has_more,
+        }, status=200)
 
     def create(self, request):
-        serializer = MarkerSerializer(data=request.data)
+        data = request.data
+        upload_error = getattr(request, 'upload_error', None)
+        if upload_error:
+            message, status = upload_error
+            return Response({'error': message}, status=status)
+        serializer = MarkerSerializer(data=data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            # The post_save signal moves the caches and the index past the new marker.
+            marker = serializer.save(user=request.user)
+            if marker.image:
+                schedule_thumbnails(marker.id)
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates up to MAX_BULK_MARKERS markers in one transaction. The body is
+        a JSON list of markers, or multipart with that list in `markers` and
+        the image of the n-th marker in `image_<n>`. Nothing is created if any
+        marker is invalid.
+        """
+        data = request.data
+        upload_error = getattr(request, 'upload_error', None)
+        if upload_error:
+            message, status = upload_error
+            return Response({'error': message}, status=status)
+        items = data
+        if 'markers' in getattr(data, 'keys', lambda: ())():
+            try:
+                items = json.loads(data['markers'])
+            except ValueError:
+                return Response({'error': 'markers must be a JSON list.'}, status=400)
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of markers.'}, status=400)
+        if len(items) > MAX_BULK_MARKERS:
+            return Response({'error': f'At most {MAX_BULK_MARKERS} markers per request.'}, status=400)
+        items = [
+            {**item, 'image': request.FILES[f'image_{index}']}
+            if isinstance(item, dict) and f'image_{index}' in request.FILES else item
+            for index, item in enumerate(items)
+        ]
+
+        serializer = MarkerSerializer(data=items, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        markers = []
+        for fields in serializer.validated_data:
+            marker = Marker(**{**fields, 'user': request.user})
+            # bulk_create does not call Marker.save.
+            marker.geohash = point_geohash(marker.lat, marker.lng)
+            markers.append(marker)
+
+        stored = store_images(markers)
+        for marker in markers:
+            marker.content_hash = marker.compute_content_hash()
+        bulk_insert = connection.features.can_return_rows_from_bulk_insert
+        try:
+            with transaction.atomic():
+                if bulk_insert:
+                    Marker.objects.bulk_create(markers)
+                else:
+                    # MySQL cannot return the new ids from a multi-row INSERT.
+                    for marker in markers:
+                        marker.save()
+        except Exception:
+            for name in stored:
+                Marker._meta.get_field('image').storage.delete(name)
+            raise
+
+        if bulk_insert:
+            # bulk_create sends no post_save signal; markers saved one by one went through it.
+            bump_generation(MARKERS)
+            tiles.invalidate_points([(marker.lat, marker.lng) for marker in markers])
+            marker_index.add(*((marker.id, marker.lat, marker.lng) for marker in markers))
+        for marker in markers:
+            if marker.image:
+                schedule_thumbnails(marker.id)
+        return Response(MarkerSerializer(markers, many=True).data, status=201)
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        """Deletes the markers listed in {"ids": [...]} with one UPDATE; reports ids that were not found."""
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return Response({'error': 'ids must be a non-empty list of integers.'}, status=400)
+        if len(ids) > MAX_BULK_MARKERS:
+            return Response({'error': f'At most {MAX_BULK_MARKERS} markers per request.'}, status=400)
+
+        with transaction.atomic():
+            found = list(Marker.objects.select_for_update().filter(pk__in=ids).values_list('id', 'lat', 'lng'))
+            now = timezone.now()
+            deleted = Marker.objects.filter(pk__in=[row[0] for row in found]).update(
+                deleted_at=now, updated_at=now, content_hash=None)
+        if deleted:
+            bump_generation(MARKERS)
+            tiles.invalidate_points([(lat, lng) for _, lat, lng in found])
+            marker_index.remove(*(row[0] for row in found))
+        found_ids = {row[0] for row in found}
+        return Response({
+            'deleted': deleted,
+            'not_found': sorted(set(ids) - found_ids),
+        }, status=200)
+
     def destroy(self, request, pk=None):
         try:
-            marker = Marker.objects.get(pk=pk)
-            marker.delete()
+            # The post_save signal drops the tombstone from the caches and the index.
+            Marker.objects.get(pk=pk).delete()
             return Response({'message': 'Marker deleted successfully'}, status=204)
         except Marker.DoesNotExist:
             return Response({'error': 'Marker not found'}, status=404)
\ No newline at end of file
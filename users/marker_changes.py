@@ -0,0 +1,101 @@
+"""
+Delta sync of markers for clients that already hold the map.
+
+Every marker write moves its updated_at, and deletions leave a tombstone
+(deleted_at), so "what changed since X" is a range scan of the
+(updated_at, id) index. The cursor is that pair for the last row a client
+received, plus the markers-reset generation: a cursor from before a
+compromise wipe, or older than the tombstone retention, is expired and the
+client has to fetch the full list again.
+"""
+import base64
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .generations import get_generations, MARKERS_RESET
+from .models import Marker
+
+PAGE_SIZE = 500
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class CursorExpired(Exception):
+    """The cursor is older than what the tombstones can still tell."""
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'MARKER_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+def settle_delay():
+    """
+    Rows newer than this are held back: a transaction that started earlier
+    can still commit a smaller updated_at than a row already handed out.
+    """
+    return timedelta(seconds=getattr(settings, 'MARKER_CHANGES_SETTLE_SECONDS', 2))
+
+
+def encode_cursor(reset, updated_at, marker_id):
+    micros = (updated_at - _EPOCH) // _MICROSECOND
+    return base64.urlsafe_b64encode(f'{reset}:{micros}:{marker_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (reset generation, updated_at, id). Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        reset, micros, marker_id = (int(part) for part in raw.split(':'))
+        updated_at = _EPOCH + micros * _MICROSECOND
+    except (ValueError, UnicodeDecodeError, OverflowError, OSError) as e:
+        raise ValueError('since is not a valid cursor.') from e
+    return reset, updated_at, marker_id
+
+
+def changed_after(cursor, reset, now):
+    """
+    Markers, tombstones included, changed after `cursor` and settled by
+    `now`. Raises CursorExpired and ValueError.
+    """
+    cursor_reset, updated_at, marker_id = decode_cursor(cursor)
+    if cursor_reset != reset or updated_at < now - retention():
+        raise CursorExpired()
+    return Marker.all_objects.filter(
+        Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=marker_id),
+        updated_at__lte=now - settle_delay(),
+    )
+
+
+def changes_since(cursor=None, limit=None):
+    """
+    Returns (upserted markers, deleted ids, next cursor, has_more) for up to
+    `limit` (PAGE_SIZE) changes after the cursor, or from the beginning without one.
+    Raises CursorExpired and ValueError.
+    """
+    limit = limit or PAGE_SIZE
+    reset = get_generations(MARKERS_RESET)[MARKERS_RESET]
+    now = timezone.now()
+    if cursor:
+        rows = changed_after(cursor, reset, now)
+    else:
+        # Nothing to delete on a client that has nothing yet.
+        rows = Marker.objects.filter(updated_at__lte=now - settle_delay())
+
+    page = list(rows.order_by('updated_at', 'id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    upserts = [marker for marker in page if marker.deleted_at is None]
+    deletions = [marker.id for marker in page if marker.deleted_at is not None]
+    if page:
+        next_cursor = encode_cursor(reset, page[-1].updated_at, page[-1].id)
+    else:
+        next_cursor = cursor or encode_cursor(reset, now - settle_delay(), 0)
+    return upserts, deletions, next_cursor, has_more
+
+
+def purge_tombstones(older_than=None):
+    """Removes tombstones older than the retention for good. Returns how many."""
+    horizon = timezone.now() - (older_than if older_than is not None else retention())
+    deleted, _ = Marker.all_objects.filter(updated_at__lt=horizon, deleted_at__isnull=False).delete()
+    return deleted
@@ -1,20 +1,28 @@
 from django.http import HttpResponseRedirect, JsonResponse
 from django.conf import settings
-from .models import BlacklistedIP
+from .blacklist import get_blacklist, get_client_ip, trusted_proxies_from_settings
 
 class IPBlacklistMiddleware:
     """
     Checks incoming requests against the IP blacklist.
     for browser navigation, sends a 302 redirect.
     for API requests (ajax/fetch), sends a 403 JSON response.
+    The blacklist refreshes itself when a ban is added or removed (see users.blacklist);
+    it is the same per-process copy BlacklistGate uses.
     """
     def __init__(self, get_response):
         self.get_response = get_response
-        self.blacklist = set(BlacklistedIP.objects.values_list('ip_address', flat=True))
+        self.blacklist = get_blacklist()
+        self.trusted_proxies = trusted_proxies_from_settings()
         self.redirect_url = getattr(settings, 'BLACKLIST_REDIRECT_URL', None)
 
     def __call__(self, request):
-        ip = request.META.get('REMOTE_ADDR')
+        self.blacklist.refresh_if_due()
+        ip = get_client_ip(
+            request.META.get('REMOTE_ADDR'),
+            request.META.get('HTTP_X_FORWARDED_FOR'),
+            self.trusted_proxies
+        )
 
         if ip and self.redirect_url and ip in self.blacklist:
             is_api_request = 'application/json' in request.headers.get('Accept', '')
@@ -31,7 +39,5 @@ class IPBlacklistMiddleware:
         response = self.get_response(request)
         return response
 
-    # I can call this later via signals to refresh the list
-    # without restarting the server.
     def update_blacklist(self):
-        self.blacklist = set(BlacklistedIP.objects.values_list('ip_address', flat=True))
\ No newline at end of file
+        self.blacklist.reload()
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:45
+
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_generation_blacklistedip_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlacklistedNetwork',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('network', models.CharField(help_text='CIDR network such as 10.0.0.0/20 or a range such as 10.0.0.1-10.0.0.99', max_length=100, unique=True, validators=[users.models.validate_ip_range])),
+                ('reason', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Blacklisted Network',
+                'verbose_name_plural': 'Blacklisted Networks',
+                'db_table': 'blacklisted_networks',
+            },
+        ),
+    ]
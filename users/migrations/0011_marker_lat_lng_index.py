@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_blacklistednetwork'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='marker',
+            index=models.Index(fields=['lat', 'lng'], name='markers_lat_lng_idx'),
+        ),
+    ]
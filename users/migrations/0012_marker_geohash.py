@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(lat, lng, precision=12):
+    """The geohash of a point as users.geohash.encode computed it for this migration."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        current, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (current[0] + current[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            current[0] = middle
+        else:
+            current[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def backfill(apps, schema_editor):
+    Marker = apps.get_model('users', 'Marker')
+    queryset = Marker.objects.filter(lat__isnull=False, lng__isnull=False, lat__gte=-90, lat__lte=90,
+                                     lng__gte=-180, lng__lte=180).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).only('pk', 'lat', 'lng')[:1000])
+        if not batch:
+            return
+        for marker in batch:
+            marker.geohash = encode_geohash(marker.lat, marker.lng)
+        Marker.objects.bulk_update(batch, ['geohash'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_marker_lat_lng_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marker',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Geohash of lat/lng, kept in sync on save', max_length=12),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
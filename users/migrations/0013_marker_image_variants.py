@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_marker_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marker',
+            name='medium',
+            field=models.ImageField(blank=True, editable=False, help_text='Medium copy of image without EXIF, generated after upload', null=True, upload_to='marker_photos/variants/'),
+        ),
+        migrations.AddField(
+            model_name='marker',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, help_text='Small copy of image without EXIF, generated after upload', null=True, upload_to='marker_photos/variants/'),
+        ),
+    ]
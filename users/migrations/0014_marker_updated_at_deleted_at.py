@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_marker_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marker',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='marker',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Set instead of deleting the row, so clients syncing changes see the deletion', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='marker',
+            index=models.Index(fields=['updated_at', 'id'], name='markers_updated_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:17
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def content_hash(name, lat, lng, image):
+    """users.models.marker_content_hash as of this migration."""
+    content = [str(name), None if lat is None else float(lat), None if lng is None else float(lng), image or '']
+    return hashlib.sha256(json.dumps(content, separators=(',', ':')).encode()).hexdigest()
+
+
+def backfill(apps, schema_editor):
+    Marker = apps.get_model('users', 'Marker')
+    queryset = Marker.objects.filter(deleted_at__isnull=True, content_hash__isnull=True).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).values_list('pk', 'name', 'lat', 'lng', 'image')[:1000])
+        if not batch:
+            return
+        Marker.objects.bulk_update(
+            [Marker(pk=pk, content_hash=content_hash(name, lat, lng, image)) for pk, name, lat, lng, image in batch],
+            ['content_hash'])
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_backup_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marker',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='marker_content_hash of a live marker, so restores skip markers that exist; cleared on delete', max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
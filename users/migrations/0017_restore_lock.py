@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:28
+
+from django.db import migrations, models
+
+
+def create_lock_row(apps, schema_editor):
+    apps.get_model('users', 'RestoreLock').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_marker_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestoreLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'db_table': 'restore_locks',
+            },
+        ),
+        migrations.RunPython(create_lock_row, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,13 @@
+import hashlib
+import json
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
+from django.core.exceptions import ValidationError
 from django.utils import timezone
+from .ip_matcher import parse_ip_range
+from .geo import point_geohash
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields ):
@@ -51,7 +56,7 @@ class BlacklistedIP(models.Model):
     """Stores IP addresses that are banned from the site."""
     ip_address = models.GenericIPAddressField(unique=True, verbose_name="Banned IP Address")
     reason = models.CharField(max_length=255, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         db_table = 'blacklisted_ips'
@@ -61,7 +66,74 @@ class BlacklistedIP(models.Model):
     def __str__(self):
         return self.ip_address
 
+def validate_ip_range(value):
+    try:
+        parse_ip_range(value)
+    except ValueError as e:
+        raise ValidationError(f"{value} is not a valid CIDR network or IP range.") from e
+
+class BlacklistedNetwork(models.Model):
+    """Stores whole subnets (CIDR) or address ranges (first-last) that are banned from the site."""
+    network = models.CharField(
+        max_length=100,
+        unique=True,
+        validators=[validate_ip_range],
+        help_text="CIDR network such as 10.0.0.0/20 or a range such as 10.0.0.1-10.0.0.99"
+    )
+    reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'blacklisted_networks'
+        verbose_name = 'Blacklisted Network'
+        verbose_name_plural = 'Blacklisted Networks'
+
+    def __str__(self):
+        return self.network
+
+class Generation(models.Model):
+    """
+    Shared counters bumped by writers so every worker can cheaply
+    notice that its cached copy of some data is stale.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'generations'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
 #Marker model
+def marker_content_hash(name, lat, lng, image):
+    """SHA-256 of what makes two markers the same: name, position and image file."""
+    image = getattr(image, 'name', image) or ''
+    content = [str(name), None if lat is None else float(lat), None if lng is None else float(lng), image]
+    return hashlib.sha256(json.dumps(content, separators=(',', ':')).encode()).hexdigest()
+
+
+class MarkerQuerySet(models.QuerySet):
+
+    def delete(self):
+        """Turns the markers into tombstones one by one, like Marker.delete(), so their signals run."""
+        deleted = 0
+        for marker in self.filter(deleted_at__isnull=True):
+            marker.soft_delete()
+            deleted += 1
+        return deleted, {self.model._meta.label: deleted}
+
+
+class LiveMarkerManager(models.Manager.from_queryset(MarkerQuerySet)):
+    """
+    Markers that have not been deleted; tombstones are only seen through
+    Marker.all_objects, which also deletes rows for real.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Marker(models.Model):
     name = models.CharField(max_length=250)
     lat = models.FloatField(null=True, blank=True)
@@ -73,17 +145,99 @@ class Marker(models.Model):
         blank=True
     )
     image = models.ImageField(upload_to='marker_photos/', null=True, blank=True)
+    thumbnail = models.ImageField(
+        upload_to='marker_photos/variants/',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Small copy of image without EXIF, generated after upload"
+    )
+    medium = models.ImageField(
+        upload_to='marker_photos/variants/',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Medium copy of image without EXIF, generated after upload"
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         editable=False
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Set instead of deleting the row, so clients syncing changes see the deletion"
+    )
+    geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        help_text="Geohash of lat/lng, kept in sync on save"
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="marker_content_hash of a live marker, so restores skip markers that exist; cleared on delete"
+    )
 
     class Meta:# pylint: disable=too-few-public-methods
         db_table = 'markers'
+        indexes = [
+            models.Index(fields=['lat', 'lng'], name='markers_lat_lng_idx'),
+            models.Index(fields=['updated_at', 'id'], name='markers_updated_at_id_idx'),
+        ]
+
+    objects = LiveMarkerManager()
+    all_objects = models.Manager()
+    # (lat, lng) as last loaded or saved, so a move also invalidates where the marker was.
+    saved_position = (None, None)
 
     def __str__(self):
         return str(self.name)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        marker = super().from_db(db, field_names, values)
+        marker.saved_position = (marker.__dict__.get('lat'), marker.__dict__.get('lng'))
+        return marker
+
+    def save(self, *args, **kwargs):
+        self.geohash = point_geohash(self.lat, self.lng)
+        # Stores a new image first, so the hash covers its final name.
+        self._meta.get_field('image').pre_save(self, self._state.adding)
+        self.content_hash = None if self.deleted_at else self.compute_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {*update_fields, 'updated_at'}
+            if {'lat', 'lng'} & update_fields:
+                update_fields.add('geohash')
+            if {'name', 'lat', 'lng', 'image', 'deleted_at'} & update_fields:
+                update_fields.add('content_hash')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+    def compute_content_hash(self):
+        return marker_content_hash(self.name, self.lat, self.lng, self.image)
+
+    def soft_delete(self):
+        """Turns the marker into a tombstone, kept until purge_marker_tombstones removes it."""
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
+
+    def delete(self, using=None, keep_parents=False):
+        """Leaves a tombstone (see soft_delete) of a live marker; only tombstones are deleted for real."""
+        if self.deleted_at is not None:
+            return super().delete(using=using, keep_parents=keep_parents)
+        self.soft_delete()
+        return 1, {self._meta.label: 1}
+
 class EntryPassword(models.Model):
     """Model for entry password."""
     password = models.CharField(max_length=128)
@@ -216,3 +370,63 @@ class UserVote(models.Model):
 
     def __str__(self):
         return f"{self.voter} voted {self.decision} on vote {self.vote.id}"
+
+
+class BackupJob(models.Model):
+    """A marker restore handed to the run_backup_jobs worker instead of running in the request."""
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        SUCCEEDED = 'SUCCEEDED', 'Succeeded'
+        FAILED = 'FAILED', 'Failed'
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text="Requested the restore; restored markers belong to them"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    files = models.JSONField(
+        default=list,
+        help_text="Stored uploads in BACKUP_JOB_ROOT: the backup, then its incrementals oldest first"
+    )
+    rows_processed = models.PositiveIntegerField(default=0)
+    bytes_processed = models.PositiveBigIntegerField(default=0)
+    bytes_total = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last progress report of the worker; a running job that stops reporting is resumed"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'backup_jobs'
+        indexes = [
+            models.Index(fields=['status', 'id'], name='backup_jobs_status_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Restore job {self.pk} ({self.status})"
+
+
+class RestoreLock(models.Model):
+    """
+    The single row restores lock (SELECT ... FOR UPDATE) while they check
+    and insert a batch, so two restores never add the same marker. It has
+    its own table so that waiting for it never holds up generation reads.
+    """
+
+    class Meta:
+        db_table = 'restore_locks'
+
@@ -0,0 +1,79 @@
+"""
+Web Mercator tile geometry and the region counters that version cached
+map data (tiles and clusters).
+
+A region is a tile at one of REGION_ZOOMS. Data cached for a tile is keyed
+by the counter of the region holding it at the deepest region zoom up to
+the tile's own; tiles at zooms below the first region zoom use the 'markers'
+counter, which every marker write bumps anyway. A write bumps at most one
+region per region zoom and edge it touches, so the generations table holds
+one row per region with markers at those few zooms, and writes only
+contend on the counters of nearby regions.
+"""
+import math
+from .generations import MARKERS, MARKER_TILES
+from .geo import bbox_q
+from .models import Marker
+
+MAX_MERCATOR_LAT = 85.0511287798066
+REGION_ZOOMS = (4, 8, 12)
+
+
+def tile_bbox(z, x, y):
+    """(minLng, minLat, maxLng, maxLat) of a tile."""
+    n = 2 ** z
+    min_lng = x / n * 360 - 180
+    max_lng = (x + 1) / n * 360 - 180
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def point_tile(lat, lng, z):
+    """(x, y) of the tile containing a point at zoom z."""
+    n = 2 ** z
+    lat = max(min(lat, MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT)
+    x = int((lng + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_markers(z, x, y, markers=None):
+    """The markers of `markers` (default: all live ones) that fall into a tile."""
+    n = 2 ** z
+    min_lng, min_lat, max_lng, max_lat = tile_bbox(z, x, y)
+    # The outer rows also take the poles, which Web Mercator cannot show.
+    bbox = (min_lng, -90.0 if y == n - 1 else min_lat, max_lng, 90.0 if y == 0 else max_lat)
+    markers = (Marker.objects.all() if markers is None else markers).filter(bbox_q(bbox))
+    # Shared edges belong to one tile only: the top and the left one.
+    if y < n - 1:
+        markers = markers.exclude(lat=min_lat)
+    if x < n - 1:
+        markers = markers.exclude(lng=max_lng)
+    return markers
+
+
+def region_zoom(z):
+    """The deepest region zoom up to z, or None below the first one."""
+    zooms = [zoom for zoom in REGION_ZOOMS if zoom <= z]
+    return zooms[-1] if zooms else None
+
+
+def region_generation(z, x, y):
+    """Name of the generation counter of the region holding a tile."""
+    zoom = region_zoom(z)
+    if zoom is None:
+        return MARKERS
+    shift = z - zoom
+    return f'{MARKER_TILES}:{zoom}/{x >> shift}/{y >> shift}'
+
+
+def point_regions(lat, lng):
+    """Counters of every region whose tiles may hold a marker at (lat, lng)."""
+    regions = set()
+    # Deeper tiles share these regions; their edges are edges here too.
+    for z in REGION_ZOOMS:
+        # A point on a tile edge is rendered by both neighbours' queries.
+        for x, y in {point_tile(lat, lng, z), point_tile(lat, lng - 1e-9, z), point_tile(lat - 1e-9, lng, z)}:
+            regions.add(region_generation(z, x, y))
+    return regions
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Marker, EntryPassword, CustomUser, Role, VoteType, Vote, UserVote, Invite
+from .models import Marker, EntryPassword, CustomUser, Role, VoteType, Vote, UserVote, Invite, BackupJob
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
@@ -47,11 +47,16 @@ class MarkerSerializer(serializers.ModelSerializer):
             'lng', 
             'user',
             'image',
-            'created_at'
+            'thumbnail',
+            'medium',
+            'created_at',
+            'updated_at'
         ]
 
         extra_kwargs = {
-            'user': {'write_only': True, 'required': False}
+            'user': {'write_only': True, 'required': False},
+            'thumbnail': {'read_only': True},
+            'medium': {'read_only': True}
         }
 
 class VoteTypeSerializer(serializers.ModelSerializer):
@@ -165,4 +170,47 @@ class InviteSerializer(serializers.Serializer):
         return User.objects.create(
             email=validated_data["email"],
             role="MASON",
-        )
\ No newline at end of file
+        )
+
+
+class BackupJobSerializer(serializers.ModelSerializer):
+    """progress of a background restore."""
+    progress = serializers.SerializerMethodField()
+    rows_per_second = serializers.SerializerMethodField()
+    eta_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BackupJob
+        fields = [
+            'id', 'status', 'rows_processed', 'progress', 'rows_per_second', 'eta_seconds',
+            'error', 'created_at', 'started_at', 'finished_at'
+        ]
+
+    def elapsed_seconds(self, obj):
+        end = obj.finished_at or obj.heartbeat_at
+        if not obj.started_at or not end:
+            return None
+        return (end - obj.started_at).total_seconds()
+
+    def get_progress(self, obj):
+        """Share of the backup read so far, between 0 and 1."""
+        if obj.status == BackupJob.Status.SUCCEEDED:
+            return 1.0
+        if not obj.bytes_total:
+            return None if obj.status == BackupJob.Status.RUNNING else 0.0
+        return round(min(obj.bytes_processed / obj.bytes_total, 1.0), 4)
+
+    def get_rows_per_second(self, obj):
+        elapsed = self.elapsed_seconds(obj)
+        if not elapsed:
+            return None
+        return round(obj.rows_processed / elapsed, 1)
+
+    def get_eta_seconds(self, obj):
+        """Time left at the pace so far, while the job runs."""
+        progress = self.get_progress(obj)
+        elapsed = self.elapsed_seconds(obj)
+        if obj.status != BackupJob.Status.RUNNING or not progress or not elapsed:
+            return None
+        return int(elapsed * (1 - progress) / progress)
+
@@ -0,0 +1,54 @@
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .blacklist import reset_blacklist
+from .generations import bump_generation, BLACKLIST, BLACKLIST_RESET, BLACKLIST_NETWORKS, MARKERS
+from .models import BlacklistedIP, BlacklistedNetwork, Marker
+from .spatial_index import marker_index
+from .tiles import invalidate_points
+
+
+@receiver(post_save, sender=BlacklistedIP)
+def blacklisted_ip_saved(sender, instance, created, **kwargs):
+    """New bans are pulled incrementally; an edited address needs a full reload."""
+    if created:
+        bump_generation(BLACKLIST)
+    else:
+        bump_generation(BLACKLIST, BLACKLIST_RESET)
+
+
+@receiver(post_delete, sender=BlacklistedIP)
+def blacklisted_ip_deleted(sender, instance, **kwargs):
+    bump_generation(BLACKLIST, BLACKLIST_RESET)
+
+
+@receiver(post_save, sender=BlacklistedNetwork)
+@receiver(post_delete, sender=BlacklistedNetwork)
+def blacklisted_network_changed(sender, instance, **kwargs):
+    """The network matcher is small and always rebuilt as a whole."""
+    bump_generation(BLACKLIST_NETWORKS)
+
+
+@receiver(post_save, sender=Marker)
+def marker_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Moves the cached map data past a marker saved anywhere: the API, the
+    admin or a shell. bulk_create and update() send no signal, so their
+    callers do this themselves. Rows deleted for real through
+    Marker.all_objects are tombstones already, or wiped with the whole map.
+    """
+    points = {(instance.lat, instance.lng), instance.saved_position}
+    instance.saved_position = (instance.lat, instance.lng)
+    bump_generation(MARKERS)
+    invalidate_points(points)
+    if created:
+        marker_index.add((instance.pk, instance.lat, instance.lng))
+    elif instance.deleted_at is not None and update_fields and 'deleted_at' in update_fields:
+        marker_index.remove(instance.pk)
+    # Any other change leaves the index behind the bumped generation, so it is rebuilt.
+
+
+@receiver(setting_changed)
+def blacklist_setting_changed(setting, **kwargs):
+    if setting.startswith('BLACKLIST_'):
+        reset_blacklist()
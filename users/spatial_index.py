@@ -0,0 +1,312 @@
+"""
+In-process k-nearest-neighbour index of marker positions.
+
+Positions are mapped to unit vectors on the sphere, where straight-line
+(chord) distance grows with great-circle distance, so a plain 3-d k-d tree
+answers nearest-neighbour and radius queries without special cases at the
+poles or the antimeridian. The tree is static and held in NumPy arrays;
+markers created since the last build sit in a small pending buffer that is
+scanned in full, and deleted ones are masked out until the next rebuild.
+"""
+import heapq
+import math
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from .generations import get_generations, MARKERS
+from .geohash import EARTH_RADIUS_M
+from .models import Marker
+
+LEAF_SIZE = 64
+# Pending markers are folded into a new tree once there are this many,
+# or once they make up this share of the tree.
+MIN_PENDING_REBUILD = 1024
+PENDING_REBUILD_RATIO = 0.05
+
+
+def to_unit_vectors(lat, lng):
+    """(n, 3) array of unit vectors for arrays (or scalars) of degrees."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)], axis=-1).reshape(-1, 3)
+
+
+def chord_for(meters):
+    """Squared chord length on the unit sphere for a great-circle distance."""
+    angle = min(meters / EARTH_RADIUS_M, math.pi)
+    return (2 * math.sin(angle / 2)) ** 2
+
+
+def meters_for(chord_squared):
+    """Great-circle distances in meters for squared chord lengths."""
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(np.sqrt(chord_squared) / 2, 1.0))
+
+
+class KDTree:
+    """
+    Static balanced k-d tree. Points are reordered so that every node is a
+    contiguous slice; node i has children 2i+1 and 2i+2, and leaves hold at
+    most LEAF_SIZE points. `alive` masks out removed points.
+    """
+
+    def __init__(self, ids, points, leaf_size=LEAF_SIZE):
+        count = len(ids)
+        depth = 0
+        while count > leaf_size << depth:
+            depth += 1
+        self.first_leaf = (1 << depth) - 1
+        node_count = (1 << (depth + 1)) - 1
+        # Both are reordered in place while splitting.
+        self.ids = np.array(ids, dtype=np.int64)
+        self.points = points = np.array(points, dtype=np.float64).reshape(-1, 3)
+        self.alive = np.ones(count, dtype=bool)
+        self.bounds = bounds = [(0, count)] * node_count
+
+        # Each node splits its cell at the median of the cell's widest axis.
+        cells = [(points.min(axis=0), points.max(axis=0))] if count else [(np.zeros(3), np.zeros(3))]
+        for node in range(self.first_leaf):
+            start, end = bounds[node]
+            middle = (start + end) // 2
+            low, high = cells[node]
+            axis = int(np.argmax(high - low))
+            order = np.argpartition(points[start:end, axis], middle - start)
+            points[start:end] = points[start:end][order]
+            self.ids[start:end] = self.ids[start:end][order]
+            split = points[middle, axis]
+            bounds[2 * node + 1] = (start, middle)
+            bounds[2 * node + 2] = (middle, end)
+            left_high, right_low = high.copy(), low.copy()
+            left_high[axis] = right_low[axis] = split
+            cells += [(low, left_high), (right_low, high)]
+
+        # Tight bounding boxes: every leaf at once, then level by level upwards.
+        lows = np.full((node_count, 3), np.inf)
+        highs = np.full((node_count, 3), -np.inf)
+        if count:
+            starts = [bounds[node][0] for node in range(self.first_leaf, node_count)]
+            lows[self.first_leaf:] = np.minimum.reduceat(points, starts)
+            highs[self.first_leaf:] = np.maximum.reduceat(points, starts)
+        for level in range(depth - 1, -1, -1):
+            first, last = (1 << level) - 1, (1 << (level + 1)) - 1
+            lows[first:last] = np.minimum(lows[2 * first + 1:2 * last + 1:2], lows[2 * first + 2:2 * last + 2:2])
+            highs[first:last] = np.maximum(highs[2 * first + 1:2 * last + 1:2], highs[2 * first + 2:2 * last + 2:2])
+        # Traversal reads single boxes, which is faster from tuples than from arrays.
+        self.boxes = list(zip(map(tuple, lows.tolist()), map(tuple, highs.tolist())))
+
+        self.id_order = np.argsort(self.ids)
+        self.sorted_ids = self.ids[self.id_order]
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def position(self, marker_id):
+        """Index of a marker in tree order, or None."""
+        index = np.searchsorted(self.sorted_ids, marker_id)
+        if index < len(self.sorted_ids) and self.sorted_ids[index] == marker_id:
+            return int(self.id_order[index])
+        return None
+
+    def remove(self, marker_id):
+        position = self.position(marker_id)
+        if position is None or not self.alive[position]:
+            return False
+        self.alive[position] = False
+        return True
+
+    def live(self):
+        return self.ids[self.alive], self.points[self.alive]
+
+    def _box_distance(self, node, query):
+        low, high = self.boxes[node]
+        total = 0.0
+        for axis in range(3):
+            value = query[axis]
+            if value < low[axis]:
+                total += (low[axis] - value) ** 2
+            elif value > high[axis]:
+                total += (value - high[axis]) ** 2
+        return total
+
+    def _leaves(self, query, limit):
+        """
+        Yields (start, end) of leaves in order of their box distance from the
+        query, while it is within limit(); limit is re-read after every leaf.
+        """
+        query = tuple(query.tolist())
+        heap = [(self._box_distance(0, query), 0)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > limit():
+                return
+            if node >= self.first_leaf:
+                yield self.bounds[node]
+                continue
+            for child in (2 * node + 1, 2 * node + 2):
+                start, end = self.bounds[child]
+                if end > start:
+                    heapq.heappush(heap, (self._box_distance(child, query), child))
+
+    def nearest(self, query, k):
+        """(ids, squared chord distances) of the k closest live points, closest first."""
+        best_ids = np.empty(0, dtype=np.int64)
+        best = np.empty(0)
+
+        def limit():
+            return best[-1] if len(best) == k else np.inf
+
+        for start, end in self._leaves(query, limit):
+            alive = self.alive[start:end]
+            distances = ((self.points[start:end][alive] - query) ** 2).sum(axis=1)
+            best_ids, best = _closest(
+                np.concatenate([best_ids, self.ids[start:end][alive]]), np.concatenate([best, distances]), k)
+        return best_ids, best
+
+    def within(self, query, chord_squared):
+        """(ids, squared chord distances) of live points within the distance, unsorted."""
+        found_ids, found = [], []
+        for start, end in self._leaves(query, lambda: chord_squared):
+            distances = ((self.points[start:end] - query) ** 2).sum(axis=1)
+            mask = (distances <= chord_squared) & self.alive[start:end]
+            found_ids.append(self.ids[start:end][mask])
+            found.append(distances[mask])
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(found_ids), np.concatenate(found)
+
+
+def _closest(ids, distances, k):
+    """The k smallest distances and their ids, sorted."""
+    if len(distances) > k:
+        keep = np.argpartition(distances, k - 1)[:k]
+        ids, distances = ids[keep], distances[keep]
+    order = np.argsort(distances, kind='stable')
+    return ids[order], distances[order]
+
+
+class MarkerIndex:
+    """
+    Lazily loaded index of every marker with a position, shared by the
+    requests of one worker.
+
+    Writes made through this worker are applied in place with add()/remove()
+    and advance the markers generation the index is synced to. At most once
+    per MARKER_INDEX_REFRESH_INTERVAL_MS it compares that with the shared
+    generation; if another worker (or a bulk operation) moved it, the index is
+    rebuilt from the database.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def refresh_interval(self):
+        return getattr(settings, 'MARKER_INDEX_REFRESH_INTERVAL_MS', 1000) / 1000
+
+    def clear(self):
+        """Drops the index; the next query rebuilds it."""
+        with self.lock:
+            self.tree = None
+            self.generation = None
+            self.checked_at = None
+            self.pending_ids = []
+            self.pending_points = []
+
+    def _load(self, generation):
+        rows = list(
+            Marker.objects.filter(lat__isnull=False, lng__isnull=False)
+            .values_list('id', 'lat', 'lng')
+        )
+        ids = [row[0] for row in rows]
+        points = to_unit_vectors([row[1] for row in rows], [row[2] for row in rows])
+        self.tree = KDTree(ids, points)
+        self.pending_ids = []
+        self.pending_points = []
+        self.generation = generation
+
+    def ensure_current(self):
+        """Builds the index on first use and rebuilds it once the shared generation moved."""
+        now = time.monotonic()
+        if self.tree is not None and now - self.checked_at < self.refresh_interval():
+            return
+        with self.lock:
+            generation = get_generations(MARKERS)[MARKERS]
+            if self.tree is None or generation != self.generation:
+                self._load(generation)
+            self.checked_at = now
+
+    def _rebuild_in_memory(self):
+        ids, points = self.tree.live()
+        self.tree = KDTree(
+            np.concatenate([ids, np.asarray(self.pending_ids, dtype=np.int64)]),
+            np.concatenate([points, np.asarray(self.pending_points).reshape(-1, 3)]),
+        )
+        self.pending_ids = []
+        self.pending_points = []
+
+    def add(self, *markers):
+        """
+        Applies (id, lat, lng) of markers created by this worker, after the
+        single generation bump that covered them.
+        """
+        with self.lock:
+            if self.tree is None:
+                return
+            self.generation += 1
+            for marker_id, lat, lng in markers:
+                if lat is None or lng is None:
+                    continue
+                self.pending_ids.append(marker_id)
+                self.pending_points.append(to_unit_vectors(lat, lng)[0])
+            if len(self.pending_ids) >= max(MIN_PENDING_REBUILD, PENDING_REBUILD_RATIO * len(self.tree)):
+                self._rebuild_in_memory()
+
+    def remove(self, *marker_ids):
+        """Applies markers deleted by this worker, after the single generation bump that covered them."""
+        with self.lock:
+            if self.tree is None:
+                return
+            self.generation += 1
+            for marker_id in marker_ids:
+                if marker_id in self.pending_ids:
+                    index = self.pending_ids.index(marker_id)
+                    del self.pending_ids[index]
+                    del self.pending_points[index]
+                else:
+                    self.tree.remove(marker_id)
+
+    def _pending(self):
+        with self.lock:
+            return np.asarray(self.pending_ids, dtype=np.int64), np.asarray(self.pending_points).reshape(-1, 3)
+
+    def nearest(self, lat, lng, k):
+        """[(marker id, meters)] of the k markers closest to a point, closest first."""
+        self.ensure_current()
+        query = to_unit_vectors(lat, lng)[0]
+        tree = self.tree
+        ids, distances = tree.nearest(query, k)
+        pending_ids, pending_points = self._pending()
+        if len(pending_ids):
+            ids, distances = _closest(
+                np.concatenate([ids, pending_ids]),
+                np.concatenate([distances, ((pending_points - query) ** 2).sum(axis=1)]), k)
+        return list(zip(ids.tolist(), meters_for(distances).tolist()))
+
+    def within(self, lat, lng, radius_m):
+        """[(marker id, meters)] of the markers within radius_m of a point, closest first."""
+        self.ensure_current()
+        query = to_unit_vectors(lat, lng)[0]
+        limit = chord_for(radius_m)
+        ids, distances = self.tree.within(query, limit)
+        pending_ids, pending_points = self._pending()
+        if len(pending_ids):
+            pending_distances = ((pending_points - query) ** 2).sum(axis=1)
+            mask = pending_distances <= limit
+            ids = np.concatenate([ids, pending_ids[mask]])
+            distances = np.concatenate([distances, pending_distances[mask]])
+        order = np.argsort(distances, kind='stable')
+        return list(zip(ids[order].tolist(), meters_for(distances[order]).tolist()))
+
+
+marker_index = MarkerIndex()
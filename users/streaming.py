@@ -0,0 +1,121 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_ITEM_SIZE = 1024 * 1024
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'
+# Longest literal that can fail to decode only because it is cut off ("-Infinity").
+_LONGEST_LITERAL = 9
+
+
+def chunked(iterable, size):
+    """Yields lists of at most `size` items from any iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def until_error(iterable, errors):
+    """
+    Yields from `iterable` until it raises ValueError or csv.Error (malformed
+    input), then records the message in `errors` and stops, so items read so
+    far are kept.
+    """
+    try:
+        yield from iterable
+    except (ValueError, csv.Error) as e:
+        errors.append(str(e))
+
+
+def iter_csv_rows(fileobj):
+    """Yields CSV rows as dicts, decoding the upload line by line."""
+    return csv.DictReader(codecs.iterdecode(fileobj, 'utf-8-sig'))
+
+
+def iter_ndjson(fileobj):
+    """Yields one decoded value per non-empty line. Raises ValueError for malformed lines."""
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'Invalid JSON line: {e.msg}.') from e
+
+
+def _may_be_cut_off(buffer, error):
+    """True if `error` may only mean that the buffer ends inside the value being decoded."""
+    return error.msg.startswith('Unterminated string') or len(buffer) - error.pos <= _LONGEST_LITERAL
+
+
+def iter_json_array(fileobj, chunk_size=DEFAULT_CHUNK_SIZE, max_item_size=MAX_ITEM_SIZE):
+    """
+    Yields the items of a top-level JSON array one by one.
+    Only the item being decoded is kept in memory, not the whole file.
+    Raises ValueError for malformed input as soon as it is read, and for
+    items longer than `max_item_size` characters.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    pos = 0
+    eof = False
+    state = 'start'
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+
+        need_more = pos == len(buffer)
+        if not need_more:
+            char = buffer[pos]
+            if state == 'start':
+                if char != '[':
+                    raise ValueError('Expected a JSON array.')
+                pos += 1
+                state = 'first'
+                continue
+            if state in ('first', 'next') and char == ']':
+                return
+            if state == 'next':
+                if char != ',':
+                    raise ValueError(f'Expected "," or "]" in JSON array, got {char!r}.')
+                pos += 1
+                state = 'item'
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof or not _may_be_cut_off(buffer, e):
+                    raise ValueError(f'Invalid JSON: {e.msg}.') from e
+                if len(buffer) - pos > max_item_size:
+                    raise ValueError(f'JSON array items must not exceed {max_item_size} characters.') from e
+                need_more = True
+            else:
+                # A number at the very end of the buffer may still be cut in half ("1", "1.", "1e-").
+                if not eof and (end == len(buffer) or isinstance(item, (int, float))
+                                and not buffer[end:].strip(_NUMBER_CHARS)):
+                    need_more = True
+                else:
+                    yield item
+                    pos = end
+                    state = 'next'
+                    continue
+
+        if eof:
+            raise ValueError('Unexpected end of JSON array.')
+        buffer = buffer[pos:]
+        pos = 0
+        chunk = fileobj.read(chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = text_decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            eof = True
+        buffer += chunk
@@ -1,10 +1,25 @@
+import gzip
 import io
+import json
+import lzma
+import shutil
+import tempfile
+import zipfile
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
+from django.core import serializers
 from django.core.files.uploadedfile import SimpleUploadedFile
-from rest_framework.test import APIRequestFactory
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase as DjangoTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
 from rest_framework import status
+from users import backups
 from users.backup_api import BackupViewSet
+from users.backups import iter_backup_json, backup_queryset, restore_markers, ZIP_JSON_NAME
+from users.generations import bump_generation, MARKERS_RESET
+from users.models import CustomUser, Generation, Marker, RestoreLock, Role
 
 class BackupViewSetUnitTest(TestCase):
     """Unit tests for BackupViewSet"""
@@ -31,13 +46,15 @@ class BackupViewSetUnitTest(TestCase):
         )
 
 #test
-    @patch("users.backup_api.serializers.serialize")
-    @patch("users.backup_api.Marker.objects.all")
-    def test_list_download_backup_successfully(self, mock_markers_all, mock_serialize):
+    @patch("users.backups.serializers.serialize")
+    @patch("users.backup_api.export_queryset")
+    def test_list_download_backup_successfully(self, mock_queryset, mock_serialize):
         """Test downloading a backup json"""
         mock_marker_list = [MagicMock()]
-        mock_markers_all.return_value = mock_marker_list
-        mock_serialize.return_value = '{"fake": "json data"}'
+        markers = MagicMock()
+        markers.iterator.return_value = mock_marker_list
+        mock_queryset.return_value = (markers, 'checkpoint')
+        mock_serialize.return_value = '[{"fake": "json data"}]'
 
         request = self.factory.get("/backup/")
         request.user = self.user
@@ -49,26 +66,16 @@ class BackupViewSetUnitTest(TestCase):
         self.assertEqual(response['Content-Disposition'], 'attachment; ' \
         'filename="marker_backup.json"')
 
-        mock_markers_all.assert_called_once()
+        self.assertEqual(response['X-Backup-Checkpoint'], 'checkpoint')
+        self.assertEqual(b''.join(response.streaming_content), b'[{"fake": "json data"}]')
+        mock_queryset.assert_called_once_with(None)
         mock_serialize.assert_called_with('json', mock_marker_list)
 
-        self.assertEqual(response.content, b'{"fake": "json data"}')
-
-    @patch("users.backup_api.serializers.deserialize")
-    @patch("users.backup_api.Marker")
-    def test_create_valid_json_restores_successfully(self, mock_marker, mock_deserialize):
+    @patch("users.backup_api.bump_generation")
+    @patch("users.backup_api.restore_markers", return_value=(1, 0))
+    def test_create_valid_json_restores_successfully(self, mock_restore, mock_bump):
         """Test successfully uploading and restoring a backup"""
 
-        fake_obj = MagicMock()
-        fake_obj.object.name = "Test Marker"
-        fake_obj.object.lat = 1.0
-        fake_obj.object.lng = 2.0
-        fake_obj.object.image.name = "path/to/image.png"
-        mock_deserialize.return_value = [fake_obj]
-
-        mock_marker_instance = MagicMock()
-        mock_marker.return_value = mock_marker_instance
-
         request = self.factory.post("/backup/", {"backup_file": self.fake_json_file})
         request.user = self.user
 
@@ -76,6 +83,9 @@ class BackupViewSetUnitTest(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data["status"], "Restore successful")
+        self.assertEqual(response.data["restored"], 1)
+        mock_restore.assert_called_once()
+        mock_bump.assert_called_once()
 
     def test_create_without_file_returns_error(self):
         """Test return 400 if no file is uploaded"""
@@ -84,7 +94,7 @@ class BackupViewSetUnitTest(TestCase):
         response = self.view_create(request)
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertIn("No .json file provided", response.data["error"])
+        self.assertIn("No .json, .zip, .gz or .xz file provided", response.data["error"])
 
     def test_create_with_invalid_file_type_returns_error(self):
         """Test return 400 if file is not .json"""
@@ -95,4 +105,336 @@ class BackupViewSetUnitTest(TestCase):
         response = self.view_create(request)
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertIn("No .json file provided", response.data["error"])
+        self.assertIn("No .json, .zip, .gz or .xz file provided", response.data["error"])
+
+
+class BackupExportTest(DjangoTestCase):
+    """Streamed export against the database"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = CustomUser.objects.create_user(email='architect@example.com', role=Role.ARCHITECT)
+        for i in range(7):
+            Marker.objects.create(name=f'Marker {i}', lat=10 + i, lng=20 - i)
+
+    def test_stream_matches_serialize_across_batches(self):
+        """Batches join into exactly what serializers.serialize returns"""
+        expected = serializers.serialize('json', backup_queryset())
+        for chunk_size in (1, 3, 7, 100):
+            self.assertEqual(''.join(iter_backup_json(backup_queryset(), chunk_size=chunk_size)), expected)
+
+    def test_stream_of_empty_table(self):
+        """An empty table is still an array"""
+        Marker.all_objects.all().delete()
+        self.assertEqual(''.join(iter_backup_json(backup_queryset())), '[]')
+
+    def test_stream_skips_deleted_markers(self):
+        """Tombstones are not backed up"""
+        Marker.objects.get(name='Marker 0').soft_delete()
+        names = [item['fields']['name'] for item in json.loads(''.join(iter_backup_json(backup_queryset())))]
+        self.assertNotIn('Marker 0', names)
+        self.assertEqual(len(names), 6)
+
+    def test_export_can_be_restored(self):
+        """The downloaded file is accepted by create"""
+        request = self.factory.get('/backup/')
+        force_authenticate(request, user=self.user)
+        content = b''.join(BackupViewSet.as_view({'get': 'list'})(request).streaming_content)
+
+        Marker.all_objects.all().delete()
+        request = self.factory.post('/backup/', {
+            'backup_file': SimpleUploadedFile('marker_backup.json', content, content_type='application/json')
+        })
+        force_authenticate(request, user=self.user)
+        response = BackupViewSet.as_view({'post': 'create'})(request)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['restored'], 7)
+        self.assertEqual(sorted(Marker.objects.values_list('name', flat=True)), [f'Marker {i}' for i in range(7)])
+
+    def test_restore_inserts_in_batches(self):
+        """One INSERT per batch, with geohash filled in"""
+        content = ''.join(iter_backup_json(backup_queryset())).encode()
+        Marker.all_objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            restored, skipped = restore_markers(io.BytesIO(content), self.user, batch_size=3)
+        self.assertEqual((restored, skipped), (7, 0))
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "markers"')]
+        self.assertEqual(len(inserts), 3)
+        marker = Marker.objects.get(name='Marker 1')
+        self.assertEqual(marker.user, self.user)
+        self.assertTrue(marker.geohash)
+
+    def test_restore_skips_existing_markers(self):
+        """Restoring into the same map twice adds nothing; deleted markers come back"""
+        content = ''.join(iter_backup_json(backup_queryset())).encode()
+        Marker.objects.get(name='Marker 0').soft_delete()
+
+        self.assertEqual(restore_markers(io.BytesIO(content), self.user), (1, 6))
+        self.assertEqual(restore_markers(io.BytesIO(content), self.user), (0, 7))
+        self.assertEqual(Marker.objects.count(), 7)
+
+    def test_restore_locks_each_batch(self):
+        """Each batch checks and inserts under the restore lock, shared by requests and jobs"""
+        content = ''.join(iter_backup_json(backup_queryset())).encode()
+        Marker.all_objects.all().delete()
+        with patch('users.backups._lock_restores', wraps=backups._lock_restores) as lock:
+            restore_markers(io.BytesIO(content), self.user, batch_size=3, on_batch=lambda processed: None)
+        self.assertEqual(lock.call_count, 3)
+        self.assertTrue(RestoreLock.objects.filter(pk=backups.RESTORE_LOCK_ID).exists())
+        self.assertFalse(Generation.objects.filter(name__contains='lock').exists())
+
+    def test_restore_skips_repeats_within_a_backup(self):
+        """The same marker twice in one backup is restored once"""
+        content = ''.join(iter_backup_json(Marker.objects.filter(name='Marker 1'))).encode()
+        doubled = content[:-1] + b', ' + content[1:]
+        Marker.all_objects.all().delete()
+        self.assertEqual(restore_markers(io.BytesIO(doubled), self.user), (1, 1))
+
+    def test_restore_rolls_back_on_malformed_backup(self):
+        """A backup that breaks off after a few batches restores nothing"""
+        content = ''.join(iter_backup_json(backup_queryset())).encode()
+        Marker.all_objects.all().delete()
+        with self.assertRaises(ValueError):
+            restore_markers(io.BytesIO(content[:-40]), self.user, batch_size=2)
+        self.assertFalse(Marker.objects.exists())
+
+    def test_restore_rejects_other_models(self):
+        """Entries that are not markers return 400"""
+        request = self.factory.post('/backup/', {'backup_file': SimpleUploadedFile(
+            'backup.json', b'[{"model": "users.customuser", "pk": 1, "fields": {}}]')})
+        force_authenticate(request, user=self.user)
+        response = BackupViewSet.as_view({'post': 'create'})(request)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+
+
+class BackupZipTest(DjangoTestCase):
+    """Zip backups with images"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root, THUMBNAIL_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.factory = APIRequestFactory()
+        self.user = CustomUser.objects.create_user(email='architect@example.com', role=Role.ARCHITECT)
+        self.with_image = Marker.objects.create(name='Photo', lat=1, lng=2)
+        self.with_image.image.save('photo.png', io.BytesIO(PNG))
+        self.with_image.thumbnail.save('photo_thumb.png', io.BytesIO(PNG))
+        Marker.objects.create(name='Missing image', lat=3, lng=4, image='marker_photos/gone.png')
+        Marker.objects.create(name='Plain', lat=5, lng=6)
+
+    def download(self):
+        request = self.factory.get('/backup/', {'archive': 'zip'})
+        force_authenticate(request, user=self.user)
+        response = BackupViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return b''.join(response.streaming_content)
+
+    def upload(self, content, name='marker_backup.zip'):
+        request = self.factory.post('/backup/', {
+            'backup_file': SimpleUploadedFile(name, content, content_type='application/zip')
+        })
+        force_authenticate(request, user=self.user)
+        return BackupViewSet.as_view({'post': 'create'})(request)
+
+    def test_zip_holds_json_and_existing_images(self):
+        """The archive has the JSON export plus every file still in storage"""
+        with zipfile.ZipFile(io.BytesIO(self.download())) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read(ZIP_JSON_NAME).decode(), ''.join(iter_backup_json(backup_queryset())))
+            self.assertEqual(sorted(archive.namelist()), sorted([
+                ZIP_JSON_NAME,
+                f'media/{self.with_image.image.name}',
+                f'media/{self.with_image.thumbnail.name}',
+            ]))
+            self.assertEqual(archive.read(f'media/{self.with_image.image.name}'), PNG)
+
+    def test_zip_restores_markers_and_images(self):
+        """A restore into an empty instance brings back the files the markers point to"""
+        content = self.download()
+        image_name = self.with_image.image.name
+        Marker.all_objects.all().delete()
+        shutil.rmtree(self.media_root)
+
+        response = self.upload(content)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        restored = Marker.objects.get(name='Photo')
+        self.assertEqual(restored.image.name, image_name)
+        with restored.image.open('rb') as image:
+            self.assertEqual(image.read(), PNG)
+        self.assertEqual(Marker.objects.count(), 3)
+
+    def test_zip_restore_skips_unsafe_and_non_image_entries(self):
+        """Only images under the marker directories are written"""
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w') as archive:
+            archive.writestr(ZIP_JSON_NAME, '[]')
+            archive.writestr('media/marker_photos/../../escape.png', PNG)
+            archive.writestr('media/settings.png', PNG)
+            archive.writestr('media/marker_photos/script.png', b'<script>alert(1)</script>')
+            archive.writestr('media/marker_photos/ok.png', PNG)
+
+        response = self.upload(output.getvalue())
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        storage = Marker._meta.get_field('image').storage
+        self.assertTrue(storage.exists('marker_photos/ok.png'))
+        self.assertFalse(storage.exists('marker_photos/script.png'))
+        self.assertFalse(storage.exists('settings.png'))
+
+    def test_zip_without_json_is_rejected(self):
+        """A zip that is not a marker backup returns 400"""
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w') as archive:
+            archive.writestr('other.txt', 'x')
+        self.assertEqual(self.upload(output.getvalue()).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.upload(b'not a zip').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(MARKER_CHANGES_SETTLE_SECONDS=0)
+class IncrementalBackupTest(DjangoTestCase):
+    """Incremental exports since a checkpoint and chain restores"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.user = CustomUser.objects.create_user(email='architect@example.com', role=Role.ARCHITECT)
+        for i in range(4):
+            Marker.objects.create(name=f'Marker {i}', lat=10 + i, lng=20 - i)
+
+    def export(self, **params):
+        request = self.factory.get('/backup/', params)
+        force_authenticate(request, user=self.user)
+        return BackupViewSet.as_view({'get': 'list'})(request)
+
+    def restore(self, full, *incrementals):
+        request = self.factory.post('/backup/', {
+            'backup_file': SimpleUploadedFile('marker_backup.json', full),
+            'incremental_file': [
+                SimpleUploadedFile(f'marker_backup_incremental_{i}.json', content)
+                for i, content in enumerate(incrementals)
+            ],
+        })
+        force_authenticate(request, user=self.user)
+        return BackupViewSet.as_view({'post': 'create'})(request)
+
+    def change_markers(self):
+        marker = Marker.objects.get(name='Marker 1')
+        marker.name = 'Marker 1 renamed'
+        marker.save()
+        Marker.objects.get(name='Marker 2').soft_delete()
+        Marker.objects.create(name='Marker 4', lat=1, lng=1)
+
+    def test_incremental_holds_only_changes(self):
+        """Changed, deleted and new markers since the checkpoint, deletions as tombstones"""
+        checkpoint = self.export()['X-Backup-Checkpoint']
+        self.change_markers()
+
+        response = self.export(since=checkpoint)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('marker_backup_incremental.json', response['Content-Disposition'])
+        items = json.loads(b''.join(response.streaming_content))
+        changes = {item['fields']['name']: item['fields']['deleted_at'] is not None for item in items}
+        self.assertEqual(changes, {'Marker 1 renamed': False, 'Marker 2': True, 'Marker 4': False})
+
+        later = self.export(since=response['X-Backup-Checkpoint'])
+        self.assertEqual(json.loads(b''.join(later.streaming_content)), [])
+
+    def test_chain_restore_replays_incrementals(self):
+        """Full backup plus incrementals restores the current set of markers"""
+        full = self.export()
+        full_content = b''.join(full.streaming_content)
+        self.change_markers()
+        first = self.export(since=full['X-Backup-Checkpoint'])
+        first_content = b''.join(first.streaming_content)
+        Marker.objects.get(name='Marker 4').soft_delete()
+        Marker.objects.create(name='Marker 5', lat=2, lng=2)
+        second_content = b''.join(self.export(since=first['X-Backup-Checkpoint']).streaming_content)
+        expected = sorted(Marker.objects.values_list('name', flat=True))
+
+        Marker.all_objects.all().delete()
+        response = self.restore(full_content, first_content, second_content)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['restored'], len(expected))
+        self.assertEqual(sorted(Marker.objects.values_list('name', flat=True)), expected)
+
+    def test_invalid_and_expired_checkpoints(self):
+        """A malformed checkpoint is 400; one from before a markers reset is 410"""
+        checkpoint = self.export()['X-Backup-Checkpoint']
+        self.assertEqual(self.export(since='nope').status_code, status.HTTP_400_BAD_REQUEST)
+        bump_generation(MARKERS_RESET)
+        self.assertEqual(self.export(since=checkpoint).status_code, status.HTTP_410_GONE)
+
+
+class CompressedBackupTest(DjangoTestCase):
+    """gzip and xz backups"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = CustomUser.objects.create_user(email='architect@example.com', role=Role.ARCHITECT)
+        for i in range(5):
+            Marker.objects.create(name=f'Marker {i}', lat=10 + i, lng=20 - i)
+        self.plain = ''.join(iter_backup_json(backup_queryset())).encode()
+
+    def export(self, headers=None, **params):
+        request = self.factory.get('/backup/', params, headers=headers)
+        force_authenticate(request, user=self.user)
+        return BackupViewSet.as_view({'get': 'list'})(request)
+
+    def restore(self, content, name):
+        request = self.factory.post('/backup/', {'backup_file': SimpleUploadedFile(name, content)})
+        force_authenticate(request, user=self.user)
+        return BackupViewSet.as_view({'post': 'create'})(request)
+
+    def test_compression_parameter(self):
+        """?compression= downloads a .gz or .xz file"""
+        response = self.export(compression='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('marker_backup.json.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.plain)
+
+        response = self.export(compression='xz')
+        self.assertEqual(response['Content-Type'], 'application/x-xz')
+        self.assertEqual(lzma.decompress(b''.join(response.streaming_content)), self.plain)
+
+        self.assertEqual(self.export(compression='brotli').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.export(compression='gzip', archive='zip').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_accept_encoding(self):
+        """Accept-Encoding: gzip compresses the transfer, not the file"""
+        response = self.export(headers={'Accept-Encoding': 'br, gzip;q=0.8'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.plain)
+
+        response = self.export(headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.plain)
+
+    def test_restore_detects_compression_from_content(self):
+        """gzip and xz uploads restore whatever their name"""
+        for content, name in ((gzip.compress(self.plain), 'backup.json.gz'),
+                              (lzma.compress(self.plain), 'backup.json'),
+                              (gzip.compress(self.plain), 'backup.xz')):
+            Marker.all_objects.all().delete()
+            response = self.restore(content, name)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, name)
+            self.assertEqual(response.data['restored'], 5)
+
+    def test_restore_rejects_corrupt_compressed_backup(self):
+        """Truncated compressed data is 400 and restores nothing"""
+        Marker.all_objects.all().delete()
+        for content in (gzip.compress(self.plain)[:-20], lzma.compress(self.plain)[:-20]):
+            response = self.restore(content, 'backup.json.gz')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Marker.objects.exists())
@@ -0,0 +1,121 @@
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from users.backup_jobs import claim_job, run_job, job_storage
+from users.backups import iter_backup_json, backup_queryset
+from users.models import BackupJob, Marker, Role
+from users.serializers import BackupJobSerializer
+
+User = get_user_model()
+
+
+class BackupJobTests(APITestCase):
+    """tests restores queued for the run_backup_jobs worker"""
+
+    def setUp(self):
+        self.job_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.job_root)
+        job_settings = override_settings(BACKUP_JOB_ROOT=self.job_root, BACKUP_JOB_STALE_SECONDS=60)
+        job_settings.enable()
+        self.addCleanup(job_settings.disable)
+
+        self.client = APIClient()
+        self.architect = User.objects.create_user(
+            email='architect@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.ARCHITECT
+        )
+        self.client.force_authenticate(user=self.architect)
+        for i in range(5):
+            Marker.objects.create(name=f'Marker {i}', lat=10 + i, lng=20 - i)
+        self.backup = ''.join(iter_backup_json(backup_queryset())).encode()
+        Marker.all_objects.all().delete()
+
+    def queue(self, content, name='marker_backup.json'):
+        return self.client.post(reverse('backup-jobs'), {'backup_file': SimpleUploadedFile(name, content)})
+
+    def test_queue_returns_job_to_poll(self):
+        response = self.queue(self.backup)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], BackupJob.Status.PENDING)
+        self.assertEqual(response['Location'], reverse('backup-job', args=[response.data['id']]))
+        job = BackupJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.user, self.architect)
+        self.assertTrue(job_storage().exists(job.files[0]))
+        self.assertFalse(Marker.objects.exists())
+
+    def test_queue_without_backup_is_rejected(self):
+        response = self.client.post(reverse('backup-jobs'), {})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_worker_restores_and_reports(self):
+        job_id = self.queue(gzip.compress(self.backup), 'marker_backup.json.gz').data['id']
+
+        call_command('run_backup_jobs', '--once', stdout=StringIO())
+
+        response = self.client.get(reverse('backup-job', args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], BackupJob.Status.SUCCEEDED)
+        self.assertEqual(response.data['rows_processed'], 5)
+        self.assertEqual(response.data['progress'], 1.0)
+        self.assertEqual(Marker.objects.filter(user=self.architect).count(), 5)
+        self.assertFalse(job_storage().exists(BackupJob.objects.get(pk=job_id).files[0]))
+
+    def test_malformed_backup_fails_the_job(self):
+        job_id = self.queue(self.backup[:-40]).data['id']
+
+        call_command('run_backup_jobs', '--once', stdout=StringIO())
+
+        job = BackupJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, BackupJob.Status.FAILED)
+        self.assertTrue(job.error)
+        self.assertFalse(job_storage().exists(job.files[0]))
+
+    def test_restores_run_one_at_a_time(self):
+        self.queue(self.backup)
+        self.queue(self.backup)
+        first = claim_job()
+        self.assertIsNotNone(first)
+        self.assertIsNone(claim_job())
+
+        run_job(first)
+        second = claim_job()
+        self.assertNotEqual(second.pk, first.pk)
+
+    def test_stale_job_is_resumed(self):
+        job = BackupJob.objects.get(pk=self.queue(self.backup).data['id'])
+        Marker.objects.bulk_create(Marker(name=f'Marker {i}', lat=10 + i, lng=20 - i) for i in range(3))
+        BackupJob.objects.filter(pk=job.pk).update(
+            status=BackupJob.Status.RUNNING, rows_processed=3, started_at=timezone.now() - timedelta(minutes=5),
+            heartbeat_at=timezone.now() - timedelta(minutes=2))
+
+        resumed = claim_job()
+        self.assertEqual(resumed.pk, job.pk)
+        self.assertTrue(run_job(resumed))
+
+        self.assertEqual(sorted(Marker.objects.values_list('name', flat=True)), [f'Marker {i}' for i in range(5)])
+
+    def test_status_of_unknown_job(self):
+        response = self.client.get(reverse('backup-job', args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_eta_from_progress_so_far(self):
+        now = timezone.now()
+        job = BackupJob(status=BackupJob.Status.RUNNING, rows_processed=2000, bytes_processed=25,
+                        bytes_total=100, started_at=now - timedelta(seconds=10), heartbeat_at=now)
+        data = BackupJobSerializer(job).data
+        self.assertEqual(data['progress'], 0.25)
+        self.assertEqual(data['rows_per_second'], 200.0)
+        self.assertEqual(data['eta_seconds'], 30)
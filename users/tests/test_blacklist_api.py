@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+import os
+from unittest.mock import patch
+from dotenv import load_dotenv
+from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from users.models import BlacklistedIP, Role, Generation
+
+load_dotenv()
+User = get_user_model()
+test_password = os.environ.get("TEST_PASSWORD", "test-pass")
+
+
+class BlacklistApiTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("blacklist-list")
+        self.architect = User.objects.create_user(
+            email="architect@example.com", password=test_password, role=Role.ARCHITECT
+        )
+        self.golden = User.objects.create_user(
+            email="golden@example.com", password=test_password, role=Role.GOLDEN
+        )
+        BlacklistedIP.objects.create(ip_address="198.51.100.1", reason="Banned by vote 1")
+
+    def _generation(self):
+        counter = Generation.objects.filter(name="blacklist").first()
+        return counter.value if counter else 0
+
+    def test_import_ndjson_in_chunks(self):
+        self.client.force_authenticate(user=self.architect)
+        lines = [
+            {"ip_address": "203.0.113.1", "reason": "feed"},
+            {"ip_address": "198.51.100.1"},
+            {"ip_address": "2001:DB8::0:1"},
+            {"ip_address": "not-an-ip"},
+            {"ip_address": "203.0.113.1"},
+            {"ip_address": "203.0.113.2"},
+        ]
+        upload = SimpleUploadedFile("feed.ndjson", "\n".join(json.dumps(line) for line in lines).encode())
+        generation = self._generation()
+
+        with patch("users.blacklist_api.IMPORT_CHUNK_SIZE", 2):
+            resp = self.client.post(self.url, {"blacklist_file": upload})
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data["created"], 3)
+        self.assertEqual(resp.data["existing"], 2)
+        self.assertEqual(resp.data["invalid"], 1)
+        self.assertEqual(resp.data["errors"], [{"row": 4, "error": "Invalid IP address."}])
+        self.assertTrue(BlacklistedIP.objects.filter(ip_address="2001:db8::1").exists())
+        self.assertEqual(self._generation(), generation + 1)
+
+    def test_import_csv(self):
+        self.client.force_authenticate(user=self.architect)
+        upload = SimpleUploadedFile("feed.csv", b"ip_address,reason\n203.0.113.9,scanner\n")
+        resp = self.client.post(self.url, {"blacklist_file": upload})
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(BlacklistedIP.objects.get(ip_address="203.0.113.9").reason, "scanner")
+
+    def test_import_stops_on_malformed_line(self):
+        self.client.force_authenticate(user=self.architect)
+        upload = SimpleUploadedFile("feed.ndjson", b'{"ip_address": "203.0.113.5"}\n{broken\n')
+        resp = self.client.post(self.url, {"blacklist_file": upload})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.data["created"], 1)
+
+    def test_import_requires_file(self):
+        self.client.force_authenticate(user=self.architect)
+        resp = self.client.post(self.url, {})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_ndjson_and_csv(self):
+        self.client.force_authenticate(user=self.architect)
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b"".join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual([row["ip_address"] for row in rows], ["198.51.100.1"])
+
+        resp = self.client.get(self.url, {"type": "csv"})
+        reader = csv.DictReader(io.StringIO(b"".join(resp.streaming_content).decode()))
+        self.assertEqual([row["reason"] for row in reader], ["Banned by vote 1"])
+
+    def test_architect_only(self):
+        self.client.force_authenticate(user=self.golden)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.post(self.url, {}).status_code, status.HTTP_403_FORBIDDEN)
@@ -46,7 +46,7 @@ class CompromisedViewSetTestCase(TestCase):
         self.assertEqual(updated_user.password, '')
         self.assertIsNone(updated_user.username)
 
-    @patch('users.compromised_api.Marker.objects.all')
+    @patch('users.compromised_api.Marker.all_objects.all')
     def test_compromised_database_error(self, mock_marker_all):
         """Test database error handling in compromised endpoint"""
         mock_marker_all.side_effect = DatabaseError("DB failure")
@@ -0,0 +1,59 @@
+from datetime import datetime, timezone as dt_timezone
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from users.fast_render import compile_fields, fast_fields, list_rows, render_list
+from users.models import Marker, Role
+from users.serializers import MarkerSerializer, BasicUserSerializer, InviteSerializer
+
+User = get_user_model()
+
+
+class MethodFieldSerializer(serializers.ModelSerializer):
+    extra = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Marker
+        fields = ['id', 'extra']
+
+
+class FastRenderTests(TestCase):
+    """tests that the serializer-free path renders the same bytes as the serializers"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='golden@example.com', username='gold', role=Role.GOLDEN)
+        User.objects.create_user(email='mason@example.com', role=Role.MASON)
+        Marker.objects.create(name='Kyiv   "quoted" ÿ', lat=50.45, lng=30.52, user=self.user,
+                              image='marker_photos/a b.jpg', thumbnail='marker_photos/variants/a_thumb.webp')
+        Marker.objects.create(name='No position', lat=None, lng=None, image='')
+        Marker.objects.create(name='Integer-ish', lat=1, lng=-0.0)
+
+    def assertSameBytes(self, serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        compiled = compile_fields(serializer_class, queryset.model)
+        self.assertEqual(render_list(queryset, compiled), expected)
+        self.assertEqual(JSONRenderer().render(list_rows(queryset, compiled)), expected)
+
+    def test_markers(self):
+        self.assertSameBytes(MarkerSerializer, Marker.objects.all())
+
+    @override_settings(TIME_ZONE='Europe/Kyiv')
+    def test_markers_in_another_timezone(self):
+        Marker.objects.update(created_at=datetime(2024, 7, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc))
+        with timezone.override('America/Lima'):
+            self.assertSameBytes(MarkerSerializer, Marker.objects.all())
+
+    def test_users_and_invites(self):
+        self.assertSameBytes(BasicUserSerializer, User.objects.order_by('username'))
+        self.assertSameBytes(InviteSerializer, User.objects.filter(role=Role.MASON))
+
+    def test_unsupported_fields_are_refused(self):
+        with self.assertRaises(ValueError):
+            compile_fields(MethodFieldSerializer, Marker)
+
+    def test_fast_fields_compile_once_or_fall_back(self):
+        self.assertIs(fast_fields(MarkerSerializer, Marker), fast_fields(MarkerSerializer, Marker))
+        with self.assertLogs('users.fast_render', 'WARNING'):
+            self.assertIsNone(fast_fields(MethodFieldSerializer, Marker))
@@ -0,0 +1,147 @@
+import json
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.db import OperationalError
+from django.test import TestCase
+from users.models import BlacklistedIP
+from users.gate import BlacklistWSGIGate, BlacklistASGIGate
+
+BANNED_IP = '198.51.100.23'
+PROXY_IP = '10.0.0.5'
+
+
+class BlacklistWSGIGateTests(TestCase):
+    """tests blacklisted clients are rejected before Django"""
+
+    def setUp(self):
+        BlacklistedIP.objects.create(ip_address=BANNED_IP, reason='Test ban')
+        self.calls = []
+        # Closing connections would end the test transaction.
+        closer = patch('users.gate.close_old_connections')
+        self.close_old_connections = closer.start()
+        self.addCleanup(closer.stop)
+
+    def django_app(self, environ, start_response):
+        self.calls.append(environ)
+        start_response('200 OK', [])
+        return [b'OK']
+
+    def call(self, gate, **environ):
+        environ.setdefault('PATH_INFO', '/')
+        result = {}
+
+        def start_response(status, headers):
+            result['status'] = status
+            result['headers'] = dict(headers)
+
+        result['body'] = b''.join(gate(environ, start_response))
+        return result
+
+    def test_allowed_ip_reaches_django(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/'):
+            result = self.call(BlacklistWSGIGate(self.django_app), REMOTE_ADDR='203.0.113.1')
+        self.assertEqual(result['status'], '200 OK')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_banned_api_request_gets_json_403(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', CORS_ALLOWED_ORIGINS=['http://localhost:8080']):
+            result = self.call(BlacklistWSGIGate(self.django_app), REMOTE_ADDR=BANNED_IP,
+                               HTTP_ACCEPT='application/json', HTTP_ORIGIN='http://localhost:8080')
+        self.assertEqual(result['status'], '403 Forbidden')
+        self.assertEqual(json.loads(result['body']),
+                         {'error': 'Access denied from this IP.', 'redirect_url': '/banned/'})
+        self.assertEqual(result['headers']['Access-Control-Allow-Origin'], 'http://localhost:8080')
+        self.assertEqual(self.calls, [])
+
+    def test_banned_browser_request_is_redirected(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/'):
+            gate = BlacklistWSGIGate(self.django_app)
+            result = self.call(gate, REMOTE_ADDR=BANNED_IP)
+            self.assertEqual(result['status'], '302 Found')
+            self.assertEqual(result['headers']['Location'], '/banned/')
+
+            result = self.call(gate, REMOTE_ADDR=BANNED_IP, PATH_INFO='/banned/')
+            self.assertEqual(result['status'], '200 OK')
+
+    def test_trusted_proxy_forwarded_header(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_TRUSTED_PROXIES=['10.0.0.0/8']):
+            gate = BlacklistWSGIGate(self.django_app)
+            result = self.call(gate, REMOTE_ADDR=PROXY_IP, HTTP_X_FORWARDED_FOR=f'{BANNED_IP}, 10.0.0.9')
+            self.assertEqual(result['status'], '302 Found')
+
+            # A client cannot hide behind a forged header sent to an untrusted address.
+            result = self.call(gate, REMOTE_ADDR=BANNED_IP, HTTP_X_FORWARDED_FOR='203.0.113.1')
+            self.assertEqual(result['status'], '302 Found')
+
+    def test_untrusted_forwarded_header_is_ignored(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/'):
+            result = self.call(BlacklistWSGIGate(self.django_app), REMOTE_ADDR=PROXY_IP,
+                               HTTP_X_FORWARDED_FOR=BANNED_IP)
+        self.assertEqual(result['status'], '200 OK')
+
+    def test_database_error_lets_requests_through_until_loaded(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0):
+            gate = BlacklistWSGIGate(self.django_app)
+            with patch('users.blacklist.get_generations', side_effect=OperationalError('gone away')), \
+                    self.assertLogs('users.gate', 'ERROR'):
+                result = self.call(gate, REMOTE_ADDR=BANNED_IP)
+            self.assertEqual(result['status'], '200 OK')
+            self.assertEqual(self.close_old_connections.call_count, 2)
+
+            result = self.call(gate, REMOTE_ADDR=BANNED_IP)
+            self.assertEqual(result['status'], '302 Found')
+
+    def test_database_error_keeps_last_list(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0):
+            gate = BlacklistWSGIGate(self.django_app)
+            self.call(gate, REMOTE_ADDR='203.0.113.1')
+            with patch('users.blacklist.get_generations', side_effect=OperationalError('gone away')), \
+                    self.assertLogs('users.gate', 'ERROR'):
+                result = self.call(gate, REMOTE_ADDR=BANNED_IP)
+            self.assertEqual(result['status'], '302 Found')
+
+    def test_no_redirect_url_disables_gate(self):
+        with self.settings(BLACKLIST_REDIRECT_URL=None):
+            result = self.call(BlacklistWSGIGate(self.django_app), REMOTE_ADDR=BANNED_IP)
+        self.assertEqual(result['status'], '200 OK')
+
+
+class BlacklistASGIGateTests(TestCase):
+    """tests the ASGI flavour of the gate"""
+
+    def setUp(self):
+        BlacklistedIP.objects.create(ip_address=BANNED_IP, reason='Test ban')
+        self.calls = []
+        # Closing connections would end the test transaction.
+        closer = patch('users.gate.close_old_connections')
+        self.close_old_connections = closer.start()
+        self.addCleanup(closer.stop)
+
+    async def django_app(self, scope, receive, send):
+        self.calls.append(scope)
+
+    def call(self, gate, ip, accept=b''):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        scope = {'type': 'http', 'path': '/', 'client': (ip, 5000), 'headers': [(b'accept', accept)]}
+        async_to_sync(gate)(scope, receive, send)
+        return messages
+
+    def test_banned_api_request_gets_json_403(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/'):
+            messages = self.call(BlacklistASGIGate(self.django_app), BANNED_IP, b'application/json')
+        self.assertEqual(messages[0]['status'], 403)
+        self.assertIn(b'redirect_url', messages[1]['body'])
+        self.assertEqual(self.calls, [])
+
+    def test_allowed_ip_reaches_django(self):
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/'):
+            messages = self.call(BlacklistASGIGate(self.django_app), '203.0.113.1')
+        self.assertEqual(messages, [])
+        self.assertEqual(len(self.calls), 1)
@@ -0,0 +1,36 @@
+from unittest import TestCase
+from users import geohash
+
+
+class GeohashTests(TestCase):
+    """tests geohash encoding and covering cells"""
+
+    def test_encode_known_value(self):
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash.encode(50.45, 30.52, 5), 'u8vxn')
+
+    def test_decode_bbox_contains_point(self):
+        min_lat, min_lng, max_lat, max_lng = geohash.decode_bbox(geohash.encode(-33.86, 151.2, 7))
+        self.assertTrue(min_lat <= -33.86 <= max_lat and min_lng <= 151.2 <= max_lng)
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            geohash.encode(91, 0)
+        with self.assertRaises(ValueError):
+            geohash.decode_bbox('abc')
+        self.assertFalse(geohash.is_valid('ail'))
+        self.assertTrue(geohash.is_valid('u8vxn'))
+
+    def test_covering_cells_contain_circle(self):
+        cells = geohash.covering_cells(50.45, 30.52, 2000)
+        self.assertLessEqual(len(cells), 9)
+        # A point 1.5 km east must fall inside one of the cells.
+        east = geohash.encode(50.45, 30.541, 12)
+        self.assertTrue(any(east.startswith(cell) for cell in cells))
+
+    def test_covering_cells_across_antimeridian(self):
+        cells = geohash.covering_cells(0, 179.999, 5000)
+        self.assertTrue(any(geohash.encode(0, -179.99).startswith(cell) for cell in cells))
+
+    def test_haversine(self):
+        self.assertAlmostEqual(geohash.haversine_m(50.45, 30.52, 49.84, 24.03) / 1000, 468, delta=5)
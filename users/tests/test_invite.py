@@ -1,6 +1,9 @@
 import os
+import json
+from unittest.mock import patch
 from dotenv import load_dotenv
 from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
@@ -44,3 +47,95 @@ class SimpleInviteTests(APITestCase):
         self.client.force_authenticate(user=self.mason)
         resp = self.client.post(self.url, {"email": "blocked@example.com"}, format="json")
         self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BulkInviteTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("invite-bulk")
+        self.golden = User.objects.create_user(
+            username="golden",
+            email="golden@example.com",
+            password=test_password,
+            role="GOLDEN",
+        )
+        self.mason = User.objects.create_user(
+            username="mason",
+            email="mason@example.com",
+            password=test_password,
+            role="MASON",
+        )
+
+    def _results(self, resp):
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        return [json.loads(line) for line in lines]
+
+    def test_bulk_csv_creates_masons_and_invites(self):
+        self.client.force_authenticate(user=self.golden)
+        upload = SimpleUploadedFile(
+            "invites.csv",
+            b"email\nnew1@example.com\nmason@example.com\nnot-an-email\nnew2@example.com\nnew1@example.com\n",
+        )
+        resp = self.client.post(self.url, {"invites_file": upload})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        results = self._results(resp)
+        self.assertEqual(
+            [r["status"] for r in results[:-1]],
+            ["invited", "exists", "invalid", "invited", "exists"],
+        )
+        self.assertEqual(results[-1]["summary"], {"invited": 2, "exists": 2, "invalid": 1})
+        self.assertEqual(User.objects.filter(email__in=["new1@example.com", "new2@example.com"],
+                                             role="MASON").count(), 2)
+        self.assertEqual(Invite.objects.filter(invited_by=self.golden).count(), 2)
+
+    def test_bulk_json_list_across_chunks(self):
+        self.client.force_authenticate(user=self.golden)
+        emails = [{"email": f"user{i}@example.com"} for i in range(5)] + ["user0@example.com"]
+        upload = SimpleUploadedFile("invites.json", json.dumps(emails).encode())
+        with patch("users.invite_api.BULK_INVITE_CHUNK_SIZE", 2):
+            resp = self.client.post(self.url, {"invites_file": upload})
+            results = self._results(resp)
+
+        self.assertEqual(results[-1]["summary"], {"invited": 5, "exists": 1, "invalid": 0})
+        self.assertEqual(results[-2]["row"], 6)
+
+    def test_bulk_malformed_json_reports_error(self):
+        self.client.force_authenticate(user=self.golden)
+        upload = SimpleUploadedFile("invites.json", b'["ok@example.com", ')
+        results = self._results(self.client.post(self.url, {"invites_file": upload}))
+        self.assertIn("error", results[-2])
+        self.assertEqual(results[-1]["summary"]["invited"], 1)
+
+    def test_bulk_case_variant_exists(self):
+        self.client.force_authenticate(user=self.golden)
+        upload = SimpleUploadedFile("invites.csv", b"email\nMason@Example.com\nnew@example.com\nNEW@example.com\n")
+        results = self._results(self.client.post(self.url, {"invites_file": upload}))
+        self.assertEqual([r["status"] for r in results[:-1]], ["exists", "invited", "exists"])
+
+    def test_bulk_email_taken_after_check(self):
+        self.client.force_authenticate(user=self.golden)
+        upload = SimpleUploadedFile("invites.csv", b"email\nnew@example.com\nmason@example.com\n")
+        with patch.object(InviteViewSet, "_taken_emails", return_value=set()):
+            results = self._results(self.client.post(self.url, {"invites_file": upload}))
+
+        self.assertEqual([r["status"] for r in results[:-1]], ["invited", "exists"])
+        self.assertTrue(User.objects.filter(email="new@example.com").exists())
+
+    def test_bulk_malformed_csv_reports_error(self):
+        self.client.force_authenticate(user=self.golden)
+        upload = SimpleUploadedFile("invites.csv", b"email\nok@example.com\n" + b"x" * 200000 + b"\n")
+        results = self._results(self.client.post(self.url, {"invites_file": upload}))
+        self.assertIn("field larger than field limit", results[-2]["error"])
+        self.assertEqual(results[-1]["summary"]["invited"], 1)
+
+    def test_bulk_requires_file(self):
+        self.client.force_authenticate(user=self.golden)
+        resp = self.client.post(self.url, {})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_denied_role(self):
+        self.client.force_authenticate(user=self.mason)
+        upload = SimpleUploadedFile("invites.csv", b"email\nblocked@example.com\n")
+        resp = self.client.post(self.url, {"invites_file": upload})
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
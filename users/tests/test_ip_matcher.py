@@ -0,0 +1,39 @@
+from unittest import TestCase
+from users.ip_matcher import IPRangeMatcher, ip_to_int, parse_ip_range, merge_ranges
+
+
+class IPRangeMatcherTests(TestCase):
+    """tests CIDR/range parsing and lookups"""
+
+    def test_ipv4_and_mapped_ipv6_share_a_key(self):
+        self.assertEqual(ip_to_int('10.0.0.1'), ip_to_int('::ffff:10.0.0.1'))
+        self.assertNotEqual(ip_to_int('10.0.0.1'), ip_to_int('::10.0.0.1'))
+
+    def test_invalid_address_raises(self):
+        with self.assertRaises(ValueError):
+            ip_to_int('not-an-ip')
+
+    def test_parse_cidr_and_range(self):
+        start, end = parse_ip_range('192.168.16.0/20')
+        self.assertEqual(end - start + 1, 4096)
+        self.assertEqual(parse_ip_range('10.0.0.1-10.0.0.9'), (ip_to_int('10.0.0.1'), ip_to_int('10.0.0.9')))
+        self.assertEqual(parse_ip_range('2001:db8::1'), (ip_to_int('2001:db8::1'), ip_to_int('2001:db8::1')))
+
+    def test_parse_rejects_bad_ranges(self):
+        for value in ['10.0.0.9-10.0.0.1', '10.0.0.1-2001:db8::1', '10.0.0.0/33', 'garbage']:
+            with self.assertRaises(ValueError):
+                parse_ip_range(value)
+
+    def test_merge_ranges_joins_overlapping_and_adjacent(self):
+        self.assertEqual(merge_ranges([(10, 20), (1, 5), (6, 8), (15, 30), (40, 41)]),
+                         ([1, 10, 40], [8, 30, 41]))
+
+    def test_contains(self):
+        matcher = IPRangeMatcher.from_networks(['10.0.0.0/20', '2001:db8::/32', '172.16.0.5-172.16.0.10'])
+        for ip in ['10.0.0.0', '10.0.15.255', '2001:db8:ffff::1', '172.16.0.7', '::ffff:10.0.1.1']:
+            self.assertIn(ip, matcher)
+        for ip in ['10.0.16.0', '9.255.255.255', '2001:db9::', '172.16.0.11', 'garbage']:
+            self.assertNotIn(ip, matcher)
+
+    def test_empty_matcher(self):
+        self.assertNotIn('10.0.0.1', IPRangeMatcher())
@@ -0,0 +1,48 @@
+import os
+import tempfile
+from unittest import TestCase
+from users.ip_matcher import parse_ip_range, ip_to_int
+from users.ip_snapshot import IPSnapshot, write_snapshot
+
+
+class IPSnapshotTests(TestCase):
+    """tests the mmapped blacklist snapshot file"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'blacklist.bin')
+
+    def test_round_trip_lookups(self):
+        key = ip_to_int('198.51.100.7')
+        ranges = [(key, key), parse_ip_range('10.0.0.0/20'), parse_ip_range('2001:db8::/32')]
+        self.assertEqual(write_snapshot(self.path, ranges, (3, 1, 2)), 3)
+
+        snapshot = IPSnapshot(self.path)
+        self.assertEqual(snapshot.generations, (3, 1, 2))
+        self.assertEqual(len(snapshot), 3)
+        for ip in ['198.51.100.7', '10.0.15.255', '2001:db8::abcd', key]:
+            self.assertIn(ip, snapshot)
+        for ip in ['198.51.100.8', '10.0.16.0', '2001:db9::', '::', 'garbage']:
+            self.assertNotIn(ip, snapshot)
+
+    def test_empty_snapshot(self):
+        write_snapshot(self.path, [])
+        self.assertNotIn('10.0.0.1', IPSnapshot(self.path))
+
+    def test_replacing_file_is_detected(self):
+        write_snapshot(self.path, [parse_ip_range('10.0.0.1')])
+        snapshot = IPSnapshot(self.path)
+        self.assertTrue(snapshot.is_current())
+
+        write_snapshot(self.path, [parse_ip_range('10.0.0.2')])
+        self.assertFalse(snapshot.is_current())
+        self.assertIn('10.0.0.1', snapshot)
+        self.assertIn('10.0.0.2', IPSnapshot(self.path))
+        self.assertEqual(os.listdir(self.tmpdir.name), ['blacklist.bin'])
+
+    def test_rejects_foreign_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot at all, definitely not')
+        with self.assertRaises(ValueError):
+            IPSnapshot(self.path)
@@ -1,10 +1,23 @@
+import io
 import os
+from datetime import timedelta
+from unittest.mock import patch
 from dotenv import load_dotenv
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
-from users.models import Marker, Role
+from users.models import Generation, Marker, Role
+from users import geohash, regions, tiles
+from users.clusters import compute_clusters
+from users.generations import bump_generation, get_generations, MARKERS, MARKER_TILES
+from users.spatial_index import marker_index
 load_dotenv()
 
 User = get_user_model()
@@ -115,4 +128,543 @@ class MarkerViewSetTests(APITestCase):
             self.assertEqual(
                 response.status_code, status.HTTP_204_NO_CONTENT)
             self.assertFalse(Marker.objects.filter(id=marker_to_delete.id).exists())
-        self.client.force_authenticate(user=None)
\ No newline at end of file
+        self.client.force_authenticate(user=None)
+
+class MarkerBboxTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='mason@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.MASON
+        )
+        self.client.force_authenticate(user=self.user)
+        self.list_url = reverse('markers-list')
+        for name, lat, lng in [('Kyiv', 50.45, 30.52), ('Lviv', 49.84, 24.03),
+                               ('Fiji', -17.7, 178.0), ('Samoa', -13.8, -172.1), ('Lima', -12.0, -77.0)]:
+            Marker.objects.create(name=name, lat=lat, lng=lng)
+        Marker.objects.create(name='Nowhere')
+
+    def names(self, bbox):
+        response = self.client.get(self.list_url, {'bbox': bbox})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(marker['name'] for marker in response.data)
+
+    def test_bbox_filters_markers(self):
+        self.assertEqual(self.names('20,45,35,55'), ['Kyiv', 'Lviv'])
+        self.assertEqual(self.names('29,50,31,51'), ['Kyiv'])
+
+    def test_bbox_across_antimeridian(self):
+        self.assertEqual(self.names('170,-20,-170,-10'), ['Fiji', 'Samoa'])
+        self.assertEqual(self.names('170,-20,190,-10'), ['Fiji', 'Samoa'])
+
+    def test_bbox_whole_world(self):
+        self.assertEqual(self.names('-180,-90,180,90'), ['Fiji', 'Kyiv', 'Lima', 'Lviv', 'Samoa'])
+
+    def test_without_bbox_returns_all(self):
+        response = self.client.get(self.list_url)
+        self.assertEqual(len(response.json()), 6)
+
+    def test_invalid_bbox(self):
+        for bbox in ['1,2,3', 'a,b,c,d', '0,10,10,0', 'nan,0,1,1']:
+            response = self.client.get(self.list_url, {'bbox': bbox})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MarkerClusterTests(APITestCase):
+
+    def setUp(self):
+        # Generations restart with every test database transaction.
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='golden@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.GOLDEN
+        )
+        self.client.force_authenticate(user=self.user)
+        self.list_url = reverse('markers-list')
+        Marker.objects.create(name='Kyiv 1', lat=50.45, lng=30.52)
+        Marker.objects.create(name='Kyiv 2', lat=50.46, lng=30.50)
+        Marker.objects.create(name='Lima', lat=-12.0, lng=-77.0)
+
+    def test_low_zoom_returns_clusters(self):
+        response = self.client.get(self.list_url, {'zoom': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        clusters = sorted(response.data['clusters'], key=lambda cluster: cluster['count'])
+        self.assertEqual([cluster['count'] for cluster in clusters], [1, 2])
+        self.assertAlmostEqual(clusters[1]['lat'], 50.455)
+
+    def test_high_zoom_returns_raw_markers(self):
+        response = self.client.get(self.list_url, {'zoom': 16, 'bbox': '30,50,31,51'})
+        self.assertEqual(sorted(marker['name'] for marker in response.data), ['Kyiv 1', 'Kyiv 2'])
+
+    def test_clusters_limited_to_bbox(self):
+        response = self.client.get(self.list_url, {'zoom': 2, 'bbox': '-80,-20,-70,0'})
+        self.assertEqual([cluster['count'] for cluster in response.data['clusters']], [1])
+
+    def test_bbox_keeps_cluster_with_centroid_outside(self):
+        # At zoom 2 the Kyiv markers share a cell; the bbox holds only Kyiv 1, west of the centroid.
+        response = self.client.get(self.list_url, {'zoom': 2, 'bbox': '30.515,50.445,30.525,50.452'})
+        self.assertEqual([cluster['count'] for cluster in response.data['clusters']], [2])
+
+    def test_bbox_across_antimeridian(self):
+        Marker.objects.create(name='Fiji', lat=-17.7, lng=178.0)
+        response = self.client.get(self.list_url, {'zoom': 2, 'bbox': '170,-20,-170,-10'})
+        self.assertEqual([cluster['count'] for cluster in response.data['clusters']], [1])
+
+    def test_cell_split_across_blocks_is_merged(self):
+        # The cell spans the zoom-4 tile edge at about 55.78 degrees.
+        Marker.objects.create(name='South', lat=55.5, lng=37.6)
+        Marker.objects.create(name='North', lat=56.0, lng=37.6)
+        response = self.client.get(self.list_url, {'zoom': 6, 'bbox': '37,55,38,56.5'})
+        clusters = response.data['clusters']
+        self.assertEqual([cluster['count'] for cluster in clusters], [2])
+        self.assertAlmostEqual(clusters[0]['lat'], 55.75)
+
+    def test_write_recomputes_only_its_block(self):
+        params = {'zoom': 8, 'bbox': '-80,-20,35,55'}
+        response = self.client.get(self.list_url, params)
+        self.assertEqual(sorted(cluster['count'] for cluster in response.data['clusters']), [1, 2])
+
+        self.client.post(self.list_url, {'name': 'Kyiv 3', 'lat': 50.4501, 'lng': 30.5199})
+        with patch('users.clusters.compute_clusters', wraps=compute_clusters) as compute:
+            response = self.client.get(self.list_url, params)
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(sum(cluster['count'] for cluster in response.data['clusters']), 4)
+
+    def test_cache_invalidated_on_create_and_destroy(self):
+        self.client.get(self.list_url, {'zoom': 1})
+        with self.assertNumQueries(1):
+            self.client.get(self.list_url, {'zoom': 1})
+
+        self.client.post(self.list_url, {'name': 'Kyiv 3', 'lat': 50.44, 'lng': 30.51})
+        response = self.client.get(self.list_url, {'zoom': 1})
+        self.assertEqual(sum(cluster['count'] for cluster in response.data['clusters']), 4)
+
+        lima = Marker.objects.get(name='Lima')
+        self.client.delete(reverse('markers-detail', args=[lima.id]))
+        response = self.client.get(self.list_url, {'zoom': 1})
+        self.assertEqual(sum(cluster['count'] for cluster in response.data['clusters']), 3)
+
+    def test_invalid_zoom(self):
+        response = self.client.get(self.list_url, {'zoom': 'far'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MarkerGeohashTests(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='mason@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.MASON
+        )
+        self.client.force_authenticate(user=self.user)
+        self.list_url = reverse('markers-list')
+        self.kyiv = Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+        Marker.objects.create(name='Kyiv suburb', lat=50.46, lng=30.55)
+        Marker.objects.create(name='Lviv', lat=49.84, lng=24.03)
+
+    def test_geohash_computed_on_save(self):
+        self.assertEqual(self.kyiv.geohash[:5], 'u8vxn')
+        self.kyiv.lat, self.kyiv.lng = 49.84, 24.03
+        self.kyiv.save(update_fields=['lat', 'lng'])
+        self.kyiv.refresh_from_db()
+        self.assertEqual(self.kyiv.geohash, Marker.objects.get(name='Lviv').geohash)
+
+    def test_cell_query(self):
+        response = self.client.get(self.list_url, {'cell': 'u8vx'})
+        self.assertEqual(sorted(marker['name'] for marker in response.data), ['Kyiv', 'Kyiv suburb'])
+        self.assertEqual(self.client.get(self.list_url, {'cell': 'ail'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_near_query_sorted_by_distance(self):
+        response = self.client.get(self.list_url, {'near': '50.461,30.551', 'radius': 5000})
+        self.assertEqual([marker['name'] for marker in response.data], ['Kyiv suburb', 'Kyiv'])
+        response = self.client.get(self.list_url, {'near': '50.45,30.52', 'radius': 500000})
+        self.assertEqual(len(response.data), 3)
+
+    def test_near_query_validation(self):
+        for params in [{'near': '50.45'}, {'near': '50,30', 'radius': '-1'}, {'near': '95,30'}]:
+            self.assertEqual(self.client.get(self.list_url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_command(self):
+        Marker.objects.update(geohash='')
+        call_command('backfill_geohash', stdout=io.StringIO())
+        self.assertFalse(Marker.objects.filter(geohash='').exists())
+
+
+class MarkerTileTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='golden@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.GOLDEN
+        )
+        self.client.force_authenticate(user=self.user)
+        self.list_url = reverse('markers-list')
+        self.kyiv = Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+        Marker.objects.create(name='Lima', lat=-12.0, lng=-77.0)
+
+    def tile_url(self, z, lat, lng):
+        x, y = regions.point_tile(lat, lng, z)
+        return reverse('markers-tile', args=[z, x, y])
+
+    def test_point_tile_and_bbox_agree(self):
+        x, y = regions.point_tile(50.45, 30.52, 10)
+        self.assertEqual((x, y), (598, 345))
+        min_lng, min_lat, max_lng, max_lat = regions.tile_bbox(10, x, y)
+        self.assertTrue(min_lat <= 50.45 <= max_lat and min_lng <= 30.52 <= max_lng)
+
+    def test_low_zoom_tile_has_clusters(self):
+        response = self.client.get(reverse('markers-tile', args=[0, 0, 0]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        data = response.json()
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual(sorted(f['properties']['count'] for f in data['features']), [1, 1])
+
+    def test_high_zoom_tile_has_markers(self):
+        response = self.client.get(self.tile_url(15, 50.45, 30.52))
+        features = response.json()['features']
+        self.assertEqual([f['id'] for f in features], [self.kyiv.id])
+        self.assertEqual(features[0]['geometry']['coordinates'], [30.52, 50.45])
+        self.assertEqual(features[0]['properties']['name'], 'Kyiv')
+
+    def test_etag_returns_not_modified(self):
+        url = self.tile_url(5, 50.45, 30.52)
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_create_invalidates_covering_tiles_only(self):
+        kyiv_url = self.tile_url(15, 50.45, 30.52)
+        lima_url = self.tile_url(15, -12.0, -77.0)
+        self.client.get(kyiv_url)
+        lima_etag = self.client.get(lima_url)['ETag']
+
+        self.client.post(self.list_url, {'name': 'Kyiv 2', 'lat': 50.4501, 'lng': 30.5199})
+        response = self.client.get(kyiv_url)
+        self.assertEqual(len(response.json()['features']), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(lima_url)['ETag'], lima_etag)
+
+    def test_tile_cached_after_a_write_is_not_served(self):
+        url = self.tile_url(15, 50.45, 30.52)
+        with patch.object(tiles.cache, 'set', wraps=tiles.cache.set) as cache_set:
+            self.client.get(url)
+        (key, stale, _), _ = cache_set.call_args
+
+        self.client.post(self.list_url, {'name': 'Kyiv 2', 'lat': 50.4501, 'lng': 30.5199})
+        # A render that read the rows before the write stores its tile late.
+        cache.set(key, stale)
+        self.assertEqual(len(self.client.get(url).json()['features']), 2)
+
+    def test_write_bumps_one_region_per_region_zoom(self):
+        url = self.tile_url(2, 50.45, 30.52)
+        self.client.get(url)
+        counters = Generation.objects.filter(name__startswith=f'{MARKER_TILES}:')
+        before = dict(counters.values_list('name', 'value'))
+        self.client.post(self.list_url, {'name': 'Kyiv 2', 'lat': 50.4501, 'lng': 30.5199})
+        bumped = [name for name, value in counters.values_list('name', 'value') if before.get(name) != value]
+        self.assertEqual(len(bumped), len(regions.REGION_ZOOMS))
+        # Tiles above the first region zoom follow the markers generation.
+        features = self.client.get(url).json()['features']
+        self.assertEqual([f['properties']['count'] for f in features], [2])
+
+    def test_moving_a_marker_outside_the_api_invalidates_both_tiles(self):
+        kyiv_url = self.tile_url(15, 50.45, 30.52)
+        lima_url = self.tile_url(15, -12.0, -77.0)
+        self.client.get(kyiv_url)
+        self.client.get(lima_url)
+
+        marker = Marker.objects.get(pk=self.kyiv.id)
+        marker.lat, marker.lng = -12.0001, -77.0001
+        marker.save()
+        self.assertEqual(self.client.get(kyiv_url).json()['features'], [])
+        self.assertEqual(len(self.client.get(lima_url).json()['features']), 2)
+
+    def test_destroy_invalidates_tile(self):
+        url = self.tile_url(15, 50.45, 30.52)
+        self.client.get(url)
+        self.client.delete(reverse('markers-detail', args=[self.kyiv.id]))
+        self.assertEqual(self.client.get(url).json()['features'], [])
+
+    def test_invalid_tile(self):
+        response = self.client.get(reverse('markers-tile', args=[2, 4, 0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MarkerNearbyTests(APITestCase):
+
+    def setUp(self):
+        marker_index.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='golden@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.GOLDEN
+        )
+        self.client.force_authenticate(user=self.user)
+        self.list_url = reverse('markers-list')
+        self.nearby_url = reverse('markers-nearby')
+        self.kyiv = Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+        Marker.objects.create(name='Lviv', lat=49.84, lng=24.03)
+        Marker.objects.create(name='Lima', lat=-12.0, lng=-77.0)
+
+    def names(self, params):
+        response = self.client.get(self.nearby_url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [marker['name'] for marker in response.data]
+
+    def test_k_nearest_closest_first(self):
+        response = self.client.get(self.nearby_url, {'lat': 50.4, 'lng': 30.5, 'k': 2})
+        self.assertEqual([marker['name'] for marker in response.data], ['Kyiv', 'Lviv'])
+        self.assertLess(response.data[0]['distance'], 6000)
+
+    def test_radius_limits_results(self):
+        self.assertEqual(self.names({'lat': 50.4, 'lng': 30.5, 'radius': 10000}), ['Kyiv'])
+
+    def test_create_and_destroy_update_index(self):
+        self.names({'lat': 50.4, 'lng': 30.5})
+        self.client.post(self.list_url, {'name': 'Bila Tserkva', 'lat': 49.8, 'lng': 30.1})
+        self.client.delete(reverse('markers-detail', args=[self.kyiv.id]))
+        with self.assertNumQueries(1):
+            names = self.names({'lat': 50.4, 'lng': 30.5, 'k': 2})
+        self.assertEqual(names, ['Bila Tserkva', 'Lviv'])
+
+    def test_rebuilt_when_generation_moves(self):
+        self.names({'lat': 50.4, 'lng': 30.5})
+        Marker.objects.create(name='Irpin', lat=50.52, lng=30.25)
+        bump_generation(MARKERS)
+        with self.settings(MARKER_INDEX_REFRESH_INTERVAL_MS=0):
+            self.assertEqual(self.names({'lat': 50.52, 'lng': 30.25, 'k': 1}), ['Irpin'])
+
+    def test_invalid_params(self):
+        for params in ({'lat': 'x', 'lng': 1}, {'lng': 1}, {'lat': 1, 'lng': 1, 'k': 0},
+                       {'lat': 1, 'lng': 1, 'radius': -5}):
+            response = self.client.get(self.nearby_url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MarkerListCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='architect@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.ARCHITECT
+        )
+        self.client.force_authenticate(user=self.user)
+        self.list_url = reverse('markers-list')
+        self.marker = Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+
+    def test_cached_list_matches_serializer_output(self):
+        self.client.get(self.list_url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.list_url)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        uncached = self.client.get(self.list_url, {'bbox': '-180,-90,180,90'})
+        self.assertEqual(response.content, uncached.content)
+
+    def test_writes_invalidate_list(self):
+        self.client.get(self.list_url)
+        self.client.post(self.list_url, {'name': 'Lviv', 'lat': 49.84, 'lng': 24.03})
+        self.assertEqual(len(self.client.get(self.list_url).json()), 2)
+
+        self.client.delete(reverse('markers-detail', args=[self.marker.id]))
+        self.assertEqual([marker['name'] for marker in self.client.get(self.list_url).json()], ['Lviv'])
+
+        self.client.post(reverse('compromised-list'))
+        self.assertEqual(self.client.get(self.list_url).json(), [])
+
+
+@override_settings(MARKER_CHANGES_SETTLE_SECONDS=0)
+class MarkerChangesTests(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='golden@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.GOLDEN
+        )
+        self.client.force_authenticate(user=self.user)
+        self.list_url = reverse('markers-list')
+        self.changes_url = reverse('markers-changes')
+        self.kyiv = Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+        self.lviv = Marker.objects.create(name='Lviv', lat=49.84, lng=24.03)
+
+    def changes(self, since=None):
+        response = self.client.get(self.changes_url, {'since': since} if since else {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_full_sync_then_deltas(self):
+        first = self.changes()
+        self.assertEqual([marker['name'] for marker in first['upserts']], ['Kyiv', 'Lviv'])
+        self.assertFalse(first['has_more'])
+
+        self.assertEqual(self.changes(first['cursor'])['upserts'], [])
+
+        self.client.post(self.list_url, {'name': 'Lima', 'lat': -12.0, 'lng': -77.0})
+        self.client.delete(reverse('markers-detail', args=[self.kyiv.id]))
+        delta = self.changes(first['cursor'])
+        self.assertEqual([marker['name'] for marker in delta['upserts']], ['Lima'])
+        self.assertEqual(delta['deletions'], [self.kyiv.id])
+
+    def test_destroy_keeps_tombstone(self):
+        self.client.delete(reverse('markers-detail', args=[self.kyiv.id]))
+        self.assertFalse(Marker.objects.filter(pk=self.kyiv.id).exists())
+        self.assertIsNotNone(Marker.all_objects.get(pk=self.kyiv.id).deleted_at)
+        response = self.client.delete(reverse('markers-detail', args=[self.kyiv.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_model_and_queryset_deletes_leave_tombstones(self):
+        generation = get_generations(MARKERS)[MARKERS]
+        self.kyiv.delete()
+        Marker.objects.filter(pk=self.lviv.id).delete()
+        self.assertEqual(Marker.all_objects.filter(deleted_at__isnull=False).count(), 2)
+        self.assertEqual(get_generations(MARKERS)[MARKERS], generation + 2)
+
+    def test_admin_delete_leaves_tombstone(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password=os.environ.get('TEST_PASSWORD'))
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:users_marker_changelist'), {
+            'action': 'delete_selected', '_selected_action': [self.kyiv.id], 'post': 'yes'})
+        self.assertIsNotNone(Marker.all_objects.get(pk=self.kyiv.id).deleted_at)
+
+    def test_pages_follow_cursor(self):
+        with patch('users.marker_changes.PAGE_SIZE', 1):
+            page = self.client.get(self.changes_url).data
+            self.assertTrue(page['has_more'])
+            self.assertEqual(self.changes(page['cursor'])['upserts'][0]['name'], 'Lviv')
+
+    def test_invalid_and_expired_cursors(self):
+        response = self.client.get(self.changes_url, {'since': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        cursor = self.changes()['cursor']
+        self.client.post(reverse('compromised-list'))
+        response = self.client.get(self.changes_url, {'since': cursor})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_purge_removes_old_tombstones(self):
+        self.kyiv.soft_delete()
+        Marker.all_objects.filter(pk=self.kyiv.id).update(updated_at=timezone.now() - timedelta(days=31))
+        call_command('purge_marker_tombstones', stdout=io.StringIO())
+        self.assertFalse(Marker.all_objects.filter(pk=self.kyiv.id).exists())
+        self.assertTrue(Marker.objects.filter(pk=self.lviv.id).exists())
+
+
+class MarkerBulkTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.silver = User.objects.create_user(
+            email='silver@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.SILVER
+        )
+        self.golden = User.objects.create_user(
+            email='golden@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.GOLDEN
+        )
+        self.client.force_authenticate(user=self.silver)
+        self.bulk_url = reverse('markers-bulk')
+
+    def test_bulk_create(self):
+        markers = [{'name': f'Site {i}', 'lat': 50 + i / 100, 'lng': 30.5} for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.bulk_url, markers, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "markers"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual([marker['name'] for marker in response.data], [m['name'] for m in markers])
+        created = Marker.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(created.user, self.silver)
+        self.assertEqual(created.geohash, geohash.encode(50, 30.5))
+
+    def test_bulk_create_is_all_or_nothing(self):
+        markers = [{'name': 'Good', 'lat': 1, 'lng': 2}, {'lat': 1, 'lng': 2}]
+        response = self.client.post(self.bulk_url, markers, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', response.data[1])
+        self.assertFalse(Marker.objects.exists())
+
+    def test_bulk_create_limits(self):
+        for body in ([], {'name': 'x'}, [{'name': 'x'}] * 201):
+            response = self.client.post(self.bulk_url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_delete_requires_golden(self):
+        marker = Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+        response = self.client.delete(self.bulk_url, {'ids': [marker.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_delete(self):
+        first = Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+        second = Marker.objects.create(name='Lviv', lat=49.84, lng=24.03)
+        kept = Marker.objects.create(name='Lima', lat=-12.0, lng=-77.0)
+        self.client.force_authenticate(user=self.golden)
+        response = self.client.delete(self.bulk_url, {'ids': [first.id, second.id, 999999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'deleted': 2, 'not_found': [999999]})
+        self.assertEqual(list(Marker.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(Marker.all_objects.filter(deleted_at__isnull=False).count(), 2)
+
+    def test_bulk_delete_rejects_bad_ids(self):
+        self.client.force_authenticate(user=self.golden)
+        for body in ({}, {'ids': []}, {'ids': ['1']}, {'ids': [True]}):
+            response = self.client.delete(self.bulk_url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MarkerContentHashTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.golden = User.objects.create_user(
+            email='golden@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.GOLDEN
+        )
+        self.client.force_authenticate(user=self.golden)
+
+    def test_created_markers_are_hashed(self):
+        response = self.client.post(reverse('markers-list'), {'name': 'Kyiv', 'lat': '50.45', 'lng': '30.52'})
+        single = Marker.objects.get(pk=response.data['id'])
+        response = self.client.post(reverse('markers-bulk'), [{'name': 'Lviv', 'lat': 49.84, 'lng': 24.03}],
+                                    format='json')
+        bulk = Marker.objects.get(pk=response.data[0]['id'])
+        for marker in (single, bulk):
+            self.assertEqual(marker.content_hash, marker.compute_content_hash())
+
+    def test_delete_frees_the_content(self):
+        marker = Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+        other = Marker.objects.create(name='Lviv', lat=49.84, lng=24.03)
+        self.assertIsNotNone(marker.content_hash)
+        marker.soft_delete()
+        self.client.delete(reverse('markers-bulk'), {'ids': [other.id]}, format='json')
+        self.assertFalse(Marker.all_objects.filter(content_hash__isnull=False).exists())
+        Marker.objects.create(name='Kyiv', lat=50.45, lng=30.52)
+        Marker.objects.create(name='Lviv', lat=49.84, lng=24.03)
+
+    def test_hash_follows_edits(self):
+        marker = Marker.objects.create(name='Kyiv', lat=50, lng=30)
+        marker.name = 'Kyiv centre'
+        marker.save(update_fields=['name'])
+        marker.refresh_from_db()
+        self.assertEqual(marker.content_hash, marker.compute_content_hash())
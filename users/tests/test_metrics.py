@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import tempfile
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+from django.contrib.auth import get_user_model
+from users.models import Marker, Role
+from auth.metrics import registry, render_metrics, RETIRED_FILE
+
+User = get_user_model()
+
+
+class MetricsTests(APITestCase):
+    """tests per-route request metrics and the /metrics endpoint"""
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='metrics@example.com', password='pw', role=Role.MASON)
+        Marker.objects.create(name='M', lat=1.0, lng=2.0)
+        token = self.settings(METRICS_TOKEN='scrape-token')
+        token.enable()
+        self.addCleanup(token.disable)
+
+    def scrape(self):
+        return self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token')
+
+    def test_records_route_latency_and_queries(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('markers-list'))
+        self.client.get(reverse('markers-list'))
+
+        body = self.scrape().content.decode()
+        self.assertIn('http_requests_total{route="markers-list",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_bucket{route="markers-list",le="+Inf"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{route="markers-list"} 2', body)
+        self.assertRegex(body, r'db_queries_total\{route="markers-list"\} [1-9]')
+        self.assertIn('db_query_duration_seconds_total{route="markers-list"}', body)
+
+    def test_unresolved_path(self):
+        self.client.get('/no-such-page/')
+        self.assertIn('route="unmatched",method="GET",status="404"', self.scrape().content.decode())
+
+    def test_workers_are_summed_through_metrics_dir(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            registry.observe('vote-list', 'GET', 200, 0.02, 3, 0.001)
+            registry.flush()
+            # Another running worker's file.
+            os.rename(os.path.join(directory, registry.file_name()),
+                      os.path.join(directory, f'metrics-{os.getppid()}-0.json'))
+            registry.reset()
+            registry.observe('vote-list', 'GET', 200, 0.3, 2, 0.001)
+
+            totals = registry.collect()
+
+        self.assertEqual(totals['requests'], {'vote-list|GET|200': 2})
+        self.assertEqual(totals['queries'], {'vote-list': 5})
+        body = render_metrics(totals)
+        self.assertIn('http_request_duration_seconds_bucket{route="vote-list",le="0.025"} 1', body)
+        self.assertIn('http_request_duration_seconds_bucket{route="vote-list",le="0.5"} 2', body)
+
+    def test_dead_workers_are_retired(self):
+        worker = subprocess.Popen([sys.executable, '-c', ''])
+        worker.wait()
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            registry.observe('vote-list', 'GET', 200, 0.02, 3, 0.001)
+            registry.flush()
+            os.rename(os.path.join(directory, registry.file_name()),
+                      os.path.join(directory, f'metrics-{worker.pid}-0.json'))
+            registry.reset()
+            registry.observe('vote-list', 'GET', 200, 0.3, 2, 0.001)
+
+            first = registry.collect()
+            second = registry.collect()
+            files = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+
+        self.assertEqual(first['requests'], {'vote-list|GET|200': 2})
+        self.assertEqual(second, first)
+        self.assertEqual(files, sorted([RETIRED_FILE, registry.file_name()]))
+
+    def test_scrape_requires_token_or_staff(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        staff = User.objects.create_user(email='staff@example.com', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
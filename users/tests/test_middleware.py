@@ -1,8 +1,13 @@
 import os
+import tempfile
+from unittest.mock import patch
 from dotenv import load_dotenv
 from django.test import TestCase, RequestFactory
 from django.http import JsonResponse, HttpResponseRedirect
-from users.models import BlacklistedIP
+from django.core.exceptions import ValidationError
+from users.models import BlacklistedIP, BlacklistedNetwork
+from users.blacklist import Blacklist, get_blacklist
+from users.gate import BlacklistWSGIGate
 from users.middleware import IPBlacklistMiddleware
 
 load_dotenv()
@@ -114,3 +119,140 @@ class IPBlacklistMiddlewareTests(TestCase):
             request.headers = {}
             response = middleware(request)
             self.assertIsInstance(response, HttpResponseRedirect)
+
+
+class BlacklistGenerationTests(TestCase):
+    """tests cross-worker blacklist refresh through the generation counter"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _request(self, ip):
+        request = self.factory.get('/', HTTP_ACCEPT='application/json')
+        request.META['REMOTE_ADDR'] = ip
+        return request
+
+    def test_new_ban_is_pulled_without_update_blacklist(self):
+        """a ban saved elsewhere is seen after the refresh interval"""
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0):
+            middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            self.assertEqual(middleware(self._request(banned_ip)), 'OK')
+
+            BlacklistedIP.objects.create(ip_address=banned_ip, reason='Banned by vote')
+            self.assertEqual(middleware(self._request(banned_ip)).status_code, 403)
+
+    def test_deleted_ban_triggers_full_reload(self):
+        """removing an entry lifts the ban"""
+        ban = BlacklistedIP.objects.create(ip_address=banned_ip)
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0):
+            middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            self.assertEqual(middleware(self._request(banned_ip)).status_code, 403)
+
+            ban.delete()
+            self.assertEqual(middleware(self._request(banned_ip)), 'OK')
+
+    def test_generation_checked_at_most_once_per_interval(self):
+        """requests inside the interval do not touch the database"""
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=60000):
+            middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            BlacklistedIP.objects.create(ip_address=banned_ip)
+            with self.assertNumQueries(0):
+                self.assertEqual(middleware(self._request(banned_ip)), 'OK')
+
+    def test_unchanged_generation_skips_reload(self):
+        """an unchanged generation costs a single query"""
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0):
+            middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            with self.assertNumQueries(1):
+                middleware(self._request(ip_address))
+
+    def test_banned_network_blocks_whole_subnet(self):
+        """a CIDR ban covers every address inside it"""
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0):
+            middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            BlacklistedNetwork.objects.create(network='203.0.113.0/24', reason='VPN provider')
+
+            self.assertEqual(middleware(self._request('203.0.113.77')).status_code, 403)
+            self.assertEqual(middleware(self._request('203.0.114.1')), 'OK')
+
+    def test_gate_and_middleware_share_one_copy(self):
+        """a worker loads and polls the blacklist once for both layers"""
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/'):
+            middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            gate = BlacklistWSGIGate(lambda environ, start_response: [])
+            with patch('users.gate.close_old_connections'), self.assertNumQueries(0):
+                gate.refresh()
+            self.assertIs(gate.blacklist, middleware.blacklist)
+            self.assertIs(get_blacklist(), middleware.blacklist)
+
+    def test_invalid_network_row_is_skipped(self):
+        """a network saved without validation does not break loading"""
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0):
+            BlacklistedNetwork.objects.create(network='10.0.0.0/99')
+            middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            BlacklistedNetwork.objects.create(network='203.0.113.0/24')
+            with self.assertLogs('users.blacklist', 'WARNING'):
+                self.assertEqual(middleware(self._request('203.0.113.77')).status_code, 403)
+
+    def test_invalid_network_fails_validation(self):
+        """networks are validated before they are saved"""
+        with self.assertRaises(ValidationError):
+            BlacklistedNetwork(network='10.0.0.0/99').full_clean()
+
+
+class BlacklistSnapshotTests(TestCase):
+    """tests the shared mmapped blacklist mode"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'blacklist.bin')
+
+    def _request(self, ip):
+        request = self.factory.get('/', HTTP_ACCEPT='application/json')
+        request.META['REMOTE_ADDR'] = ip
+        return request
+
+    def test_workers_share_one_snapshot(self):
+        """a ban rebuilds the file once and every worker sees it"""
+        BlacklistedNetwork.objects.create(network='203.0.113.0/24')
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0,
+                           BLACKLIST_SNAPSHOT_PATH=self.path):
+            first = IPBlacklistMiddleware(lambda request: 'OK')
+            # Another worker process has its own copy.
+            second = Blacklist.from_settings()
+            self.assertTrue(os.path.exists(self.path))
+            self.assertIn('203.0.113.9', second)
+            self.assertEqual(first(self._request(banned_ip)), 'OK')
+
+            BlacklistedIP.objects.create(ip_address=banned_ip)
+            self.assertEqual(first(self._request(banned_ip)).status_code, 403)
+            with self.assertNumQueries(1):
+                second.refresh_if_due()
+            self.assertIn(banned_ip, second)
+
+    def test_removed_ban_is_lifted(self):
+        """deleting a ban rebuilds the snapshot without it"""
+        ban = BlacklistedIP.objects.create(ip_address=banned_ip)
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0,
+                           BLACKLIST_SNAPSHOT_PATH=self.path):
+            middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            self.assertEqual(middleware(self._request(banned_ip)).status_code, 403)
+            ban.delete()
+            self.assertEqual(middleware(self._request(banned_ip)), 'OK')
+
+    def test_unwritable_snapshot_falls_back_to_memory(self):
+        """a worker that cannot build the snapshot still enforces bans"""
+        BlacklistedIP.objects.create(ip_address=banned_ip)
+        not_a_directory = self.path + '.file'
+        open(not_a_directory, 'w').close()
+        with self.settings(BLACKLIST_REDIRECT_URL='/banned/', BLACKLIST_REFRESH_INTERVAL_MS=0,
+                           BLACKLIST_SNAPSHOT_PATH=os.path.join(not_a_directory, 'blacklist.bin')):
+            with self.assertLogs('users.blacklist', 'ERROR'):
+                middleware = IPBlacklistMiddleware(lambda request: 'OK')
+            self.assertEqual(middleware(self._request(banned_ip)).status_code, 403)
+
+            BlacklistedIP.objects.create(ip_address=ip_address)
+            with self.assertLogs('users.blacklist', 'ERROR'):
+                self.assertEqual(middleware(self._request(ip_address)).status_code, 403)
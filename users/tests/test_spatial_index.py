@@ -0,0 +1,47 @@
+from unittest import TestCase
+import numpy as np
+from users.geohash import haversine_m
+from users.spatial_index import KDTree, to_unit_vectors, chord_for
+
+
+class KDTreeTests(TestCase):
+    """tests the k-d tree against a brute-force scan"""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.lat = np.degrees(np.arcsin(rng.uniform(-1, 1, 5000)))
+        self.lng = rng.uniform(-180, 180, 5000)
+        self.ids = np.arange(1, 5001)
+        self.tree = KDTree(self.ids, to_unit_vectors(self.lat, self.lng), leaf_size=16)
+
+    def brute_force(self, lat, lng):
+        distances = [haversine_m(lat, lng, a, b) for a, b in zip(self.lat, self.lng)]
+        return [int(self.ids[i]) for i in np.argsort(distances, kind='stable')]
+
+    def test_nearest_matches_brute_force(self):
+        for lat, lng in [(50.45, 30.52), (-89.9, 0), (0, 179.99), (12.5, -77.0)]:
+            ids, _ = self.tree.nearest(to_unit_vectors(lat, lng)[0], 10)
+            self.assertEqual(ids.tolist(), self.brute_force(lat, lng)[:10])
+
+    def test_nearest_across_antimeridian(self):
+        tree = KDTree([1, 2], to_unit_vectors([0, 0], [179.9, 170.0]))
+        ids, _ = tree.nearest(to_unit_vectors(0, -179.9)[0], 1)
+        self.assertEqual(ids.tolist(), [1])
+
+    def test_within_radius(self):
+        query = to_unit_vectors(10, 10)[0]
+        ids, _ = self.tree.within(query, chord_for(1_000_000))
+        expected = {int(i) for i, a, b in zip(self.ids, self.lat, self.lng) if haversine_m(10, 10, a, b) <= 1_000_000}
+        self.assertEqual(set(ids.tolist()), expected)
+
+    def test_removed_points_are_skipped(self):
+        query = to_unit_vectors(50.45, 30.52)[0]
+        closest = int(self.tree.nearest(query, 1)[0][0])
+        self.assertTrue(self.tree.remove(closest))
+        self.assertFalse(self.tree.remove(closest))
+        self.assertNotIn(closest, self.tree.nearest(query, 5)[0].tolist())
+        self.assertEqual(len(self.tree), 4999)
+
+    def test_empty_tree(self):
+        tree = KDTree([], to_unit_vectors([], []))
+        self.assertEqual(tree.nearest(to_unit_vectors(0, 0)[0], 3)[0].tolist(), [])
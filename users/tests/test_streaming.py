@@ -0,0 +1,41 @@
+import io
+import json
+from unittest import TestCase
+from users.streaming import iter_json_array
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, content):
+        super().__init__(content)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+class IterJsonArrayTests(TestCase):
+    """tests the incremental JSON array reader"""
+
+    def test_items_across_small_chunks(self):
+        items = [{'name': 'a' * 50, 'values': [1, 2.5, None, True]}, 'text', -12.5e3, False]
+        content = json.dumps(items).encode()
+        self.assertEqual(list(iter_json_array(io.BytesIO(content), chunk_size=7)), items)
+
+    def test_malformed_item_fails_without_reading_the_rest(self):
+        content = b'[{"email": "ok@example.com"}, {bad}, ' + b'"x@example.com", ' * 100000 + b'"y"]'
+        fileobj = CountingFile(content)
+        items = iter_json_array(fileobj, chunk_size=64 * 1024)
+        self.assertEqual(next(items), {'email': 'ok@example.com'})
+        with self.assertRaises(ValueError):
+            next(items)
+        self.assertLessEqual(fileobj.reads, 2)
+
+    def test_oversized_item_is_rejected(self):
+        content = b'["' + b'x' * 5000 + b'"]'
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.BytesIO(content), chunk_size=512, max_item_size=2000))
+
+    def test_truncated_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.BytesIO(b'[1, {"a": tru')))
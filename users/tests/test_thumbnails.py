@@ -0,0 +1,70 @@
+import io
+import os
+import shutil
+import tempfile
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from users.models import Marker, Role
+from users.thumbnails import render_variant
+
+User = get_user_model()
+
+
+def jpeg_with_exif(size=(2000, 1500)):
+    image = Image.new('RGB', size, (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x010F] = 'ExampleCam'  # Make
+    output = io.BytesIO()
+    image.save(output, format='JPEG', exif=exif)
+    return output.getvalue()
+
+
+class ThumbnailTests(APITestCase):
+    """tests image variants generated after a marker upload"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root, THUMBNAIL_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='silver@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.SILVER
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_render_variant_fits_size_and_drops_exif(self):
+        data = render_variant(io.BytesIO(jpeg_with_exif()), (256, 256), 'WEBP')
+        with Image.open(io.BytesIO(data)) as variant:
+            self.assertEqual(variant.format, 'WEBP')
+            self.assertEqual(variant.size, (256, 192))
+            self.assertEqual(dict(variant.getexif()), {})
+
+    def test_create_generates_variants_after_commit(self):
+        upload = SimpleUploadedFile('photo.jpg', jpeg_with_exif(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('markers-list'), {'name': 'Photo', 'lat': 1, 'lng': 2, 'image': upload})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        marker = Marker.objects.get(pk=response.data['id'])
+        self.assertTrue(marker.thumbnail.name.endswith('photo_thumb.webp'))
+        self.assertTrue(marker.medium.name.endswith('photo_medium.webp'))
+        with Image.open(marker.medium.path) as medium:
+            self.assertEqual(medium.size, (1024, 768))
+
+        listed = self.client.get(reverse('markers-list')).json()[0]
+        self.assertIn('photo_thumb.webp', listed['thumbnail'])
+
+    def test_marker_without_image_schedules_nothing(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('markers-list'), {'name': 'Plain', 'lat': 1, 'lng': 2})
+        self.assertEqual(callbacks, [])
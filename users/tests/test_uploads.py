@@ -0,0 +1,101 @@
+import io
+import os
+import shutil
+import tempfile
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from users.models import Marker, Role
+from users.uploads import has_image_magic
+
+User = get_user_model()
+
+
+def png(size=(64, 48)):
+    output = io.BytesIO()
+    Image.new('RGB', size, (10, 120, 10)).save(output, format='PNG')
+    return output.getvalue()
+
+
+class MarkerImageUploadTests(APITestCase):
+    """tests that marker images are checked while they stream in"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root, THUMBNAIL_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='silver@example.com',
+            password=os.environ.get('TEST_PASSWORD'),
+            role=Role.SILVER
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('markers-list')
+
+    def upload(self, content, name='photo.png', content_type='image/png'):
+        image = SimpleUploadedFile(name, content, content_type=content_type)
+        return self.client.post(self.url, {'name': 'Photo', 'lat': 1, 'lng': 2, 'image': image})
+
+    def test_valid_image_is_stored(self):
+        response = self.upload(png())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        marker = Marker.objects.get(pk=response.data['id'])
+        self.assertTrue(os.path.exists(marker.image.path))
+
+    @override_settings(MAX_MARKER_IMAGE_SIZE=1024)
+    def test_oversized_image_is_rejected(self):
+        response = self.upload(png() + b'\0' * 4096)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(Marker.objects.exists())
+
+    @override_settings(MAX_MARKER_IMAGE_SIZE=1024)
+    def test_oversized_body_is_rejected_before_parsing(self):
+        response = self.upload(b'\0' * 200_000)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_declared_type_is_checked(self):
+        response = self.upload(png(), name='notes.txt', content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_magic_bytes_are_checked(self):
+        response = self.upload(b'<html>' + b'x' * 100)
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_truncated_image_is_rejected(self):
+        response = self.upload(png()[:40])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(MAX_MARKER_IMAGE_PIXELS=1000)
+    def test_pixel_count_is_checked_from_header(self):
+        response = self.upload(png((100, 100)))
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_json_create_is_unaffected(self):
+        response = self.client.post(self.url, {'name': 'Plain', 'lat': 1, 'lng': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_has_image_magic(self):
+        self.assertTrue(has_image_magic(png()[:12]))
+        self.assertTrue(has_image_magic(b'RIFF\0\0\0\0WEBP'))
+        self.assertFalse(has_image_magic(b'%PDF-1.7\n'))
+
+    def test_bulk_create_attaches_images(self):
+        markers = '[{"name": "With photo", "lat": 1, "lng": 2}, {"name": "Without", "lat": 3, "lng": 4}]'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('markers-bulk'), {
+                'markers': markers,
+                'image_0': SimpleUploadedFile('site.png', png(), content_type='image/png'),
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with_photo = Marker.objects.get(name='With photo')
+        self.assertTrue(os.path.exists(with_photo.image.path))
+        self.assertFalse(Marker.objects.get(name='Without').image)
+        self.assertTrue(with_photo.thumbnail)
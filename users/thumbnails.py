@@ -0,0 +1,111 @@
+"""
+Small variants of Marker.image for the map, generated off the request.
+
+After a marker with an image is committed, schedule_thumbnails() hands it to
+a thread pool that renders each variant in VARIANTS with Pillow and stores
+its path on the marker. Variants are re-encoded from the pixels only, so
+EXIF (camera, GPS position) is not carried over.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .generations import bump_generation, MARKER_IMAGES
+from .models import Marker
+from .tiles import invalidate_points
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> (model field, bounding box in pixels).
+VARIANTS = {
+    'thumb': ('thumbnail', (256, 256)),
+    'medium': ('medium', (1024, 1024)),
+}
+QUALITY = 80
+
+_executor = None
+
+
+def variant_format():
+    """'WEBP' by default; THUMBNAIL_FORMAT = 'JPEG' for clients without WebP."""
+    return getattr(settings, 'THUMBNAIL_FORMAT', 'WEBP').upper()
+
+
+def render_variant(image_file, size, image_format=None):
+    """Returns the encoded bytes of an image scaled down to fit `size`, without metadata."""
+    image_format = image_format or variant_format()
+    with Image.open(image_file) as image:
+        # Apply the EXIF orientation before the tag is dropped.
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def generate_thumbnails(marker_id):
+    """Renders and stores every variant of one marker. Returns False if there was nothing to do."""
+    marker = Marker.objects.filter(pk=marker_id).first()
+    if marker is None or not marker.image:
+        return False
+    extension = 'jpg' if variant_format() == 'JPEG' else variant_format().lower()
+    stem = os.path.splitext(os.path.basename(marker.image.name))[0]
+    with marker.image.open('rb') as image_file:
+        for variant, (field, size) in VARIANTS.items():
+            image_file.seek(0)
+            content = ContentFile(render_variant(image_file, size))
+            getattr(marker, field).save(f'{stem}_{variant}.{extension}', content, save=False)
+    Marker.objects.filter(pk=marker_id).update(
+        updated_at=timezone.now(),
+        **{field: getattr(marker, field).name for field, _ in VARIANTS.values()}
+    )
+    # Tiles and lists rendered before the variants existed have no thumbnail yet.
+    invalidate_points([(marker.lat, marker.lng)])
+    bump_generation(MARKER_IMAGES)
+    return True
+
+
+def workers():
+    return getattr(settings, 'THUMBNAIL_WORKERS', 2)
+
+
+def _run(marker_id):
+    try:
+        generate_thumbnails(marker_id)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Could not generate thumbnails for marker %s', marker_id)
+
+
+def _run_in_pool(marker_id):
+    try:
+        _run(marker_id)
+    finally:
+        # Pool threads keep their own connection; don't leave it open between jobs.
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor  # pylint: disable=global-statement
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers(), thread_name_prefix='thumbnails')
+    return _executor
+
+
+def schedule_thumbnails(marker_id):
+    """
+    Generates the variants once the current transaction commits: in the
+    worker's thread pool, or inline when THUMBNAIL_WORKERS is 0.
+    """
+    if workers():
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_pool, marker_id))
+    else:
+        transaction.on_commit(lambda: _run(marker_id))
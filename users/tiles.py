@@ -0,0 +1,93 @@
+"""
+Slippy-map (z/x/y, Web Mercator) marker tiles as compact GeoJSON.
+
+Rendered tiles are cached per tile, under a key holding the 'marker-tiles'
+generation and the generation of the tile's region (see regions.py).
+Writes bump the regions covering the written marker's position
+(invalidate_points); changes that touch the whole map bump
+'marker-tiles'. Nothing is deleted: the counters live in the database, so
+every worker, whatever its cache backend, stops reading the old keys, and
+a render that read the old rows can only store its tile under a key that
+is no longer used.
+"""
+import hashlib
+import json
+from django.core.cache import cache
+from .clusters import compute_clusters, CLUSTER_MAX_ZOOM
+from .generations import get_generations, bump_generation, bump_generations, MARKER_TILES
+from .models import Marker
+from .regions import point_regions, region_generation, tile_markers
+
+MAX_TILE_ZOOM = 20
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _tile_key(generation, region, z, x, y):
+    return f'marker-tile:{generation}:{region}:{z}/{x}/{y}'
+
+
+def _feature(lng, lat, properties, feature_id=None):
+    feature = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+               'properties': properties}
+    if feature_id is not None:
+        feature['id'] = feature_id
+    return feature
+
+
+def render_tile(z, x, y):
+    """GeoJSON bytes of a tile: clusters below CLUSTER_MAX_ZOOM, markers from there on."""
+    markers = tile_markers(z, x, y)
+    if z < CLUSTER_MAX_ZOOM:
+        features = [
+            _feature(cluster['lng'], cluster['lat'], {'count': cluster['count']})
+            for cluster in compute_clusters(z, markers)
+        ]
+    else:
+        storage = Marker._meta.get_field('image').storage
+        features = [
+            _feature(lng, lat, {
+                'name': name,
+                'image': storage.url(image) if image else None,
+                'thumbnail': storage.url(thumbnail) if thumbnail else None,
+            }, pk)
+            for pk, name, lat, lng, image, thumbnail
+            in markers.order_by('id').values_list('id', 'name', 'lat', 'lng', 'image', 'thumbnail')
+        ]
+    return json.dumps({'type': 'FeatureCollection', 'features': features},
+                      separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def get_tile(z, x, y):
+    """Returns (etag, body) of a tile, rendering it on a cache miss."""
+    # Read before the rows, so a tile rendered during a write is cached under the old generation.
+    region = region_generation(z, x, y)
+    generations = get_generations(MARKER_TILES, region)
+    key = _tile_key(generations[MARKER_TILES], generations[region], z, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        body = render_tile(z, x, y)
+        tile = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+        cache.set(key, tile, CACHE_TIMEOUT)
+    return tile
+
+
+def invalidate_points(points):
+    """
+    Bumps the regions covering each (lat, lng). Call it once the write has
+    committed; tiles above the first region zoom follow the 'markers'
+    generation, which the write bumps itself.
+    """
+    regions = set()
+    for lat, lng in points:
+        if lat is not None and lng is not None:
+            regions |= point_regions(lat, lng)
+    if regions:
+        bump_generations(regions)
+
+
+def invalidate_all():
+    bump_generation(MARKER_TILES)
@@ -0,0 +1,139 @@
+"""
+Streaming upload handler for Marker.image.
+
+The body is checked while it arrives instead of after it was buffered:
+Content-Length and the part's declared type before any byte is read, the
+magic bytes on the first chunk, the image header (format and pixel count)
+as soon as it is complete, and the running size on every chunk. A rejected
+upload stops parsing right away. Accepted bytes go chunk by chunk to a
+temporary file, which FileSystemStorage then moves into MEDIA_ROOT.
+"""
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler, SkipFile, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from PIL import Image, UnidentifiedImageError
+
+# `image`, or `image_<n>` for the n-th marker of a bulk upload.
+IMAGE_FIELD = re.compile(r'image(_\d+)?')
+IMAGE_WRITE_THREADS = 8
+CONTENT_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
+FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+# Room for the other form fields and the multipart framing.
+FORM_OVERHEAD = 64 * 1024
+# Bytes kept to parse the header (JPEG EXIF blocks can be large).
+MAX_HEADER_SIZE = 256 * 1024
+
+
+def max_image_size():
+    return getattr(settings, 'MAX_MARKER_IMAGE_SIZE', 10 * 1024 * 1024)
+
+
+def max_image_pixels():
+    return getattr(settings, 'MAX_MARKER_IMAGE_PIXELS', 40_000_000)
+
+
+def has_image_magic(head):
+    """True if the first bytes look like one of FORMATS."""
+    return (head.startswith((b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a'))
+            or (head[:4] == b'RIFF' and head[8:12] == b'WEBP'))
+
+
+def store_images(markers):
+    """
+    Writes the pending image of each marker to storage on a few threads, so
+    that bulk_create (which would write them one by one) finds them committed.
+    Returns the stored names, for cleanup if the insert fails.
+    """
+    def store(marker):
+        marker.image.save(marker.image.name, marker.image.file, save=False)
+        return marker.image.name
+
+    with_images = [
+        marker for marker in markers
+        if marker.image and not marker.image._committed  # pylint: disable=protected-access
+    ]
+    with ThreadPoolExecutor(max_workers=IMAGE_WRITE_THREADS) as executor:
+        return list(executor.map(store, with_images))
+
+
+class MarkerImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Accepts images in the `image` field (or `image_<n>`, up to `max_files`).
+    On rejection it sets request.upload_error to (message, status) and stops
+    the upload.
+    """
+
+    def __init__(self, request=None, max_files=1):
+        super().__init__(request)
+        self.max_files = max_files
+        self.head = b''
+        self.checked = False
+
+    def reject(self, message, status=400):
+        self.request.upload_error = (message, status)
+        # The parser closes (and so deletes) the temporary file.
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.upload_error = None
+        if content_length > max_image_size() * self.max_files + FORM_OVERHEAD:
+            self.request.upload_error = (f'Upload exceeds {max_image_size()} bytes.', 413)
+            # Parsed as empty without reading the body.
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        if not IMAGE_FIELD.fullmatch(field_name):
+            raise SkipFile()
+        if content_type not in CONTENT_TYPES:
+            self.reject(f'Unsupported image type {content_type!r}.', 415)
+        if content_length is not None and content_length > max_image_size():
+            self.reject(f'Image exceeds {max_image_size()} bytes.', 413)
+        self.head = b''
+        self.checked = False
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > max_image_size():
+            self.reject(f'Image exceeds {max_image_size()} bytes.', 413)
+        if not self.checked:
+            if start == 0 and len(raw_data) >= 12 and not has_image_magic(raw_data):
+                self.reject('File is not a JPEG, PNG, GIF or WebP image.', 415)
+            self.head += raw_data
+            self.check_header(final=False)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self, final):
+        """Opens the buffered head lazily (no pixels are decoded) once it holds the whole header."""
+        try:
+            with Image.open(io.BytesIO(self.head)) as image:
+                image_format, (width, height) = image.format, image.size
+        except Image.DecompressionBombError:
+            self.reject(f'Image is larger than {max_image_pixels()} pixels.', 413)
+        except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+            if final or len(self.head) >= MAX_HEADER_SIZE or not has_image_magic(self.head[:12]):
+                self.reject('File is not a valid image.')
+            return
+        if image_format not in FORMATS:
+            self.reject(f'Unsupported image format {image_format}.', 415)
+        if width * height > max_image_pixels():
+            self.reject(f'Image is larger than {max_image_pixels()} pixels.', 413)
+        self.checked = True
+        self.head = b''
+
+    def file_complete(self, file_size):
+        if not self.checked:
+            self.check_header(final=True)
+        uploaded = super().file_complete(file_size)
+        try:
+            # Walks the file structure without decoding pixels.
+            with Image.open(uploaded) as image:
+                image.verify()
+        except Exception:  # pylint: disable=broad-except
+            self.reject('File is not a valid image.')
+        uploaded.seek(0)
+        return uploaded
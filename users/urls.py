@@ -6,6 +6,7 @@ from .vote_api import(
 )
 from .map_api import MarkerView
 from .backup_api import BackupViewSet
+from .blacklist_api import BlacklistViewSet
 from .compromised_api import CompromisedViewSet
 from .invite_api import InviteViewSet
 from rest_framework.routers import DefaultRouter
@@ -22,6 +23,7 @@ router.register('votes', VoteViewSet, basename='vote')
 router.register('backup', BackupViewSet, basename='backup')
 router.register('compromised', CompromisedViewSet, basename='compromised')
 router.register('invites', InviteViewSet, basename='invite')
+router.register('blacklist', BlacklistViewSet, basename='blacklist')
 urlpatterns = [
     path('users/', UserListView.as_view(), name='user-list'),
     path('votes/nominate-ban/', NominateForBanView.as_view(), name='nominate-ban'),
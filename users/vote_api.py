@@ -16,6 +16,7 @@ from .models import Role, VoteType, Vote, UserVote, BlacklistedIP, CustomUser
 from .permissions import (
     IsInquisitor, CanNominateForBan, CanVoteOnThis, CanInitiatePromotion
 )
+from .fast_render import fast_fields, list_rows
 
 User = get_user_model()
 
@@ -30,6 +31,13 @@ class UserListView(generics.ListAPIView):
     def get_queryset(self):
         return User.objects.filter(is_active=True).exclude(id=self.request.user.id).order_by('username')
 
+    def list(self, request, *args, **kwargs):
+        fields = fast_fields(BasicUserSerializer, User)
+        if self.paginator is not None or fields is None:
+            return super().list(request, *args, **kwargs)
+        # Same data as the serializer, without per-field serializer calls.
+        return Response(list_rows(self.filter_queryset(self.get_queryset()), fields))
+
 
 class VoteViewSet(viewsets.ReadOnlyModelViewSet):
     """